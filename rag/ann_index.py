@@ -0,0 +1,150 @@
+# rag/ann_index.py
+# Configurable FAISS index backends for the RAG store. ingest_docs.py keeps the
+# exact (flat) store as the source of truth and, when index_config.json asks
+# for another type, builds a trained ANN index over the same vector ids. The
+# retriever swaps that index in at load time.
+import json
+import math
+import os
+import faiss
+import numpy as np
+
+DB_PATH = "rag/rag_db"
+SEARCH_PARAMS = ("nprobe", "ef_search")
+
+# Build-time and search-time defaults per index type
+INDEX_TYPES = {
+    "flat": {},
+    "ivf": {"nlist": 64, "nprobe": 8},
+    "hnsw": {"m": 32, "ef_construction": 80, "ef_search": 64},
+    "ivfpq": {"nlist": 64, "pq_m": 16, "nbits": 8, "nprobe": 8},
+    "sq8": {},
+}
+
+
+def ann_index_path(index_type, db_path=DB_PATH):
+    return os.path.join(db_path, f"index_{index_type}.faiss")
+
+
+def load_config(db_path=DB_PATH):
+    path = os.path.join(db_path, "index_config.json")
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            config = json.load(f)
+    else:
+        config = {"index_type": "flat", "params": {}}
+    index_type = config.get("index_type", "flat")
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"❌ Unknown index type '{index_type}'. Choose one of {sorted(INDEX_TYPES)}.")
+    config["params"] = {**INDEX_TYPES[index_type], **config.get("params", {})}
+    return config
+
+
+def save_config(config, db_path=DB_PATH):
+    path = os.path.join(db_path, "index_config.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(config, f, indent=2)
+
+
+def _effective_params(index_type, params, n, d):
+    # Small corpora cannot train large codebooks; shrink them instead of failing
+    params = {**INDEX_TYPES[index_type], **params}
+    if "nlist" in params:
+        params["nlist"] = max(1, min(int(params["nlist"]), n // 39 or 1))
+    if index_type == "ivfpq":
+        pq_m = int(params["pq_m"])
+        while d % pq_m:
+            pq_m -= 1
+        params["pq_m"] = pq_m
+        params["nbits"] = max(1, min(int(params["nbits"]), int(math.log2(max(n, 2)))))
+    return params
+
+
+def new_index(index_type, d, params):
+    if index_type == "flat":
+        return faiss.IndexFlatL2(d)
+    if index_type == "ivf":
+        return faiss.IndexIVFFlat(faiss.IndexFlatL2(d), d, params["nlist"])
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(d, params["m"])
+        index.hnsw.efConstruction = params["ef_construction"]
+        return index
+    if index_type == "ivfpq":
+        return faiss.IndexIVFPQ(faiss.IndexFlatL2(d), d, params["nlist"], params["pq_m"], params["nbits"])
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(d, faiss.ScalarQuantizer.QT_8bit)
+    raise ValueError(f"❌ Unknown index type '{index_type}'.")
+
+
+def apply_search_params(index, params):
+    if "nprobe" in params and hasattr(index, "nprobe"):
+        index.nprobe = int(params["nprobe"])
+    if "ef_search" in params and hasattr(index, "hnsw"):
+        index.hnsw.efSearch = int(params["ef_search"])
+    return index
+
+
+def build_index(vectors, index_type="flat", params=None, trained=None):
+    # Returns (index, effective_params). A previously trained index of the same
+    # shape is reset and refilled so its centroids/codebooks are reused.
+    vectors = np.ascontiguousarray(vectors, dtype="float32")
+    n, d = vectors.shape
+    params = _effective_params(index_type, params or {}, n, d)
+    if trained is not None and trained.d == d and trained.is_trained and index_type != "hnsw":
+        index = trained
+        index.reset()
+    else:
+        index = new_index(index_type, d, params)
+        if not index.is_trained:
+            index.train(vectors)
+    index.add(vectors)
+    return apply_search_params(index, params), params
+
+
+def flat_vectors(flat_index):
+    return flat_index.reconstruct_n(0, flat_index.ntotal)
+
+
+def _build_params(params):
+    return {k: v for k, v in (params or {}).items() if k not in SEARCH_PARAMS}
+
+
+def write_ann_index(flat_index, config, db_path=DB_PATH, retrain=False):
+    # Build/refresh the configured ANN index next to the flat store
+    index_type = config["index_type"]
+    if index_type == "flat" or flat_index.ntotal == 0:
+        return None
+    path = ann_index_path(index_type, db_path)
+    vectors = flat_vectors(flat_index)
+
+    trained = None
+    trained_on = config.get("trained_on", 0)
+    # Retrain when asked, when build parameters changed, or once the corpus has
+    # doubled since the last training
+    reuse = (
+        os.path.exists(path)
+        and not retrain
+        and config.get("trained_params") == _build_params(config.get("params"))
+        and flat_index.ntotal <= 2 * max(trained_on, 1)
+    )
+    if reuse:
+        trained = faiss.read_index(path)
+    index, params = build_index(vectors, index_type, config.get("params"), trained)
+    if trained is None:
+        config["trained_on"] = int(flat_index.ntotal)
+        config["trained_params"] = _build_params(config.get("params"))
+    config["effective_params"] = params
+    faiss.write_index(index, path)
+    save_config(config, db_path)
+    return path
+
+
+def load_ann_index(db_path=DB_PATH):
+    config = load_config(db_path)
+    if config["index_type"] == "flat":
+        return None
+    path = ann_index_path(config["index_type"], db_path)
+    if not os.path.exists(path):
+        return None
+    params = {**config.get("effective_params", {}), **config["params"]}
+    return apply_search_params(faiss.read_index(path), params)
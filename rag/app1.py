@@ -1,16 +1,23 @@
 import streamlit as st
+import altair as alt
+import pandas as pd
 import os
-import subprocess
 import json
+import uuid
 from datetime import datetime
-import sys
-from llama_cpp import Llama
+from generate_workflow import WorkflowGenerator, plan_workflow
+from chat_engine import ChatEngine
+from chat_memory import ConversationMemory
+from job_queue import FINISHED, JobQueue
+from clip_engine import tile_paths
 
 # Set folders
 UPLOAD_FOLDER = "rag/uploads"
 WORKFLOW_FOLDER = "rag/workflows"
 OUTPUT_FOLDER = "rag/outputs"
-COT_FILE = "rag/llm_response.txt"
+SAMPLE_WORKFLOW = "rag/workflows/sample_workflow.json"
+# Server folders of DEM tiles the app may read; relative paths are taken from here
+DEM_TILE_ROOT = os.path.realpath(os.environ.get("DEM_TILE_ROOT", UPLOAD_FOLDER))
 
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 os.makedirs(WORKFLOW_FOLDER, exist_ok=True)
@@ -19,11 +26,38 @@ os.makedirs(OUTPUT_FOLDER, exist_ok=True)
 st.set_page_config(page_title="Geospatial Reasoning Assistant", layout="wide")
 st.title("🌍 Geospatial Reasoning Assistant")
 
+# Load the workflow model once per server process, not once per click
+@st.cache_resource(show_spinner="🧠 Loading workflow model...")
+def get_workflow_generator():
+    return WorkflowGenerator()
+
+# Load the chatbot model once per server process and stream its answers
+@st.cache_resource(show_spinner="💬 Loading chatbot model...")
+def get_chat_engine():
+    return ChatEngine()
+
+# One job queue per server: runs from all sessions share its bounded worker pool
+@st.cache_resource
+def get_job_queue():
+    return JobQueue()
+
 # Initialize session state
 if "prompt_history" not in st.session_state:
     st.session_state.prompt_history = []
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+if "jobs" not in st.session_state:
+    st.session_state.jobs = []
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex[:8]
+# Each session edits its own workflow; the shared sample file is only read as the starting point
+if "workflow" not in st.session_state:
+    st.session_state.workflow = {"workflow": []}
+    if os.path.exists(SAMPLE_WORKFLOW):
+        with open(SAMPLE_WORKFLOW) as f:
+            st.session_state.workflow = json.load(f)
+if "reasoning" not in st.session_state:
+    st.session_state.reasoning = None
 
 # --- Mode Selector ---
 mode = st.radio("Choose Workflow Mode:", [
@@ -41,35 +75,70 @@ def_prompt_map = {
 }
 prompt = st.text_area("Enter task prompt:", placeholder=f"e.g., {def_prompt_map[mode]}")
 
-workflow_script = "rag/generate_workflow.py"
 executor_script = {
     "Flood-Prone Zone Identification": "rag/flood_executor.py",
     "Site Suitability Analysis": "rag/site_executor.py",
     "Land Use / Land Cover (LULC) Classification": "rag/lulc_executor.py"
 }[mode]
 
+map_image = {
+    "Flood-Prone Zone Identification": "flood_risk_map.png",
+    "Site Suitability Analysis": "site_suitability_map.png",
+    "Land Use / Land Cover (LULC) Classification": "lulc_map.png"
+}
+
+
+def submit_job(env=None):
+    # The job runs on a snapshot of this session's workflow with its own output folder
+    job_id = get_job_queue().submit(mode, executor_script, workflow=st.session_state.workflow, env=env)
+    st.session_state.jobs.append(job_id)
+    st.success(f"🚀 Submitted job {job_id}. Progress is shown below.")
+
 # --- Generate Workflow JSON ---
-if st.button("Generate Workflow JSON using LLM"):
-    with st.spinner("🔧 Generating workflow from LLM..."):
-        result = subprocess.run([sys.executable, workflow_script, prompt], capture_output=True, text=True)
+# Prompts matching the flood/site/LULC templates are planned without the LLM;
+# the model is only loaded (once per server) for prompts the planner can't handle
+intent_hint = {
+    "Flood-Prone Zone Identification": "flood",
+    "Site Suitability Analysis": "site",
+    "Land Use / Land Cover (LULC) Classification": "lulc"
+}[mode]
+
+if st.button("Generate Workflow JSON"):
+    with st.spinner("🔧 Generating workflow..."):
+        try:
+            workflow, reasoning, stats = plan_workflow(prompt, get_model=get_workflow_generator, hint=intent_hint)
+            st.session_state.workflow, st.session_state.reasoning = workflow, reasoning.strip()
+            error = None
+        except Exception as e:
+            error = str(e)
 
-        if result.returncode == 0:
+        if error is None:
             st.success("✅ Workflow JSON generated.")
+            if stats["source"] == "template":
+                st.caption(
+                    f"⚡ Planned from the {stats['intent']} template ({stats['match']}) for {stats['location']} "
+                    f"in {stats['seconds'] * 1000:.1f} ms, no LLM call"
+                )
+            elif stats["source"] == "cache":
+                st.caption(f"♻️ Reused the cached LLM workflow for this prompt ({stats['reason']})")
+            else:
+                st.caption(
+                    f"🧠 LLM fallback ({stats['reason']}) | "
+                    f"⏱️ Model load: {stats['load_seconds']}s (once per server) | "
+                    f"First token: {stats['first_token_seconds']}s | Total: {stats['total_seconds']}s | "
+                    f"System prompt: {stats['prefix_source']} ({stats['prefix_tokens']} tokens), task: {stats['task_tokens']} tokens"
+                )
             st.session_state.prompt_history.append(prompt)
 
-            with open("rag/workflows/sample_workflow.json") as f:
-                workflow = json.load(f)
             st.json(workflow)
 
-            if os.path.exists(COT_FILE):
-                with open(COT_FILE, "r", encoding="utf-8") as f:
-                    cot_text = f.read()
+            if st.session_state.reasoning:
                 st.header("🧠 Chain-of-Thought Reasoning")
-                st.code(cot_text, language="markdown")
+                st.code(st.session_state.reasoning, language="markdown")
 
         else:
             st.error("❌ Workflow generation failed.")
-            st.text(result.stderr)
+            st.text(error)
 
 # --- Prompt History Sidebar ---
 if st.session_state.prompt_history:
@@ -84,28 +153,28 @@ user_input = st.sidebar.text_input("Ask me anything:")
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
+answered_now = False
 if user_input:
-    # Prepare conversation context
-    context = "\n".join([f"User: {q}\nAI: {a}" for q, a in st.session_state.chat_history])
-    combined_prompt = f"{context}\nUser: {user_input}"
-
-    # Call external chatbot script
-    chatbot_script = "rag/chatbot_response.py"
-    result = subprocess.run(
-        [sys.executable, chatbot_script, combined_prompt],
-        capture_output=True,
-        text=True
-    )
-
-    if result.returncode == 0:
-        response = result.stdout.strip()
+    st.sidebar.markdown(f"**You:** {user_input}")
+    st.sidebar.markdown("**Assistant:**")
+    try:
+        engine = get_chat_engine()
+        # Bounded context: recent turns plus a running summary of older ones
+        if "chat_memory" not in st.session_state:
+            st.session_state.chat_memory = ConversationMemory(engine.count_tokens, engine.summarize)
+        memory = st.session_state.chat_memory
+        response = st.sidebar.write_stream(engine.stream(engine.build_prompt(user_input, memory.context())))
+        response = (response if isinstance(response, str) else "".join(response)).strip()
         st.session_state.chat_history.append((user_input, response))
-    else:
+        memory.add_turn(user_input, response)
+        answered_now = True
+    except Exception as e:
         response = "⚠️ Failed to generate response."
-        st.error(result.stderr)
+        st.sidebar.error(str(e))
 
-# Display previous messages
-for q, a in reversed(st.session_state.chat_history):
+# Display previous messages (the answer streamed above is already shown)
+shown_history = st.session_state.chat_history[:-1] if answered_now else st.session_state.chat_history
+for q, a in reversed(shown_history):
     st.sidebar.markdown(f"**You:** {q}")
     st.sidebar.markdown(f"**Assistant:** {a}")
 
@@ -115,16 +184,12 @@ if mode in ["Site Suitability Analysis", "Flood-Prone Zone Identification"]:
     st.header("Step 2: Enter Location for GeoJSON Boundary")
     location_input = st.text_input("Enter location name (e.g., Vellore or Goa):")
     if location_input:
-        with open("rag/workflows/sample_workflow.json") as f:
-            workflow = json.load(f)
-        for step in workflow.get("workflow", []):
+        for step in st.session_state.workflow.get("workflow", []):
             if "task" in step:
                 if mode == "Site Suitability Analysis":
                     step["task"] = f"site suitability for {location_input}"
                 elif mode == "Flood-Prone Zone Identification":
                     step["task"] = f"flood-prone analysis for {location_input}"
-        with open("rag/workflows/sample_workflow.json", "w") as f:
-            json.dump(workflow, f, indent=2)
         st.success(f"📍 Location updated in workflow: {location_input}")
 
 # --- Upload JP2 for LULC ---
@@ -132,11 +197,14 @@ if mode == "Land Use / Land Cover (LULC) Classification":
     st.header("Step 3: Upload Sentinel-2 Bands (JP2 format)")
     uploaded_files = st.file_uploader("Upload bands B02, B03, B04, B08", type=["jp2"], accept_multiple_files=True)
 
+    # Bands go to a folder of this session so concurrent users don't mix them up
+    band_dir = os.path.join(UPLOAD_FOLDER, f"session_{st.session_state.session_id}")
+    os.makedirs(band_dir, exist_ok=True)
     band_map = {"B02": None, "B03": None, "B04": None, "B08": None}
     for file in uploaded_files:
         for band in band_map:
             if band in file.name:
-                save_path = os.path.join(UPLOAD_FOLDER, file.name)
+                save_path = os.path.join(band_dir, file.name)
                 with open(save_path, "wb") as f:
                     f.write(file.read())
                 band_map[band] = save_path
@@ -144,90 +212,165 @@ if mode == "Land Use / Land Cover (LULC) Classification":
     if all(band_map.values()):
         st.success("✅ All required bands uploaded.")
         if st.button("Run Workflow"):
-            with st.spinner("⏳ Executing Workflow..."):
-                result = subprocess.run([sys.executable, executor_script], capture_output=True, text=True)
-                if result.returncode == 0:
-                    st.success("✅ Workflow executed successfully!")
-                    st.text(result.stdout)
-
-                    st.header("🗺️ Output Map")
-                    map_img = os.path.join("rag", "outputs", "lulc_map.png")
-                    if os.path.exists(map_img):
-                        st.image(map_img, caption="LULC Classification", use_container_width=True)
-                        with open(map_img, "rb") as f:
-                            st.download_button("📥 Download Map Image", f, file_name="lulc_map.png")
-
-                    st.header("📊 Output Raster Files")
-                    for file in os.listdir(OUTPUT_FOLDER):
-                        if file.endswith(".tif"):
-                            st.markdown(f"📄 {file}")
-
-                    if os.path.exists(COT_FILE):
-                        with open(COT_FILE, "r", encoding="utf-8") as f:
-                            cot_text = f.read()
-                        st.header("🧠 Chain-of-Thought Reasoning")
-                        st.code(cot_text, language="markdown")
-                else:
-                    st.error("❌ Workflow execution failed.")
-                    st.text(result.stderr)
+            submit_job(env={"RAG_UPLOAD_DIR": band_dir})
     else:
         st.warning("Please upload all required bands.")
 
 # --- Upload DEM for Flood/Suitability ---
 else:
-    st.header("Step 3: Upload your DEM (.tif) file")
-    tif_file = st.file_uploader("Upload a DEM GeoTIFF file", type=["tif", "tiff"])
-
-    if tif_file:
+    st.header("Step 3: Upload your DEM (.tif) file or tiles")
+    tif_files = st.file_uploader("Upload a DEM GeoTIFF, or several DEM tiles (SRTM/Copernicus) covering the area",
+                                 type=["tif", "tiff", "hgt"], accept_multiple_files=True)
+    tile_folder = st.text_input(f"…or the path of a folder of DEM tiles on the server (under {DEM_TILE_ROOT})")
+
+    # Tiles are never merged: the clip step reads them through a virtual mosaic
+    uploaded_path = None
+    if tif_files:
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        uploaded_path = os.path.join(UPLOAD_FOLDER, f"input_{timestamp}.tif")
-        with open(uploaded_path, "wb") as f:
-            f.write(tif_file.read())
+        if len(tif_files) == 1:
+            extension = os.path.splitext(tif_files[0].name)[1].lower()
+            uploaded_path = os.path.join(UPLOAD_FOLDER, f"input_{timestamp}{extension}")
+            with open(uploaded_path, "wb") as f:
+                f.write(tif_files[0].read())
+        else:
+            uploaded_path = os.path.join(UPLOAD_FOLDER, f"tiles_{timestamp}")
+            os.makedirs(uploaded_path, exist_ok=True)
+            for tile in tif_files:
+                with open(os.path.join(uploaded_path, os.path.basename(tile.name)), "wb") as f:
+                    f.write(tile.read())
         st.success(f"Uploaded: {uploaded_path}")
-
-        with open("rag/workflows/sample_workflow.json") as f:
-            workflow = json.load(f)
-        for step in workflow.get("workflow", []):
-            if "args" in step and "input_file" in step["args"]:
-                step["args"]["input_file"] = uploaded_path
-        with open("rag/workflows/sample_workflow.json", "w") as f:
-            json.dump(workflow, f, indent=2)
+    elif tile_folder:
+        # Only folders inside DEM_TILE_ROOT (symlinks resolved), not anything the server can read
+        tile_folder = os.path.realpath(os.path.join(DEM_TILE_ROOT, tile_folder.strip()))
+        if os.path.commonpath([tile_folder, DEM_TILE_ROOT]) != DEM_TILE_ROOT:
+            st.error(f"❌ DEM tile folders must be inside {DEM_TILE_ROOT} (set DEM_TILE_ROOT).")
+        elif os.path.isdir(tile_folder) and tile_paths(tile_folder):
+            uploaded_path = tile_folder
+            st.success(f"Using {len(tile_paths(tile_folder))} DEM tiles from: {tile_folder}")
+        else:
+            st.error("❌ No .tif/.hgt DEM tiles found in that folder.")
+
+    if uploaded_path:
+        # Only inputs that no earlier step produces point at the upload, so chained steps keep their inputs
+        produced = set()
+        for step in st.session_state.workflow.get("workflow", []):
+            args = step.get("args", {})
+            if "input_file" in args and os.path.basename(str(args["input_file"])) not in produced:
+                args["input_file"] = uploaded_path
+            if "output_file" in args:
+                produced.add(os.path.basename(str(args["output_file"])))
         st.info("🔁 Updated workflow to use uploaded file.")
 
         if st.button("Run Workflow"):
-            with st.spinner("⏳ Executing Workflow..."):
-                result = subprocess.run([sys.executable, executor_script], capture_output=True, text=True)
-                if result.returncode == 0:
-                    st.success("✅ Workflow executed successfully!")
-                    st.text(result.stdout)
-
-                    st.header("🗺️ Output Map")
-                    map_img = (
-                        os.path.join("rag", "outputs", "flood_risk_map.png")
-                        if mode == "Flood-Prone Zone Identification"
-                        else os.path.join("rag", "outputs", "site_suitability_map.png")
-                    )
-                    if os.path.exists(map_img):
-                        st.image(map_img, caption=os.path.basename(map_img).replace("_", " ").title(), use_container_width=True)
-                        with open(map_img, "rb") as f:
-                            st.download_button("📥 Download Map Image", f, file_name=os.path.basename(map_img))
-                    else:
-                        st.warning("⚠️ Map image not generated.")
-
-                    st.header("📊 Output Raster Files")
-                    for file in os.listdir(OUTPUT_FOLDER):
-                        if file.endswith(".tif"):
-                            st.markdown(f"📄 {file}")
-
-                    with open("rag/workflows/sample_workflow.json") as f:
-                        st.header("🧠 Executed JSON Workflow")
-                        st.json(json.load(f))
-
-                    if os.path.exists(COT_FILE):
-                        with open(COT_FILE, "r", encoding="utf-8") as f:
-                            cot_text = f.read()
-                        st.header("🧠 Chain-of-Thought Reasoning")
-                        st.code(cot_text, language="markdown")
-                else:
-                    st.error("❌ Workflow execution failed.")
-                    st.text(result.stderr)
+            submit_job()
+
+
+# --- Jobs of this session ---
+JOB_ICONS = {"queued": "🕒", "running": "⏳", "succeeded": "✅", "failed": "❌", "cancelled": "🛑"}
+
+
+def show_waterfall(trace_path, job_id):
+    # Per-step timing waterfall from the job's Chrome trace (rag/tracing.py)
+    with open(trace_path) as f:
+        events = [e for e in json.load(f)["traceEvents"] if e.get("ph") == "X"]
+    if not events:
+        return
+    rows = []
+    for e in sorted(events, key=lambda e: e["ts"]):
+        args = e.get("args", {})
+        rows.append({
+            "step": e["name"] if e["cat"] == "step" else f"  ↳ {e['name']}",
+            "kind": "error" if "error" in args else e["cat"],
+            "start (s)": e["ts"] / 1e6,
+            "end (s)": (e["ts"] + e["dur"]) / 1e6,
+            "seconds": round(e["dur"] / 1e6, 3),
+            "CPU (s)": args.get("process_cpu_s"),
+            "peak RSS (MiB)": args.get("peak_rss_mb"),
+            "read (MiB)": round(args.get("read_bytes", 0) / 2**20, 1),
+            "written (MiB)": round(args.get("write_bytes", 0) / 2**20, 1),
+            "rasters": ", ".join(f"{k} {v}" for k, v in args.get("rasters", {}).items()),
+        })
+    table = pd.DataFrame(rows)
+    chart = alt.Chart(table).mark_bar().encode(
+        x=alt.X("start (s):Q", title="seconds since start"),
+        x2="end (s):Q",
+        y=alt.Y("step:N", sort=list(table["step"]), title=None),
+        color=alt.Color("kind:N", scale=alt.Scale(domain=["step", "span", "error"], range=["#4c78a8", "#9ecae9", "#e45756"]),
+                        legend=None),
+        tooltip=list(table.columns),
+    ).properties(height=28 * len(table) + 40)
+    st.markdown("**⏱️ Step timings**")
+    st.altair_chart(chart, use_container_width=True)
+    with open(trace_path, "rb") as f:
+        st.download_button("📥 Download trace (chrome://tracing, Perfetto)", f, file_name="trace.json",
+                           key=f"trace_{job_id}")
+
+
+def show_job(queue, job_id, expanded):
+    job = queue.status(job_id)
+    progress = queue.progress(job_id)
+    paths = queue.paths(job_id)
+    with st.expander(f"{JOB_ICONS.get(job['status'], '')} {job['kind']} · {job_id} · {job['status']}", expanded=expanded):
+        total = len(progress["steps"])
+        if total:
+            done = len(progress["done"])
+            running = ", ".join(progress["running"])
+            st.progress(done / total, text=f"{done}/{total} steps" + (f" · running: {running}" if running else ""))
+        for step, seconds in progress["done"].items():
+            st.markdown(f"✅ {step} — {seconds:.2f}s")
+        for step, error in progress["failed"].items():
+            st.markdown(f"❌ {step} — {error}")
+
+        if job["status"] in ("queued", "running"):
+            if st.button("🛑 Cancel", key=f"cancel_{job_id}"):
+                queue.cancel(job_id)
+        elif job["status"] == "succeeded":
+            map_img = os.path.join(paths["outputs"], map_image.get(job["kind"], ""))
+            if os.path.isfile(map_img):
+                st.image(map_img, caption=os.path.basename(map_img).replace("_", " ").title(), use_container_width=True)
+                with open(map_img, "rb") as f:
+                    st.download_button("📥 Download Map Image", f, file_name=os.path.basename(map_img), key=f"map_{job_id}")
+            else:
+                st.warning("⚠️ Map image not generated.")
+
+            st.markdown("**📊 Output Raster Files**")
+            for file in sorted(os.listdir(paths["outputs"])):
+                if file.endswith(".tif"):
+                    st.markdown(f"📄 {os.path.join(paths['outputs'], file)}")
+
+            if os.path.exists(paths["workflow"]):
+                with open(paths["workflow"]) as f:
+                    st.markdown("**🧠 Executed JSON Workflow**")
+                    st.json(json.load(f), expanded=False)
+        elif job["status"] == "failed":
+            st.error("❌ Workflow execution failed.")
+
+        if job["status"] in FINISHED and os.path.exists(paths["trace"]):
+            show_waterfall(paths["trace"], job_id)
+
+        log = queue.log(job_id)
+        if log:
+            st.text_area("Log", log, height=200, key=f"log_{job_id}")
+
+
+# Polls job status every 2 s without re-running the rest of the page
+@st.fragment(run_every=2)
+def jobs_panel():
+    if not st.session_state.jobs:
+        return
+    queue = get_job_queue()
+    st.header("📋 Jobs")
+    for job_id in reversed(st.session_state.jobs):
+        try:
+            queue.status(job_id)
+        except KeyError:
+            st.caption(f"🧹 Job {job_id} was removed by the job retention settings.")
+            continue
+        show_job(queue, job_id, expanded=job_id == st.session_state.jobs[-1])
+
+
+jobs_panel()
+
+if st.session_state.reasoning and st.session_state.jobs:
+    st.header("🧠 Chain-of-Thought Reasoning")
+    st.code(st.session_state.reasoning, language="markdown")
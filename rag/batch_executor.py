@@ -0,0 +1,252 @@
+# rag/batch_executor.py
+# Batch mode for flood risk and site suitability over many regions (a list of
+# places or a polygon layer). The DEM is clipped once to the union of all
+# regions and the expensive derivatives (filled DEM -> flow accumulation, slope)
+# are computed once over that extent as shared COGs; each region is then
+# clipped from those and classified on a process pool. Outputs go to
+# <output-dir>/<region>/ plus summary.csv / summary.geojson with per-class areas.
+# Flow accumulation over the union includes inflow from neighbouring regions,
+# unlike separate single-region runs.
+#   python rag/batch_executor.py --dem rag/uploads/dem.tif --places "Kochi, India" "Thrissur, India"
+#   python rag/batch_executor.py --dem rag/uploads/dem.tif --regions districts.geojson --name-field DISTRICT
+import argparse
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+from shapely.ops import unary_union
+from boundary_store import download_boundary
+from clip_engine import NoOverlapError, clip_to_array
+from cog import write_cog
+import hydrology
+from preview import PALETTES, render_preview
+from raster_handle import RasterHandle, StepResults
+from reclassify import flood_risk_classifier, site_suitability
+from step_cache import cached, digest_geometries
+from streaming_quantile import LogQuantileSketch
+from terrain import cell_size_metres, slope_degrees
+from workflow_engine import Step, execute, print_timings
+
+OUTPUT_DIR = os.path.join(os.environ.get("RAG_OUTPUT_DIR", "rag/outputs"), "batch")
+WORKERS = int(os.environ.get("BATCH_WORKERS", os.cpu_count() or 4))
+ANALYSES = ("flood", "site")
+
+DEM = "dem.tif"
+FILLED = "filled_dem.tif"
+FLOW = "flow_accum.tif"
+SLOPE = "slope.tif"
+
+
+def load_regions(places=None, layer=None, name_field=None):
+    # GeoDataFrame with one (dissolved) polygon per region and a "region" name column
+    if layer:
+        regions = gpd.read_file(layer)
+        if name_field is None:
+            name_field = next((f for f in ("name", "NAME", "Name") if f in regions.columns), None)
+        names = regions[name_field].astype(str) if name_field else [f"region_{i + 1}" for i in range(len(regions))]
+        regions = gpd.GeoDataFrame({"region": list(names)}, geometry=list(regions.geometry), crs=regions.crs)
+    else:
+        # One at a time: the geocoder is rate limited, cached places are instant
+        frames = []
+        for place in places:
+            gdf, _ = download_boundary(place)
+            frames.append(gpd.GeoDataFrame({"region": [place]}, geometry=[unary_union(list(gdf.geometry))], crs=gdf.crs))
+        regions = pd.concat([f.to_crs(frames[0].crs) for f in frames], ignore_index=True)
+    if regions.empty:
+        raise ValueError("❌ No regions given.")
+    return regions
+
+
+def region_folders(names):
+    # File-system safe, unique folder name per region
+    folders, seen = [], {}
+    for name in names:
+        slug = re.sub(r"[^a-z0-9]+", "_", name.lower()).strip("_") or "region"
+        seen[slug] = seen.get(slug, 0) + 1
+        folders.append(slug if seen[slug] == 1 else f"{slug}_{seen[slug]}")
+    return folders
+
+
+def class_areas(classes, valid, profile, kind, prefix):
+    # Area (km²) and share (%) of each class over the region's valid cells
+    size_x, size_y = cell_size_metres(profile)
+    cell_km2 = size_x * size_y / 1e6
+    total = int(valid.sum())
+    row = {}
+    for value, (_, label) in PALETTES[kind]["classes"].items():
+        count = int(np.count_nonzero(classes[valid] == value))
+        key = f"{prefix}_{label.lower().replace('/', '_').replace(' ', '_').replace('-', '_')}"
+        row[f"{key}_km2"] = round(count * cell_km2, 3)
+        row[f"{key}_pct"] = round(100 * count / total, 2) if total else 0.0
+    return row
+
+
+def process_region(name, folder, boundary, shared, analyses):
+    # Runs in a pool worker: clip the shared rasters to one region and classify
+    start = time.perf_counter()
+    os.makedirs(folder, exist_ok=True)
+    row = {"region": name, "folder": folder, "status": "ok"}
+    try:
+        if "flood" in analyses:
+            flow, profile = clip_to_array(shared[FLOW], boundary)
+            flow = flow[0]
+            valid = flow != profile["nodata"]
+            row["area_km2"] = round(valid.sum() * np.prod(cell_size_metres(profile)) / 1e6, 3)
+            # Same thresholds as a single-region run: quantiles of the region's own flow
+            sketch = LogQuantileSketch()
+            sketch.update(flow[valid])
+            low, medium, high = sketch.quantiles([0.70, 0.85, 0.95])
+            risk = flood_risk_classifier(low, medium, high)(flow)
+            write_cog(os.path.join(folder, "flood_risk_levels.tif"), risk, dict(profile, dtype="uint8", nodata=0))
+            render_preview(risk, "flood", os.path.join(folder, "flood_risk_map.png"))
+            row.update(flow_thresholds=f"{low:.1f}/{medium:.1f}/{high:.1f}")
+            row.update(class_areas(risk, valid, profile, "flood", "flood"))
+
+        if "site" in analyses:
+            elevation, profile = clip_to_array(shared[DEM], boundary)
+            slope, slope_profile = clip_to_array(shared[SLOPE], boundary)
+            elevation, slope = elevation[0], slope[0]
+            valid = (elevation != profile["nodata"]) & (slope != slope_profile["nodata"]) & np.isfinite(slope)
+            suitability = site_suitability(elevation, slope)
+            suitability[~valid] = 0
+            write_cog(os.path.join(folder, "site_suitability.tif"), suitability, dict(profile, dtype="uint8", nodata=0))
+            render_preview(suitability, "site", os.path.join(folder, "site_suitability_map.png"))
+            row.setdefault("area_km2", round(valid.sum() * np.prod(cell_size_metres(profile)) / 1e6, 3))
+            row["mean_slope_deg"] = round(float(slope[valid].mean()), 2) if valid.any() else None
+            row.update(class_areas(suitability, valid, profile, "site", "site"))
+    except NoOverlapError:
+        row["status"] = "no overlap with DEM"
+        if not os.listdir(folder):
+            os.rmdir(folder)
+    except Exception as e:
+        # Anything else is a real failure: recorded with its message, folder kept for inspection
+        row["status"] = f"error: {type(e).__name__}: {e}"
+    row["seconds"] = round(time.perf_counter() - start, 2)
+    return row
+
+
+def run_batch(dem_path, regions, analyses=ANALYSES, engine="whitebox", output_dir=OUTPUT_DIR, workers=WORKERS):
+    analyses = [a for a in ANALYSES if a in analyses]
+    output_dir = os.path.abspath(output_dir)
+    shared_dir = os.path.join(output_dir, "shared")
+    os.makedirs(shared_dir, exist_ok=True)
+    print(f"\n📍 {len(regions)} regions, 📄 DEM: {dem_path}, analyses: {', '.join(analyses)}")
+    wbt = None
+    if engine == "whitebox":
+        from whitebox.whitebox_tools import WhiteboxTools
+
+        wbt = WhiteboxTools()
+        wbt.set_working_dir(shared_dir)
+    summary = []
+
+    def clip_union():
+        print("🔍 Clipping DEM to the union of all regions...")
+        union = gpd.GeoDataFrame(geometry=[unary_union(list(regions.geometry))], crs=regions.crs)
+        try:
+            results.put_clip(DEM, dem_path, union)
+        except ValueError:
+            raise ValueError("❌ The DEM does not overlap with any of the regions.")
+
+    def fill():
+        if engine == "numpy":
+            array, profile = results.get(DEM).read()
+            dem, valid = hydrology.dem_from_array(array, profile.get("nodata"))
+            results.put(RasterHandle(FILLED, hydrology.fill_depressions(dem, valid), profile), dtype="float32")
+        else:
+            wbt.fill_depressions(results.file_for(DEM), results.target_path(FILLED))
+            results.put(RasterHandle(FILLED, path=results.target_path(FILLED)))
+
+    def flow_accumulation():
+        if engine == "numpy":
+            array, profile = results.get(FILLED).read()
+            dem, valid = hydrology.dem_from_array(array, profile.get("nodata"))
+            transform = profile["transform"]
+            pointer = hydrology.d8_pointer(dem, valid, (transform.a, transform.e))
+            flow = hydrology.d8_flow_accumulation(pointer, valid)
+            results.put(RasterHandle(FLOW, flow, profile), dtype="float32", nodata=hydrology.FLOW_NODATA)
+        else:
+            filled = results.file_for(FILLED)
+            wbt.d8_pointer(filled, results.scratch_path("flow_direction.tif"))
+            wbt.run_tool("D8FlowAccumulation", [f"--dem={filled}", f"--output={results.target_path(FLOW)}",
+                                                "--out_type=cells"])
+            results.put(RasterHandle(FLOW, path=results.target_path(FLOW)))
+
+    def slope():
+        if engine == "numpy":
+            array, profile = results.get(DEM).read()
+            dem, valid = hydrology.dem_from_array(array, profile.get("nodata"))
+            results.put(RasterHandle(SLOPE, slope_degrees(dem, valid, cell_size_metres(profile)), profile),
+                        dtype="float32", nodata=-32768.0)
+        else:
+            wbt.slope(dem=results.file_for(DEM), output=results.target_path(SLOPE), units="degrees")
+            results.put(RasterHandle(SLOPE, path=results.target_path(SLOPE)))
+
+    def classify_regions(inputs):
+        # Each region is independent: clip + classify + render on a process pool
+        shared = {name: results.get(name).path for name in inputs}
+        folders = [os.path.join(output_dir, f) for f in region_folders(regions["region"])]
+        print(f"🧩 Classifying {len(regions)} regions on {workers} processes...")
+        with ProcessPoolExecutor(max_workers=max(1, workers)) as pool:
+            futures = [pool.submit(process_region, name, folder, regions.iloc[[i]], shared, analyses)
+                       for i, (name, folder) in enumerate(zip(regions["region"], folders))]
+            for future in futures:
+                row = future.result()
+                print(f"  {'✅' if row['status'] == 'ok' else '⚠️'} {row['region']}: {row['status']} ({row['seconds']:.1f}s)")
+                summary.append(row)
+
+    # Shared rasters are written to <output-dir>/shared for the pool workers and
+    # memoized by content like the single-region executors (rag/step_cache.py)
+    with StepResults(shared_dir) as results:
+        results.digests["regions"] = digest_geometries(regions)
+        steps = [Step("Clip DEM to union", cached(results, {"step": "clip"}, [dem_path, "regions"], [DEM], clip_union),
+                      inputs=[dem_path], outputs=[DEM])]
+        region_inputs = []
+        if "flood" in analyses:
+            steps += [
+                Step("Fill depressions", cached(results, {"step": "fill", "engine": engine}, [DEM], [FILLED], fill),
+                     inputs=[DEM], outputs=[FILLED]),
+                Step("Flow accumulation",
+                     cached(results, {"step": "flow_accumulation", "engine": engine}, [FILLED], [FLOW], flow_accumulation),
+                     inputs=[FILLED], outputs=[FLOW]),
+            ]
+            region_inputs.append(FLOW)
+        if "site" in analyses:
+            steps.append(Step("Slope", cached(results, {"step": "slope", "engine": engine}, [DEM], [SLOPE], slope),
+                              inputs=[DEM], outputs=[SLOPE]))
+            region_inputs += [DEM, SLOPE]
+        steps.append(Step("Classify regions", lambda: classify_regions(region_inputs), inputs=region_inputs))
+        print_timings(execute(steps))
+
+    table = pd.DataFrame(summary)
+    table.to_csv(os.path.join(output_dir, "summary.csv"), index=False)
+    gpd.GeoDataFrame(table, geometry=list(regions.geometry), crs=regions.crs).to_file(
+        os.path.join(output_dir, "summary.geojson"), driver="GeoJSON")
+    print(f"\n📊 Summary saved to: {os.path.join(output_dir, 'summary.csv')}")
+    return table
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Flood risk / site suitability for many regions from one DEM")
+    parser.add_argument("--dem", required=True, help="DEM file or folder of DEM tiles")
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument("--places", nargs="+", help="Place names, looked up like the single-region executors")
+    group.add_argument("--regions", help="Polygon layer (GeoJSON, GeoPackage, Shapefile), one region per feature")
+    parser.add_argument("--name-field", help="Attribute with the region names (default: name)")
+    parser.add_argument("--analysis", nargs="+", default=list(ANALYSES), choices=list(ANALYSES))
+    parser.add_argument("--engine", default="whitebox", choices=["whitebox", "numpy"],
+                        help="numpy: in-process small-DEM fallback (no WhiteboxTools binary), slower on large DEMs")
+    parser.add_argument("--output-dir", default=OUTPUT_DIR)
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    args = parser.parse_args()
+
+    regions = load_regions(args.places, args.regions, args.name_field)
+    table = run_batch(args.dem, regions, args.analysis, args.engine, args.output_dir, args.workers)
+    columns = [c for c in ("region", "status", "area_km2", "flood_high_pct", "site_very_high_pct", "seconds")
+               if c in table.columns]
+    print(table[columns].to_string(index=False))
+    if table["status"].str.startswith("error").any():
+        sys.exit(1)
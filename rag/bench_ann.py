@@ -0,0 +1,76 @@
+# rag/bench_ann.py
+# Recall-vs-latency benchmark of the configurable index types against the flat
+# baseline, using the vectors already stored in rag/rag_db.
+#   python rag/bench_ann.py [--k 5] [--queries 200] [--json results.json]
+import argparse
+import json
+import time
+import faiss
+import numpy as np
+from ann_index import DB_PATH, INDEX_TYPES, build_index, flat_vectors
+
+
+def load_corpus(db_path=DB_PATH):
+    return flat_vectors(faiss.read_index(f"{db_path}/index.faiss"))
+
+
+def make_queries(vectors, n_queries, noise=0.05, seed=0):
+    # Perturbed corpus vectors stand in for user questions about the same docs
+    rng = np.random.default_rng(seed)
+    picks = vectors[rng.integers(0, len(vectors), n_queries)]
+    scale = noise * np.linalg.norm(picks, axis=1, keepdims=True) / np.sqrt(vectors.shape[1])
+    return (picks + rng.normal(size=picks.shape) * scale).astype("float32")
+
+
+def recall_at_k(found, truth):
+    hits = sum(len(set(f[f >= 0]) & set(t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+def run(k=5, n_queries=200, param_overrides=None):
+    vectors = load_corpus()
+    queries = make_queries(vectors, n_queries)
+    k = min(k, len(vectors))
+
+    results = []
+    truth = None
+    for index_type in INDEX_TYPES:
+        params = {**INDEX_TYPES[index_type], **(param_overrides or {}).get(index_type, {})}
+        start = time.perf_counter()
+        index, effective = build_index(vectors, index_type, params)
+        build_seconds = time.perf_counter() - start
+
+        index.search(queries[:1], k)  # warm-up
+        start = time.perf_counter()
+        _, found = index.search(queries, k)
+        search_seconds = time.perf_counter() - start
+        if truth is None:
+            truth = found  # flat runs first and is exact
+
+        results.append({
+            "index_type": index_type,
+            "params": effective,
+            "recall_at_k": round(recall_at_k(found, truth), 4),
+            "ms_per_query": round(1000 * search_seconds / len(queries), 4),
+            "build_seconds": round(build_seconds, 3),
+            "index_bytes": int(faiss.serialize_index(index).size),
+        })
+
+    print(f"📏 {len(vectors)} vectors × {vectors.shape[1]} dims, {len(queries)} queries, k={k}")
+    print(f"{'index':<8}{'recall@k':>10}{'ms/query':>12}{'build s':>10}{'bytes':>12}")
+    for r in results:
+        print(f"{r['index_type']:<8}{r['recall_at_k']:>10.4f}{r['ms_per_query']:>12.4f}"
+              f"{r['build_seconds']:>10.3f}{r['index_bytes']:>12}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ANN index types against flat search")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--json", help="Write results to this JSON file")
+    args = parser.parse_args()
+    results = run(k=args.k, n_queries=args.queries)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,93 @@
+# rag/bench_cog.py
+# Size and write time of the executors' rasters as plain striped GTiffs (what
+# they used to write by copying src.meta) versus COGs from rag/cog.py, plus the
+# time to read a 512 px preview from each.
+#   python rag/bench_cog.py [--sizes 1000 4000] [--dem rag/uploads/my_dem.tif]
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+import hydrology
+from bench_hydrology import synthetic_dem, write_dem
+from cog import write_cog
+from reclassify import flood_risk_classifier, site_suitability
+from terrain import slope_degrees
+
+
+def executor_rasters(dem_path):
+    # The rasters the flood and site executors write, derived from one DEM
+    dem, profile, valid = hydrology.read_dem(dem_path)
+    transform = profile["transform"]
+    cell = (transform.a, transform.e)
+    flow = hydrology.flow_accumulation_from_dem(dem, valid, cell)
+    low, medium, high = np.percentile(flow[flow > 0], [70, 85, 95])
+    slope = slope_degrees(dem, valid, cell)
+    elevation = np.where(valid, dem, 0).astype("float32")
+    return profile, {
+        "dem (float32)": np.where(valid, dem, -32768.0).astype("float32"),
+        "dem (int16)": np.round(elevation).astype("int16"),  # SRTM-style integer DEM
+        "flow_accum (float32)": flow.astype("float32"),
+        "slope (float32)": np.nan_to_num(slope, nan=-32768.0).astype("float32"),
+        "flood_risk_levels (uint8)": flood_risk_classifier(low, medium, high)(flow),
+        "site_suitability (uint8)": site_suitability(elevation, slope),
+    }
+
+
+def write_plain(path, array, profile):
+    meta = dict(driver="GTiff", width=profile["width"], height=profile["height"], count=1,
+                dtype=array.dtype.name, crs=profile["crs"], transform=profile["transform"])
+    with rasterio.open(path, "w", **meta) as dst:
+        dst.write(array, 1)
+
+
+def preview_seconds(path, size=512):
+    start = time.perf_counter()
+    with rasterio.open(path) as src:
+        scale = max(src.width, src.height) / size
+        shape = (max(1, int(src.height / scale)), max(1, int(src.width / scale)))
+        src.read(1, out_shape=shape, resampling=Resampling.nearest)
+    return time.perf_counter() - start
+
+
+def bench(dem_path, label, workdir):
+    profile, rasters = executor_rasters(dem_path)
+    print(f"\n🗻 {label} ({profile['width']}×{profile['height']})")
+    print(f"{'raster':<28}{'plain MiB':>10}{'cog MiB':>9}{'ratio':>7}{'plain s':>9}{'cog s':>7}"
+          f"{'preview plain':>15}{'preview cog':>13}")
+    totals = [0, 0]
+    for name, array in rasters.items():
+        plain_path = os.path.join(workdir, "plain.tif")
+        cog_path = os.path.join(workdir, "cog.tif")
+
+        start = time.perf_counter()
+        write_plain(plain_path, array, profile)
+        plain_s = time.perf_counter() - start
+        raster_profile = dict(profile, dtype=array.dtype.name, nodata=0 if array.dtype == np.uint8 else -32768.0)
+        start = time.perf_counter()
+        write_cog(cog_path, array, raster_profile)
+        cog_s = time.perf_counter() - start
+
+        plain_size, cog_size = os.path.getsize(plain_path), os.path.getsize(cog_path)
+        totals[0] += plain_size
+        totals[1] += cog_size
+        print(f"{name:<28}{plain_size / 2**20:>10.1f}{cog_size / 2**20:>9.1f}{plain_size / cog_size:>6.1f}x"
+              f"{plain_s:>9.2f}{cog_s:>7.2f}{preview_seconds(plain_path):>14.3f}s{preview_seconds(cog_path):>12.3f}s")
+    print(f"{'total':<28}{totals[0] / 2**20:>10.1f}{totals[1] / 2**20:>9.1f}{totals[0] / totals[1]:>6.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Plain GTiff vs COG output benchmark")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 4000])
+    parser.add_argument("--dem", action="append", default=[], help="Benchmark an existing DEM as well")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            path = os.path.join(workdir, f"synthetic_{size}.tif")
+            write_dem(path, synthetic_dem(size))
+            bench(path, f"synthetic {size}×{size}", workdir)
+        for path in args.dem:
+            bench(os.path.abspath(path), path, workdir)
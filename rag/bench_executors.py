@@ -0,0 +1,440 @@
+# rag/bench_executors.py
+# End-to-end benchmark of the three workflow executors on synthetic data:
+# a DEM (flood, site) and four Sentinel-2-like bands (LULC) per size, plus a
+# local boundary polygon registered offline, so no OSMnx/network is needed.
+# Each executor runs as a subprocess in its own scratch folder (rag/outputs,
+# rag/geojson and the step cache stay isolated, the cache is off unless
+# --cache). Recorded per run: wall time, CPU time, peak RSS of the process
+# tree (sampled) and bytes read/written; per step (from WORKFLOW_PROGRESS_FILE
+# events): wall time, peak RSS of the executor's process tree and I/O while
+# the step ran. Steps that run concurrently share the I/O of their overlap.
+# Resource numbers need Linux /proc.
+#   python rag/bench_executors.py [--sizes 1000 2000 4000] [--executors flood site lulc]
+#                                 [--engine numpy] [--baseline rag/benchmarks/baseline.json]
+#                                 [--save-baseline]
+# Full range: --sizes 1000 5000 10000 20000 (inputs are generated in strips and
+# kept in --data-dir between runs; the executors themselves need the memory).
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.transform import from_origin
+import geopandas as gpd
+from shapely.geometry import Polygon
+from bench_hydrology import synthetic_dem
+from clip_engine import DEFAULT_BLOCK_SIZE, tiled_profile
+
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCH_DIR = "rag/benchmarks"
+EXECUTORS = {
+    "flood": os.path.join(RAG_DIR, "flood_executor.py"),
+    "site": os.path.join(RAG_DIR, "site_executor.py"),
+    "lulc": os.path.join(RAG_DIR, "lulc_executor.py"),
+}
+PLACE = "Benchmark Valley"
+CRS = "EPSG:32644"
+ORIGIN = (300000, 1400000)
+DEM_CELL = 30.0
+BAND_CELL = 10.0
+STRIP_ROWS = 512
+SAMPLE_SECONDS = 0.05
+# Run-level and per-step metrics compared against the baseline, with the
+# smallest absolute change that counts (timer and allocator noise)
+METRICS = {"wall_s": 0.5, "cpu_s": 0.5, "max_rss_mb": 32, "read_mb": 16, "write_mb": 16}
+STEP_METRICS = {"seconds": 0.5, "peak_rss_mb": 32}
+
+
+# --- Synthetic inputs ---
+
+def _write_strips(path, size, cell, dtype, nodata, count, make_strip):
+    profile = tiled_profile(dict(driver="GTiff", width=size, height=size, count=count, dtype=dtype, crs=CRS,
+                                 transform=from_origin(*ORIGIN, cell, cell), nodata=nodata), DEFAULT_BLOCK_SIZE)
+    part = f"{path}.part"
+    with rasterio.open(part, "w", **profile) as dst:
+        for start in range(0, size, STRIP_ROWS):
+            stop = min(size, start + STRIP_ROWS)
+            window = rasterio.windows.Window(0, start, size, stop - start)
+            dst.write(make_strip(start, stop), window=window)
+    os.replace(part, path)
+
+
+def write_dem(path, size, seed=0):
+    # Same surface as rag/bench_hydrology.py, written strip by strip
+    _write_strips(path, size, DEM_CELL, "float32", -9999.0, 1,
+                  lambda start, stop: synthetic_dem(size, seed, rows=(start, stop))[np.newaxis])
+
+
+def band_strips(size, seed=0):
+    # B02, B03, B04, B08 reflectances (uint16) over a smooth NDVI field from
+    # water (< 0) through bare soil to dense vegetation, so all LULC classes occur
+    rng = np.random.default_rng(seed)
+    phases = rng.random(4) * 2 * np.pi
+
+    def strip(start, stop):
+        y, x = np.mgrid[start:stop, 0:size] / size
+        ndvi = (0.2 + 0.35 * np.sin(6 * x + phases[0]) * np.cos(5 * y + phases[1])
+                + 0.25 * np.sin(17 * (x + y) + phases[2]))
+        noise = np.random.default_rng((seed, start)).normal(0, 0.02, ndvi.shape)
+        ndvi = np.clip(ndvi + noise, -0.6, 0.9)
+        red = 700 + 900 * (0.5 + 0.5 * np.sin(9 * y + phases[3]))
+        nir = red * (1 + ndvi) / (1 - ndvi)
+        bands = [red * 0.75, red * 0.9, red, nir]
+        return np.stack([np.clip(b, 1, 10000) for b in bands]).astype("uint16")
+
+    return strip
+
+
+def write_bands(folder, size, band_format="jp2", seed=0):
+    # One file per band with Sentinel-2 style names (band id in the file name)
+    os.makedirs(folder, exist_ok=True)
+    strip = band_strips(size, seed)
+    stack_path = os.path.join(folder, "stack.tif")
+    _write_strips(stack_path, size, BAND_CELL, "uint16", None, 4, strip)
+    with rasterio.open(stack_path) as src:
+        profile = src.profile
+        for index, band in enumerate(["B02", "B03", "B04", "B08"], 1):
+            single = os.path.join(folder, f"T44PKT_20250101T050000_{band}_10m.tif")
+            with rasterio.open(single, "w", **dict(profile, count=1)) as dst:
+                for _, window in src.block_windows(index):
+                    dst.write(src.read(index, window=window), 1, window=window)
+            if band_format == "jp2":
+                # Lossless, as in the Sentinel-2 products
+                rasterio.shutil.copy(single, single[:-4] + ".jp2", driver="JP2OpenJPEG",
+                                     QUALITY=100, REVERSIBLE="YES", BLOCKXSIZE=1024, BLOCKYSIZE=1024)
+                os.remove(single)
+    os.remove(stack_path)
+
+
+def boundary_gdf(size, cell=DEM_CELL):
+    # Octagon over the middle of the DEM, in EPSG:4326 like an OSMnx boundary
+    x0, y0 = ORIGIN
+    extent = size * cell
+    cx, cy, r = x0 + extent / 2, y0 - extent / 2, extent * 0.4
+    angles = np.linspace(0, 2 * np.pi, 9)[:-1] + np.pi / 8
+    polygon = Polygon(zip(cx + r * np.cos(angles), cy + r * np.sin(angles)))
+    return gpd.GeoDataFrame({"name": [PLACE]}, geometry=[polygon], crs=CRS).to_crs("EPSG:4326")
+
+
+def prepare_data(data_dir, size, executors, band_format):
+    # Inputs are generated once per size and reused by later runs
+    paths = {"size": size, "dem": os.path.join(data_dir, f"dem_{size}", "dem.tif"),
+             "bands": os.path.join(data_dir, f"s2_{size}_{band_format}")}
+    if {"flood", "site"} & set(executors) and not os.path.exists(paths["dem"]):
+        print(f"🧪 Generating {size}×{size} DEM...")
+        os.makedirs(os.path.dirname(paths["dem"]), exist_ok=True)
+        write_dem(paths["dem"], size)
+    if "lulc" in executors and not os.path.isdir(paths["bands"]):
+        print(f"🧪 Generating {size}×{size} {band_format} bands...")
+        part = f"{paths['bands']}.part"
+        shutil.rmtree(part, ignore_errors=True)
+        write_bands(part, size, band_format)
+        os.replace(part, paths["bands"])
+    return paths
+
+
+def workflow_for(executor, dem_path, engine):
+    if executor == "lulc":
+        return {"workflow": []}
+    if executor == "site":
+        task = f"site suitability for {PLACE}"
+        chain = [("Clip DEM using boundary", "rasterio", dem_path, "clipped_dem.tif"),
+                 ("Calculate slope", "whiteboxtools", "clipped_dem.tif", "slope.tif"),
+                 ("Classify elevation and slope", "rasterio", "clipped_dem.tif", "site_suitability.tif")]
+    else:
+        task = f"Identify flood-prone zones for {PLACE}"
+        chain = [("Clip DEM to boundary", "rasterio", "dem.tif", "clipped_dem.tif"),
+                 ("Fill depressions", "whiteboxtools", "clipped_dem.tif", "filled_dem.tif"),
+                 ("Calculate flow accumulation", "whiteboxtools", "filled_dem.tif", "flow_accum.tif"),
+                 ("Classify flood risk", "rasterio", "flow_accum.tif", "flood_risk_levels.tif")]
+    return {"engine": engine, "workflow": [
+        {"task": task, "action": action, "args": {"tool": tool, "input_file": i, "output_file": o}}
+        for action, tool, i, o in chain]}
+
+
+# --- Measurement ---
+
+def _proc_tree(pid):
+    pids, queue = [], [pid]
+    while queue:
+        current = queue.pop()
+        pids.append(current)
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    queue.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def _rss_kb(pid):
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return 0
+
+
+def _io_bytes(pid):
+    # rchar/wchar: bytes passed through read/write calls (page cache hits
+    # included); children count once they have exited
+    try:
+        with open(f"/proc/{pid}/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+class Sampler(threading.Thread):
+    # Polls RSS of the process tree and I/O of the executor process
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.samples = []  # (time, rss_kb, (read, written) or None)
+        self._stop_event = threading.Event()
+
+    def sample(self):
+        rss = sum(_rss_kb(pid) for pid in _proc_tree(self.pid))
+        self.samples.append((time.time(), rss, _io_bytes(self.pid)))
+
+    def run(self):
+        while not self._stop_event.is_set():
+            self.sample()
+            self._stop_event.wait(SAMPLE_SECONDS)
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+
+def wait_measured(proc):
+    # Exit code, CPU seconds and final I/O of a finished child. The child is
+    # left unreaped until its /proc/<pid>/io has been read. (ru_maxrss is not
+    # used: on Linux it starts from the harness's own RSS at fork time.)
+    if not hasattr(os, "wait4"):
+        return proc.wait(), None, None
+    os.waitid(os.P_PID, proc.pid, os.WEXITED | os.WNOWAIT)
+    io = _io_bytes(proc.pid)
+    _, status, usage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, usage.ru_utime + usage.ru_stime, io
+
+
+def read_events(path):
+    events = []
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    events.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+    return events
+
+
+def _mb(value):
+    return None if value is None else round(value / 2**20, 2)
+
+
+def step_metrics(events, samples):
+    started = {e["step"]: e["time"] for e in events if e.get("status") == "started"}
+    steps = {}
+    for event in events:
+        if event.get("status") != "done":
+            continue
+        start, end = started.get(event["step"], event["time"]), event["time"]
+        inside = [s for s in samples if start <= s[0] <= end]
+        # Nearest samples around the step for short steps and I/O deltas
+        before = [s for s in samples if s[0] <= start][-1:] or samples[:1]
+        after = [s for s in samples if s[0] >= end][:1] or samples[-1:]
+        window = before + inside + after
+        metrics = {"seconds": round(event["seconds"], 3),
+                   "peak_rss_mb": _mb(max((s[1] for s in window), default=0) * 1024) if window else None}
+        if window and before[0][2] and after[0][2]:
+            metrics["read_mb"] = _mb(after[0][2][0] - before[0][2][0])
+            metrics["write_mb"] = _mb(after[0][2][1] - before[0][2][1])
+        steps[event["step"]] = metrics
+    return steps
+
+
+def run_executor(executor, paths, engine, workdir, use_cache=False):
+    # One measured run in a fresh working folder
+    shutil.rmtree(workdir, ignore_errors=True)
+    os.makedirs(os.path.join(workdir, "rag", "geojson"))
+    geojson = os.path.join(workdir, "rag", "geojson", f"{PLACE.lower().replace(' ', '_')}_boundary.geojson")
+    boundary_gdf(paths["size"]).to_file(geojson, driver="GeoJSON")
+
+    workflow_path = os.path.join(workdir, "workflow.json")
+    with open(workflow_path, "w") as f:
+        json.dump(workflow_for(executor, paths["dem"], engine), f, indent=2)
+    progress_path = os.path.join(workdir, "progress.jsonl")
+    env = dict(os.environ, BOUNDARY_OFFLINE="1", STEP_CACHE="1" if use_cache else "0",
+               RAG_WORKFLOW_PATH=workflow_path, WORKFLOW_PROGRESS_FILE=progress_path,
+               RAG_UPLOAD_DIR=paths["bands"] if executor == "lulc" else os.path.dirname(paths["dem"]),
+               PYTHONUNBUFFERED="1")
+
+    log_path = os.path.join(workdir, "executor.log")
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen([sys.executable, EXECUTORS[executor]], cwd=workdir, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+        sampler = Sampler(proc.pid)
+        sampler.start()
+        returncode, cpu_s, io = wait_measured(proc)
+        wall = time.perf_counter() - start
+        sampler.stop()
+    # Peak RSS of the executor's process tree as sampled (WhiteboxTools children included)
+    max_rss_kb = max((sample[1] for sample in sampler.samples), default=None)
+
+    result = {"returncode": returncode, "wall_s": round(wall, 3),
+              "cpu_s": None if cpu_s is None else round(cpu_s, 3),
+              "max_rss_mb": None if max_rss_kb is None else _mb(max_rss_kb * 1024),
+              "read_mb": _mb(io[0]) if io else None, "write_mb": _mb(io[1]) if io else None,
+              "steps": step_metrics(read_events(progress_path), sampler.samples)}
+    if returncode != 0:
+        with open(log_path, encoding="utf-8", errors="replace") as f:
+            result["log_tail"] = f.read()[-2000:]
+    return result
+
+
+def median_run(runs):
+    # Median of every metric over repeats (failed repeats are reported as is)
+    if any(run["returncode"] != 0 for run in runs):
+        return next(run for run in runs if run["returncode"] != 0)
+    merged = {"returncode": 0, "repeats": len(runs)}
+    for metric in METRICS:
+        values = [run[metric] for run in runs if run[metric] is not None]
+        merged[metric] = round(statistics.median(values), 3) if values else None
+    merged["steps"] = {}
+    for name in runs[0]["steps"]:
+        per_step = [run["steps"][name] for run in runs if name in run["steps"]]
+        merged["steps"][name] = {key: round(statistics.median(s[key] for s in per_step), 3)
+                                 for key in per_step[0] if all(s.get(key) is not None for s in per_step)}
+    return merged
+
+
+# --- Reporting ---
+
+def print_run(key, run):
+    if run["returncode"] != 0:
+        print(f"❌ {key} failed (exit {run['returncode']}):\n{run.get('log_tail', '')}")
+        return
+
+    def fmt(value, unit):
+        return "n/a" if value is None else f"{value:.2f}{unit}"
+
+    print(f"✅ {key}: wall {fmt(run['wall_s'], 's')}, cpu {fmt(run['cpu_s'], 's')}, "
+          f"peak RSS {fmt(run['max_rss_mb'], ' MiB')}, read {fmt(run['read_mb'], ' MiB')}, "
+          f"written {fmt(run['write_mb'], ' MiB')}")
+    for name, step in run["steps"].items():
+        io = f", read {step['read_mb']:.1f} / written {step['write_mb']:.1f} MiB" if "read_mb" in step else ""
+        rss = f", peak RSS {step['peak_rss_mb']:.0f} MiB" if step.get("peak_rss_mb") is not None else ""
+        print(f"    {step['seconds']:8.2f}s  {name}{rss}{io}")
+
+
+def compare(current, baseline, tolerance):
+    # Lines for every metric outside the tolerance; regressions are worse than baseline
+    regressions, lines = 0, []
+    for key in sorted(set(current["runs"]) & set(baseline["runs"])):
+        now, before = current["runs"][key], baseline["runs"][key]
+        if now["returncode"] != 0:
+            lines.append(f"  ❌ {key}: failed (baseline succeeded)" if before["returncode"] == 0 else f"  ❌ {key}: failed")
+            regressions += before["returncode"] == 0
+            continue
+        pairs = [(metric, now.get(metric), before.get(metric), floor) for metric, floor in METRICS.items()]
+        for name, step in now["steps"].items():
+            old = before.get("steps", {}).get(name, {})
+            pairs += [(f"{name} · {metric}", step.get(metric), old.get(metric), floor)
+                      for metric, floor in STEP_METRICS.items()]
+        for label, value, reference, floor in pairs:
+            if value is None or not reference:
+                continue
+            ratio = value / reference
+            if abs(value - reference) < floor or abs(ratio - 1) <= tolerance:
+                continue
+            worse = ratio > 1
+            regressions += worse
+            lines.append(f"  {'🔺' if worse else '🔻'} {key} {label}: {reference:.2f} → {value:.2f} ({ratio:.2f}x)")
+    missing = sorted(set(baseline["runs"]) - set(current["runs"]))
+    if missing:
+        lines.append(f"  (not run this time: {', '.join(missing)})")
+    return regressions, lines
+
+
+def environment(args):
+    return {"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "gdal": rasterio.__gdal_version__, "rasterio": rasterio.__version__, "platform": platform.platform(),
+            "cpu_count": os.cpu_count(), "engine": args.engine, "band_format": args.band_format,
+            "cache": args.cache, "repeat": args.repeat}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the flood, site and LULC executors on synthetic data")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[1000, 2000, 4000])
+    parser.add_argument("--executors", nargs="*", default=list(EXECUTORS), choices=list(EXECUTORS))
+    parser.add_argument("--engine", default="whitebox", choices=["whitebox", "numpy"],
+                        help="Hydrology/slope engine written into the flood and site workflows "
+                             "(numpy is the small-DEM fallback, limited to NUMPY_FILL_MAX_CELLS)")
+    parser.add_argument("--band-format", default="jp2", choices=["jp2", "tif"])
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; metrics are medians")
+    parser.add_argument("--cache", action="store_true", help="Keep the step cache on (measures warm re-runs)")
+    parser.add_argument("--data-dir", default=os.path.join(BENCH_DIR, "data"))
+    parser.add_argument("--output", default=os.path.join(BENCH_DIR, "latest.json"))
+    parser.add_argument("--baseline", default=os.path.join(BENCH_DIR, "baseline.json"))
+    parser.add_argument("--save-baseline", action="store_true", help="Store this run as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed relative change before flagging")
+    args = parser.parse_args()
+
+    data_dir = os.path.abspath(args.data_dir)
+    results = {"environment": environment(args), "runs": {}}
+    with tempfile.TemporaryDirectory(prefix="bench_executors_") as scratch:
+        for size in args.sizes:
+            paths = prepare_data(data_dir, size, args.executors, args.band_format)
+            for executor in args.executors:
+                key = f"{executor}/{size}"
+                runs = []
+                for repeat in range(args.repeat):
+                    runs.append(run_executor(executor, paths, args.engine, os.path.join(scratch, "run"), args.cache))
+                    if runs[-1]["returncode"] != 0:
+                        break
+                results["runs"][key] = median_run(runs)
+                print_run(key, results["runs"][key])
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"\n💾 Results saved to: {args.output}")
+
+    failed = any(run["returncode"] != 0 for run in results["runs"].values())
+    regressions = 0
+    if args.save_baseline:
+        shutil.copyfile(args.output, args.baseline)
+        print(f"📌 Baseline updated: {args.baseline}")
+    elif os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        changed = {k for k in ("engine", "band_format", "cache", "cpu_count")
+                   if baseline["environment"].get(k) != results["environment"][k]}
+        if changed:
+            print(f"⚠️ Baseline was recorded with different {', '.join(sorted(changed))}")
+        regressions, lines = compare(results, baseline, args.tolerance)
+        print(f"\n📊 Against baseline from {baseline['environment']['created']} (±{args.tolerance:.0%}):")
+        print("\n".join(lines) if lines else "  no changes beyond tolerance")
+    else:
+        print(f"ℹ️ No baseline at {args.baseline}; store one with --save-baseline")
+    sys.exit(1 if failed or regressions else 0)
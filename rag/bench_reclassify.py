@@ -0,0 +1,98 @@
+# rag/bench_reclassify.py
+# Microbenchmark: the executors' former boolean-mask classifiers against the
+# lookup-table classifiers in reclassify.py (time and peak traced memory).
+#   python rag/bench_reclassify.py [--size 4000] [--repeat 3]
+import argparse
+import time
+import tracemalloc
+import numpy as np
+from reclassify import LULC_CLASSES, flood_risk_classifier, site_suitability
+
+
+def flood_masks(flow, low, medium, high):
+    risk = np.full_like(flow, 0, dtype=np.uint8)
+    risk[(flow > 0) & (flow <= low)] = 1
+    risk[(flow > low) & (flow <= medium)] = 2
+    risk[(flow > medium) & (flow <= high)] = 3
+    risk[flow > high] = 4
+    return risk
+
+
+def site_masks(elevation, slope):
+    elevation_masked = np.where(elevation <= 0, np.nan, elevation)
+    suitability = np.zeros_like(elevation, dtype=np.uint8)
+    suitability[np.where((elevation_masked >= 0) & (elevation_masked < 5))] += 1
+    suitability[np.where((elevation_masked >= 5) & (elevation_masked < 20))] += 2
+    suitability[np.where((elevation_masked >= 20) & (elevation_masked < 50))] += 3
+    suitability[np.where((elevation_masked >= 50) & (elevation_masked < 100))] += 4
+    suitability[np.where(elevation_masked >= 100)] += 5
+    suitability[np.where((slope >= 0) & (slope < 5))] += 5
+    suitability[np.where((slope >= 5) & (slope < 15))] += 3
+    suitability[np.where(slope >= 15)] += 1
+    suitability = np.nan_to_num(suitability, nan=0)
+    return np.clip(suitability // 2, 1, 5)
+
+
+def lulc_masks(ndvi):
+    lulc = np.zeros_like(ndvi, dtype=np.uint8)
+    lulc[ndvi < 0.0] = 1
+    lulc[(ndvi >= 0.0) & (ndvi < 0.2)] = 2
+    lulc[(ndvi >= 0.2) & (ndvi < 0.4)] = 3
+    lulc[(ndvi >= 0.4) & (ndvi < 0.6)] = 4
+    lulc[ndvi >= 0.6] = 5
+    return lulc
+
+
+def measure(fn, repeat):
+    best = float("inf")
+    peak = 0
+    result = None
+    for _ in range(repeat):
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return result, best, peak
+
+
+def run(size=4000, repeat=3, seed=0):
+    rng = np.random.default_rng(seed)
+    shape = (size, size)
+    flow = rng.lognormal(2.0, 2.0, shape).astype("float32")
+    flow[rng.random(shape) < 0.1] = 0
+    low, medium, high = np.percentile(flow[flow > 0], [70, 85, 95])
+    elevation = rng.normal(40, 60, shape).astype("float32")
+    slope = rng.exponential(8, shape).astype("float32")
+    ndvi = rng.uniform(-1, 1, shape).astype("float32")
+
+    cases = [
+        ("flood", lambda: flood_masks(flow, low, medium, high),
+         lambda: flood_risk_classifier(low, medium, high)(flow)),
+        ("site", lambda: site_masks(elevation, slope), lambda: site_suitability(elevation, slope)),
+        ("lulc", lambda: lulc_masks(ndvi), lambda: LULC_CLASSES(ndvi)),
+    ]
+
+    print(f"📐 {size}×{size} float32 inputs, best of {repeat}")
+    print(f"{'case':<8}{'masks s':>10}{'lut s':>10}{'speedup':>9}{'masks MiB':>11}{'lut MiB':>9}{'same':>6}")
+    results = []
+    for name, old, new in cases:
+        old_out, old_s, old_peak = measure(old, repeat)
+        new_out, new_s, new_peak = measure(new, repeat)
+        same = bool(np.array_equal(old_out, new_out))
+        results.append({
+            "case": name, "masks_seconds": old_s, "lut_seconds": new_s,
+            "masks_peak_bytes": old_peak, "lut_peak_bytes": new_peak, "identical": same,
+        })
+        print(f"{name:<8}{old_s:>10.3f}{new_s:>10.3f}{old_s / new_s:>8.1f}x"
+              f"{old_peak / 2**20:>11.1f}{new_peak / 2**20:>9.1f}{str(same):>6}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mask-based vs lookup-table classification benchmark")
+    parser.add_argument("--size", type=int, default=4000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+    run(args.size, args.repeat)
@@ -0,0 +1,138 @@
+# rag/boundary_store.py
+# Persistent boundary cache shared by the executors. Boundaries are keyed by a
+# normalized place name, held in a SQLite index on disk plus an in-process LRU,
+# and only geocoded through OSMnx when missing or older than the TTL.
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+import geopandas as gpd
+
+GEOJSON_DIR = os.path.abspath("rag/geojson")
+INDEX_PATH = os.path.join(GEOJSON_DIR, "boundaries.sqlite")
+TTL_SECONDS = float(os.environ.get("BOUNDARY_TTL_DAYS", 90)) * 86400
+OFFLINE = os.environ.get("BOUNDARY_OFFLINE", "").lower() in ("1", "true", "yes")
+LRU_SIZE = 32
+
+os.makedirs(GEOJSON_DIR, exist_ok=True)
+
+
+def normalize_place(location_name: str) -> str:
+    return " ".join(location_name.lower().replace(",", " ").split())
+
+
+def geojson_path_for(location_name: str) -> str:
+    # Same file naming download_boundary has always used
+    return os.path.join(GEOJSON_DIR, f"{location_name.lower().replace(',', '').replace(' ', '_')}_boundary.geojson")
+
+
+class BoundaryStore:
+    def __init__(self, index_path=INDEX_PATH, ttl_seconds=TTL_SECONDS, offline=OFFLINE, lru_size=LRU_SIZE):
+        self.index_path = index_path
+        self.ttl_seconds = ttl_seconds
+        self.offline = offline
+        self.lru_size = lru_size
+        self._lru = OrderedDict()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS boundaries ("
+                "key TEXT PRIMARY KEY, place TEXT, geojson TEXT, crs TEXT, "
+                "geojson_path TEXT, fetched_at REAL)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path)
+
+    def _expired(self, fetched_at):
+        return not self.offline and self.ttl_seconds > 0 and time.time() - fetched_at > self.ttl_seconds
+
+    def _remember(self, key, entry):
+        self._lru[key] = entry
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.lru_size:
+            self._lru.popitem(last=False)
+
+    def _load_row(self, key):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT geojson, crs, geojson_path, fetched_at FROM boundaries WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            return None
+        features = json.loads(row[0])["features"]
+        gdf = gpd.GeoDataFrame.from_features(features, crs=row[1])
+        return gdf, row[2], row[3]
+
+    def _store(self, key, place, gdf, geojson_path, fetched_at):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO boundaries VALUES (?, ?, ?, ?, ?, ?)",
+                (key, place, gdf.to_json(), gdf.crs.to_string() if gdf.crs else "EPSG:4326", geojson_path, fetched_at),
+            )
+        entry = (gdf, geojson_path, fetched_at)
+        self._remember(key, entry)
+        return entry
+
+    def _import_geojson(self, key, location_name, geojson_path):
+        # Seed the index from boundaries downloaded before the store existed
+        gdf = gpd.read_file(geojson_path)
+        return self._store(key, location_name, gdf, geojson_path, os.path.getmtime(geojson_path))
+
+    def _geocode(self, key, location_name, geojson_path):
+        import osmnx as ox
+
+        gdf = ox.geocode_to_gdf(location_name)
+        gdf.to_file(geojson_path, driver="GeoJSON")
+        return self._store(key, location_name, gdf, geojson_path, time.time())
+
+    def get(self, location_name: str):
+        key = normalize_place(location_name)
+        entry = self._lru.get(key)
+        if entry is not None:
+            self._lru.move_to_end(key)
+        else:
+            entry = self._load_row(key)
+            if entry is None and os.path.exists(geojson_path_for(location_name)):
+                entry = self._import_geojson(key, location_name, geojson_path_for(location_name))
+            elif entry is not None:
+                self._remember(key, entry)
+
+        if entry is not None and not self._expired(entry[2]):
+            gdf, geojson_path, _ = entry
+            return gdf.copy(), geojson_path
+
+        if self.offline:
+            raise LookupError(f"❌ No cached boundary for '{location_name}' and offline mode is enabled.")
+
+        gdf, geojson_path, _ = self._geocode(key, location_name, geojson_path_for(location_name))
+        return gdf.copy(), geojson_path
+
+    def put(self, location_name: str, gdf, geojson_path=None):
+        # Register a boundary from a local polygon without touching the geocoder
+        key = normalize_place(location_name)
+        geojson_path = geojson_path or geojson_path_for(location_name)
+        if not os.path.exists(geojson_path):
+            gdf.to_file(geojson_path, driver="GeoJSON")
+        self._store(key, location_name, gdf, geojson_path, time.time())
+        return geojson_path
+
+    def invalidate(self, location_name: str):
+        key = normalize_place(location_name)
+        self._lru.pop(key, None)
+        with self._connect() as conn:
+            conn.execute("DELETE FROM boundaries WHERE key = ?", (key,))
+
+
+_store = None
+
+
+def get_store() -> BoundaryStore:
+    global _store
+    if _store is None:
+        _store = BoundaryStore()
+    return _store
+
+
+def download_boundary(location_name):
+    return get_store().get(location_name)
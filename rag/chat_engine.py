@@ -0,0 +1,63 @@
+# rag/chat_engine.py
+# Resident Gemma chat engine for the sidebar assistant. The model is loaded on
+# first use and answers are streamed token by token.
+import threading
+from llama_cpp import Llama
+
+MODEL_PATH = "rag/models/gemma-2-2b-it-Q4_K_M.gguf"
+
+SYSTEM_CONTEXT = """You are an expert assistant for a geospatial reasoning application. This app allows users to:
+- Generate GIS workflows from natural language prompts using LLMs.
+- Perform flood-prone zone identification, site suitability analysis, and land use/land cover (LULC) classification.
+- Upload DEM (.tif) files for terrain-based workflows and Sentinel-2 bands (B02, B03, B04, B08 in .jp2) for LULC analysis.
+- Use tools like WhiteboxTools, Rasterio, OSMnx, and GDAL to process raster and vector geospatial data.
+- Automatically create JSON-based workflows, execute them, and visualize results like classified maps and output GeoTIFFs.
+- View step-by-step reasoning (Chain-of-Thought) for each workflow and download maps or raster results.
+Your job is to assist users with questions about how to use the platform, troubleshoot file uploads, understand outputs, and clarify GIS-related terms."""
+
+
+class ChatEngine:
+    def __init__(self, model_path=MODEL_PATH, n_ctx=2048, n_threads=6, n_gpu_layers=20):
+        self.llm = Llama(model_path=model_path, n_ctx=n_ctx, n_threads=n_threads, n_gpu_layers=n_gpu_layers)
+        self._lock = threading.Lock()
+
+    def count_tokens(self, text: str) -> int:
+        return len(self.llm.tokenize(text.encode("utf-8"), add_bos=False))
+
+    def summarize(self, summary: str, evicted: str, max_tokens=128) -> str:
+        prompt = (
+            "Condense this conversation between a user and a GIS assistant into a short summary "
+            "that keeps names, places, files and decisions.\n"
+            f"Existing summary: {summary or 'none'}\n"
+            f"New conversation:\n{evicted}\n"
+            "Summary:"
+        )
+        return self.generate(prompt, max_tokens=max_tokens)
+
+    def build_prompt(self, user_input: str, history: str = "") -> str:
+        history = f"{history.strip()}\n" if history.strip() else ""
+        return f"{SYSTEM_CONTEXT}\n{history}User: {user_input.strip()}\nAI:"
+
+    def stream(self, prompt: str, max_tokens=1024):
+        # One generation at a time per model; concurrent sessions queue here
+        with self._lock:
+            # Never ask for more tokens than the context window has left
+            room = self.llm.n_ctx() - self.count_tokens(prompt) - 1
+            max_tokens = max(1, min(max_tokens, room))
+            for chunk in self.llm(prompt, max_tokens=max_tokens, stop=["User:"], stream=True):
+                yield chunk["choices"][0]["text"]
+
+    def generate(self, prompt: str, max_tokens=1024) -> str:
+        return "".join(self.stream(prompt, max_tokens=max_tokens)).strip()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_engine() -> ChatEngine:
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = ChatEngine()
+    return _engine
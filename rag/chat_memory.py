@@ -0,0 +1,110 @@
+# rag/chat_memory.py
+# Token-bounded conversation memory for the sidebar assistant: a sliding
+# window of recent turns plus a running summary of everything older, so the
+# prompt handed to the model stays the same size however long the chat runs.
+# Evicted turns are folded into the summary extractively at once; the model
+# summary is generated on a background thread after the answer has streamed
+# and replaces it when done, unless the memory changed in the meantime.
+import threading
+
+HISTORY_TOKENS = 512
+SUMMARY_TOKENS = 128
+
+
+class ConversationMemory:
+    def __init__(self, count_tokens, summarize=None, history_tokens=HISTORY_TOKENS, summary_tokens=SUMMARY_TOKENS):
+        # count_tokens(text) -> int, normally the chat model's tokenizer
+        # summarize(summary, evicted_text, max_tokens) -> str, optional
+        self.count_tokens = count_tokens
+        self.summarize = summarize
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.turns = []  # (text, token_count)
+        self.summary = ""
+        self._window_tokens = 0
+        self._lock = threading.Lock()
+        self._generation = 0  # bumped by every fold and clear; stale model summaries are dropped
+        self._worker = None
+
+    def add_turn(self, question: str, answer: str):
+        text = f"User: {question.strip()}\nAI: {answer.strip()}"
+        n = self.count_tokens(text)
+        with self._lock:
+            self.turns.append((text, n))
+            self._window_tokens += n
+            self._compact()
+
+    def _compact(self):
+        evicted = []
+        while self._window_tokens > self.history_tokens and len(self.turns) > 1:
+            text, n = self.turns.pop(0)
+            self._window_tokens -= n
+            evicted.append(text)
+        if len(self.turns) == 1 and self._window_tokens > self.history_tokens:
+            # A single oversized turn: keep its tail only
+            text, _ = self.turns[0]
+            text = self._truncate(text, self.history_tokens, keep="tail")
+            self.turns[0] = (text, self.count_tokens(text))
+            self._window_tokens = self.turns[0][1]
+        if evicted:
+            self._fold_into_summary("\n".join(evicted))
+
+    def _fold_into_summary(self, evicted_text: str):
+        # Extractive summary right away: most recent evicted content wins
+        previous = self.summary
+        self.summary = self._truncate(f"{previous}\n{evicted_text}".strip(), self.summary_tokens, keep="tail")
+        self._generation += 1
+        if self.summarize is not None:
+            self._worker = threading.Thread(target=self._summarize_in_background,
+                                            args=(previous, evicted_text, self._generation),
+                                            name="chat-summary", daemon=True)
+            self._worker.start()
+
+    def _summarize_in_background(self, previous: str, evicted_text: str, generation: int):
+        try:
+            summary = self.summarize(previous, evicted_text, self.summary_tokens)
+        except Exception:
+            return  # keep the extractive summary
+        if not summary or not summary.strip():
+            return
+        summary = self._truncate(summary.strip(), self.summary_tokens, keep="tail")
+        with self._lock:
+            if generation == self._generation:
+                self.summary = summary
+
+    def wait(self, timeout=None):
+        # Blocks until the latest background summary is done (tests, scripts)
+        worker = self._worker
+        if worker is not None:
+            worker.join(timeout)
+
+    def _truncate(self, text: str, max_tokens: int, keep="tail"):
+        if self.count_tokens(text) <= max_tokens:
+            return text
+        words = text.split()
+        lo, hi = 0, len(words)
+        # Binary search for the longest word span that fits the budget
+        while lo < hi:
+            mid = (lo + hi + 1) // 2
+            span = words[-mid:] if keep == "tail" else words[:mid]
+            if self.count_tokens(" ".join(span)) <= max_tokens:
+                lo = mid
+            else:
+                hi = mid - 1
+        span = words[-lo:] if keep == "tail" and lo else words[:lo]
+        return " ".join(span)
+
+    def context(self) -> str:
+        with self._lock:
+            parts = []
+            if self.summary:
+                parts.append(f"Summary of earlier conversation: {self.summary}")
+            parts.extend(text for text, _ in self.turns)
+        return "\n".join(parts)
+
+    def clear(self):
+        with self._lock:
+            self.turns = []
+            self.summary = ""
+            self._window_tokens = 0
+            self._generation += 1
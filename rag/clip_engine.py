@@ -0,0 +1,210 @@
+# rag/clip_engine.py
+# Shared windowed DEM clipping: reads, masks and writes the boundary window
+# block by block so peak memory depends on the block size, not the raster size.
+# The input can also be a folder (or list) of DEM tiles: the clip then reads
+# through a virtual mosaic (GDAL VRT) of just the tiles that intersect the
+# boundary, so the merged raster is never written.
+import os
+import tempfile
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+import numpy as np
+import rasterio
+import rasterio.windows
+from rasterio.errors import WindowError
+from rasterio.features import geometry_mask, geometry_window
+from rasterio.windows import Window
+
+DEFAULT_BLOCK_SIZE = int(os.environ.get("CLIP_BLOCK_SIZE", 512))
+TILE_EXTENSIONS = (".tif", ".tiff", ".hgt")
+
+
+class NoOverlapError(ValueError):
+    # The boundary does not intersect the raster; a ValueError as before, so
+    # callers that only catch ValueError keep working
+    pass
+
+GDAL_TYPES = {"uint8": "Byte", "int8": "Int8", "uint16": "UInt16", "int16": "Int16", "uint32": "UInt32",
+              "int32": "Int32", "float32": "Float32", "float64": "Float64"}
+
+
+def block_windows(width, height, block_size=DEFAULT_BLOCK_SIZE):
+    # Yield (row_off, col_off)-ordered windows covering a width x height grid
+    for row in range(0, height, block_size):
+        h = min(block_size, height - row)
+        for col in range(0, width, block_size):
+            w = min(block_size, width - col)
+            yield Window(col, row, w, h)
+
+
+def tiled_profile(profile, block_size=DEFAULT_BLOCK_SIZE):
+    # GTiff tiles must be multiples of 16
+    block_size = max(16, (block_size // 16) * 16)
+    profile = profile.copy()
+    profile.update(driver="GTiff", tiled=True, blockxsize=block_size, blockysize=block_size)
+    return profile
+
+
+def tile_paths(source):
+    # Tiles of a mosaic input (folder or list of files); None for a single raster
+    if isinstance(source, (list, tuple)):
+        return [os.path.abspath(p) for p in source]
+    if os.path.isdir(source):
+        return sorted(os.path.join(os.path.abspath(source), f) for f in os.listdir(source)
+                      if f.lower().endswith(TILE_EXTENSIONS))
+    return None
+
+
+def tile_headers(paths):
+    headers = []
+    for path in paths:
+        with rasterio.open(path) as src:
+            headers.append({"path": path, "crs": src.crs, "bounds": src.bounds, "res": src.res,
+                            "width": src.width, "height": src.height, "count": src.count,
+                            "dtype": src.dtypes[0], "nodata": src.nodata, "block": src.block_shapes[0]})
+    if not headers:
+        raise ValueError("❌ No DEM tiles found.")
+    if len({h["crs"] for h in headers}) > 1:
+        raise ValueError("❌ All DEM tiles must use the same CRS.")
+    return headers
+
+
+def mosaic_vrt(headers):
+    # VRT XML placing each tile on a common grid (finest tile resolution). With
+    # SourceProperties GDAL opens a tile only when a read touches it.
+    res_x = min(h["res"][0] for h in headers)
+    res_y = min(h["res"][1] for h in headers)
+    left = min(h["bounds"].left for h in headers)
+    top = max(h["bounds"].top for h in headers)
+    right = max(h["bounds"].right for h in headers)
+    bottom = min(h["bounds"].bottom for h in headers)
+    first = headers[0]
+    nodata = first["nodata"]
+
+    root = ET.Element("VRTDataset", rasterXSize=str(round((right - left) / res_x)),
+                      rasterYSize=str(round((top - bottom) / res_y)))
+    ET.SubElement(root, "SRS").text = first["crs"].to_wkt()
+    ET.SubElement(root, "GeoTransform").text = f"{left!r}, {res_x!r}, 0.0, {top!r}, 0.0, {-res_y!r}"
+    for band in range(1, first["count"] + 1):
+        vrt_band = ET.SubElement(root, "VRTRasterBand", dataType=GDAL_TYPES[first["dtype"]], band=str(band))
+        if nodata is not None:
+            ET.SubElement(vrt_band, "NoDataValue").text = repr(float(nodata))
+        for h in headers:
+            source = ET.SubElement(vrt_band, "ComplexSource")
+            ET.SubElement(source, "SourceFilename", relativeToVRT="0").text = h["path"]
+            ET.SubElement(source, "SourceBand").text = str(band)
+            ET.SubElement(source, "SourceProperties", RasterXSize=str(h["width"]), RasterYSize=str(h["height"]),
+                          DataType=GDAL_TYPES[h["dtype"]], BlockXSize=str(h["block"][1]), BlockYSize=str(h["block"][0]))
+            ET.SubElement(source, "SrcRect", xOff="0", yOff="0", xSize=str(h["width"]), ySize=str(h["height"]))
+            ET.SubElement(source, "DstRect", xOff=repr((h["bounds"].left - left) / res_x),
+                          yOff=repr((top - h["bounds"].top) / res_y),
+                          xSize=repr((h["bounds"].right - h["bounds"].left) / res_x),
+                          ySize=repr((h["bounds"].top - h["bounds"].bottom) / res_y))
+            if h["nodata"] is not None:
+                # Tile nodata doesn't overwrite overlapping neighbours
+                ET.SubElement(source, "NODATA").text = repr(float(h["nodata"]))
+    return ET.tostring(root, encoding="unicode")
+
+
+@contextmanager
+def open_dem(source, boundary_gdf=None):
+    # rasterio dataset for a single raster, or a VRT mosaic of the tiles that
+    # intersect the boundary's bounding box
+    tiles = tile_paths(source)
+    if tiles is None:
+        with rasterio.open(source) as src:
+            yield src
+        return
+    headers = tile_headers(tiles)
+    if boundary_gdf is not None:
+        minx, miny, maxx, maxy = boundary_gdf.to_crs(headers[0]["crs"]).total_bounds
+        headers = [h for h in headers if h["bounds"].left < maxx and h["bounds"].right > minx
+                   and h["bounds"].bottom < maxy and h["bounds"].top > miny]
+        if not headers:
+            raise NoOverlapError("Input shapes do not overlap raster.")
+    print(f"🧩 Mosaic of {len(headers)}/{len(tiles)} DEM tiles")
+    with tempfile.TemporaryDirectory(prefix="rag_mosaic_") as folder:
+        vrt_path = os.path.join(folder, "mosaic.vrt")
+        with open(vrt_path, "w", encoding="utf-8") as f:
+            f.write(mosaic_vrt(headers))
+        with rasterio.open(vrt_path) as src:
+            yield src
+
+
+def boundary_window(src, geometries):
+    try:
+        window = geometry_window(src, geometries)
+    except WindowError:
+        raise NoOverlapError("Input shapes do not overlap raster.")
+    if window.width <= 0 or window.height <= 0:
+        raise NoOverlapError("Input shapes do not overlap raster.")
+    return window
+
+
+def _clipped_profile(src, window, block_size):
+    profile = tiled_profile(src.profile, block_size)
+    profile.update(
+        height=int(window.height),
+        width=int(window.width),
+        transform=src.window_transform(window),
+        nodata=src.nodata if src.nodata is not None else 0,
+    )
+    return profile
+
+
+def _clipped_blocks(src, geometries, window, profile):
+    # (block, masked data) pairs covering the boundary window
+    nodata = profile["nodata"]
+    for block in block_windows(profile["width"], profile["height"], profile["blockxsize"]):
+        src_block = Window(
+            window.col_off + block.col_off,
+            window.row_off + block.row_off,
+            block.width,
+            block.height,
+        )
+        data = src.read(window=src_block, boundless=True, fill_value=nodata)
+        outside = geometry_mask(
+            geometries,
+            out_shape=(int(block.height), int(block.width)),
+            transform=rasterio.windows.transform(block, profile["transform"]),
+        )
+        data[:, outside] = nodata
+        yield block, data
+
+
+def _write_clip(path, src, geometries, window, profile):
+    with rasterio.open(path, "w", **profile) as dst:
+        for block, data in _clipped_blocks(src, geometries, window, profile):
+            dst.write(data, window=block)
+
+
+def clip_to_boundary(input_path, boundary_gdf, output_path, block_size=DEFAULT_BLOCK_SIZE):
+    with open_dem(input_path, boundary_gdf) as src:
+        geometries = list(boundary_gdf.to_crs(src.crs).geometry.values)
+        window = boundary_window(src, geometries)
+        profile = _clipped_profile(src, window, block_size)
+        _write_clip(output_path, src, geometries, window, profile)
+
+    return output_path, profile
+
+
+def clip_to_array(input_path, boundary_gdf, block_size=DEFAULT_BLOCK_SIZE, max_bytes=None, spill_path=None):
+    # Same clip, kept in memory for the next workflow step: (bands, rows, cols) array.
+    # A clip larger than max_bytes is streamed to spill_path (tiled GTiff) instead
+    # and (None, profile) is returned, so peak memory stays flat for large DEMs.
+    with open_dem(input_path, boundary_gdf) as src:
+        geometries = list(boundary_gdf.to_crs(src.crs).geometry.values)
+        window = boundary_window(src, geometries)
+        profile = _clipped_profile(src, window, block_size)
+
+        size = src.count * profile["height"] * profile["width"] * np.dtype(src.dtypes[0]).itemsize
+        if max_bytes is not None and spill_path is not None and size > max_bytes:
+            _write_clip(spill_path, src, geometries, window, profile)
+            return None, profile
+
+        data = np.empty((src.count, profile["height"], profile["width"]), dtype=src.dtypes[0])
+        for block, block_data in _clipped_blocks(src, geometries, window, profile):
+            rows, cols = block.toslices()
+            data[:, rows, cols] = block_data
+
+    return data, profile
@@ -0,0 +1,109 @@
+# rag/cog.py
+# Shared output writer: every raster the executors keep is a Cloud-Optimized
+# GeoTIFF (tiled, compressed, internal overviews). Compression follows the dtype:
+# integers -> DEFLATE + horizontal predictor, floats -> ZSTD + floating-point
+# predictor. Class rasters (uint8) get MODE overviews so classes stay classes,
+# continuous rasters AVERAGE. GDAL compresses and builds overviews on all cores.
+import os
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.transform import from_origin
+from clip_engine import DEFAULT_BLOCK_SIZE, tiled_profile
+
+NUM_THREADS = os.environ.get("COG_NUM_THREADS", "ALL_CPUS")
+ZSTD_LEVEL = int(os.environ.get("COG_ZSTD_LEVEL", 9))
+DEFLATE_LEVEL = int(os.environ.get("COG_DEFLATE_LEVEL", 6))
+
+
+_zstd = None
+
+
+def _has_zstd():
+    # Probed once per process
+    global _zstd
+    if _zstd is None:
+        try:
+            with rasterio.MemoryFile() as memfile:
+                with memfile.open(driver="GTiff", width=16, height=16, count=1, dtype="uint8", compress="ZSTD",
+                                  transform=from_origin(0, 16, 1, 1)) as dst:
+                    dst.write(np.zeros((1, 16, 16), dtype="uint8"))
+            _zstd = True
+        except Exception:
+            _zstd = False
+    return _zstd
+
+
+def is_categorical(dtype):
+    # The executors' class rasters (flood risk, suitability, LULC) are uint8
+    return np.dtype(dtype) == np.uint8
+
+
+def cog_options(dtype, categorical=None, block_size=DEFAULT_BLOCK_SIZE):
+    if categorical is None:
+        categorical = is_categorical(dtype)
+    floating = np.issubdtype(np.dtype(dtype), np.floating)
+    # GDAL builds without ZSTD fall back to DEFLATE
+    compress = "ZSTD" if floating and _has_zstd() else "DEFLATE"
+    options = {
+        "COMPRESS": compress,
+        "PREDICTOR": "FLOATING_POINT" if floating else "STANDARD",
+        "LEVEL": ZSTD_LEVEL if compress == "ZSTD" else DEFLATE_LEVEL,
+        "BLOCKSIZE": max(16, (block_size // 16) * 16),
+        "OVERVIEWS": "AUTO",
+        "OVERVIEW_RESAMPLING": "MODE" if categorical else "AVERAGE",
+        "NUM_THREADS": NUM_THREADS,
+        "BIGTIFF": "IF_SAFER",
+    }
+    if categorical:
+        # Predictors don't help class maps
+        options["PREDICTOR"] = "NO"
+    return options
+
+
+def is_cog(path):
+    with rasterio.open(path) as src:
+        return src.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG"
+
+
+def _copy_to_cog(src_path, dst_path, dtype, categorical, block_size):
+    options = cog_options(dtype, categorical, block_size)
+    rasterio.shutil.copy(src_path, dst_path, driver="COG", **options)
+
+
+def finalize_cog(path, categorical=None, block_size=DEFAULT_BLOCK_SIZE):
+    # Rewrite a finished (e.g. block-streamed) GeoTIFF as a COG in place
+    with rasterio.open(path) as src:
+        dtype = src.dtypes[0]
+        if src.tags(ns="IMAGE_STRUCTURE").get("LAYOUT") == "COG":
+            return path
+    part = f"{path}.cog.part"
+    try:
+        _copy_to_cog(path, part, dtype, categorical, block_size)
+        os.replace(part, path)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    return path
+
+
+def write_cog(path, array, profile, categorical=None, block_size=DEFAULT_BLOCK_SIZE):
+    # The COG driver only supports copying, so the array is staged as a
+    # lightly compressed tiled GTiff next to the destination first.
+    staging = tiled_profile(profile, block_size)
+    count = 1 if array.ndim == 2 else array.shape[0]
+    staging.update(count=count, dtype=array.dtype.name, num_threads=NUM_THREADS)
+    if _has_zstd():
+        staging.update(compress="ZSTD", zstd_level=1)
+    part = f"{path}.part.tif"
+    try:
+        with rasterio.open(part, "w", **staging) as dst:
+            if array.ndim == 2:
+                dst.write(array, 1)
+            else:
+                dst.write(array)
+        _copy_to_cog(part, path, array.dtype, categorical, block_size)
+    finally:
+        if os.path.exists(part):
+            os.remove(part)
+    return path
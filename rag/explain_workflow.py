@@ -1,18 +1,54 @@
 import json
-from retriever import retrieve_explanation
+from retriever import embed_queries, reset_vectorstore, search_by_vectors
+from explanation_cache import get_cache, normalize_key, similarity_text
 
 def explain_workflow(json_path="rag/workflows/sample_workflow.json"):
     with open(json_path, "r") as f:
         workflow = json.load(f)["workflow"]
 
+    # A rebuilt index empties the cache and makes the retriever reload it
+    cache = get_cache(on_index_change=reset_vectorstore)
+    texts = [None] * len(workflow)
+
+    # Tier 1: exact (tool, action) matches never touch the embedding model
+    pending = []
+    for i, step in enumerate(workflow):
+        key = normalize_key(step["args"]["tool"], step["action"])
+        texts[i] = cache.get_exact(key)
+        if texts[i] is None:
+            pending.append((i, key))
+
+    if pending:
+        queries = [
+            f"What does this GIS step do? Tool: {workflow[i]['args']['tool']}, Action: {workflow[i]['action']}"
+            for i, _ in pending
+        ]
+        # All uncached steps share one embedding pass and one index search. The
+        # cache compares the bare "tool action" texts; the index is searched
+        # with the full queries.
+        vectors = embed_queries(queries + [similarity_text(key) for _, key in pending])
+        query_vectors, key_vectors = vectors[:len(pending)], vectors[len(pending):]
+        misses = []
+        for (i, key), query_vector, key_vector in zip(pending, query_vectors, key_vectors):
+            texts[i] = cache.get_similar(key, key_vector)
+            if texts[i] is None:
+                misses.append((i, key, query_vector, key_vector))
+            else:
+                cache.put(key, texts[i], key_vector)
+
+        if misses:
+            results = search_by_vectors([query_vector for _, _, query_vector, _ in misses])
+            for (i, key, _, key_vector), docs in zip(misses, results):
+                texts[i] = docs[0].page_content if docs else "No explanation found."
+                cache.put(key, texts[i], key_vector)
+        cache.save()
+
     explanations = []
 
-    for step in workflow:
-        query = f"What does this GIS step do? Tool: {step['args']['tool']}, Action: {step['action']}"
-        docs = retrieve_explanation(query)
+    for step, text in zip(workflow, texts):
         explanations.append({
             "step": step,
-            "explanation": docs[0].page_content if docs else "No explanation found."
+            "explanation": text
         })
 
     with open("rag/workflows/step_explanations.json", "w") as f:
@@ -0,0 +1,149 @@
+# rag/explanation_cache.py
+# Persistent cache of workflow step explanations. Tier one is an exact match on
+# the normalized (tool, action) pair; tier two reuses an entry of the same tool
+# whose embedding is within a cosine threshold. Those embeddings are of the bare
+# "tool action" text (similarity_text), not of the templated retrieval query,
+# whose shared boilerplate would push different actions above the threshold.
+# The cache is tied to a fingerprint of the RAG index files and empties itself
+# (and has the retriever reload its index) when they change.
+import hashlib
+import json
+import os
+import threading
+import numpy as np
+
+DB_PATH = "rag/rag_db"
+CACHE_PATH = os.path.join(DB_PATH, "explanation_cache.json")
+SIMILARITY_THRESHOLD = float(os.environ.get("EXPLANATION_CACHE_THRESHOLD", 0.92))
+INDEX_FILES = ("index.faiss", "index.pkl", "manifest.json", "index_config.json")
+# Bumped when the stored embeddings change meaning; older cache files are dropped
+CACHE_VERSION = 2
+
+
+def normalize_key(tool: str, action: str) -> str:
+    return f"{' '.join(str(tool).lower().split())}|{' '.join(str(action).lower().split())}"
+
+
+def similarity_text(key: str) -> str:
+    # What the similarity tier embeds: "whiteboxtools fill depressions"
+    return key.replace("|", " ")
+
+
+def key_tool(key: str) -> str:
+    return key.split("|", 1)[0]
+
+
+def index_fingerprint(db_path=DB_PATH) -> str:
+    h = hashlib.sha256()
+    for name in INDEX_FILES:
+        path = os.path.join(db_path, name)
+        if os.path.exists(path):
+            st = os.stat(path)
+            h.update(f"{name}:{st.st_size}:{st.st_mtime_ns};".encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class ExplanationCache:
+    def __init__(self, path=CACHE_PATH, threshold=SIMILARITY_THRESHOLD, db_path=DB_PATH, on_index_change=None):
+        self.path = path
+        self.threshold = threshold
+        self.db_path = db_path
+        # Called after the index files changed, e.g. to reload the retriever's index
+        self.on_index_change = on_index_change
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        self.fingerprint = index_fingerprint(self.db_path)
+        self.entries = {}
+        if os.path.exists(self.path):
+            with open(self.path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("fingerprint") == self.fingerprint and data.get("version") == CACHE_VERSION:
+                self.entries = data.get("entries", {})
+        self._rebuild_matrix()
+
+    def _rebuild_matrix(self):
+        self._keys = [k for k, e in self.entries.items() if e.get("embedding")]
+        if self._keys:
+            matrix = np.asarray([self.entries[k]["embedding"] for k in self._keys], dtype="float32")
+            self._matrix = matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+            self._tools = np.asarray([key_tool(k) for k in self._keys])
+        else:
+            self._matrix = None
+            self._tools = None
+
+    def _check_index(self):
+        # RAG index rebuilt since the cache was loaded: drop everything, and
+        # make the retriever stop serving the old index
+        if index_fingerprint(self.db_path) != self.fingerprint:
+            self.fingerprint = index_fingerprint(self.db_path)
+            self.entries = {}
+            self._rebuild_matrix()
+            if self.on_index_change is not None:
+                self.on_index_change()
+
+    def get_exact(self, key):
+        with self._lock:
+            self._check_index()
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                return entry["explanation"]
+            return None
+
+    def get_similar(self, key, embedding):
+        # embedding: of similarity_text(key); only entries of the same tool are candidates
+        with self._lock:
+            same_tool = self._tools == key_tool(key) if self._matrix is not None else None
+            if same_tool is None or not same_tool.any():
+                self.misses += 1
+                return None
+            query = np.asarray(embedding, dtype="float32")
+            query = query / max(float(np.linalg.norm(query)), 1e-12)
+            scores = np.where(same_tool, self._matrix @ query, -np.inf)
+            best = int(np.argmax(scores))
+            if scores[best] >= self.threshold:
+                self.semantic_hits += 1
+                return self.entries[self._keys[best]]["explanation"]
+            self.misses += 1
+            return None
+
+    def put(self, key, explanation, embedding=None):
+        with self._lock:
+            self.entries[key] = {
+                "explanation": explanation,
+                "embedding": [float(x) for x in embedding] if embedding is not None else None,
+            }
+            self._rebuild_matrix()
+
+    def save(self):
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": CACHE_VERSION, "fingerprint": self.fingerprint, "entries": self.entries}, f)
+            os.replace(tmp_path, self.path)
+
+    def stats(self):
+        lookups = self.hits + self.semantic_hits + self.misses
+        return {
+            "hits": self.hits,
+            "semantic_hits": self.semantic_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.hits + self.semantic_hits) / lookups, 3) if lookups else 0.0,
+            "entries": len(self.entries),
+        }
+
+
+_cache = None
+
+
+def get_cache(on_index_change=None) -> ExplanationCache:
+    global _cache
+    if _cache is None:
+        _cache = ExplanationCache(on_index_change=on_index_change)
+    return _cache
@@ -1,17 +1,21 @@
 import json
-import rasterio
-import numpy as np
+from functools import partial
 import os
-from rasterio.plot import show
 from whitebox.whitebox_tools import WhiteboxTools
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
-import osmnx as ox
-import geopandas as gpd
-from rasterio.mask import mask
-
-UPLOAD_DIR = os.path.abspath("rag/uploads")
-OUTPUT_DIR = os.path.abspath("rag/outputs")
+from boundary_store import download_boundary
+from reclassify import flood_risk_classifier
+from streaming_quantile import LogQuantileSketch
+import hydrology
+from raster_handle import RasterHandle, StepResults, step_files, workflow_outputs
+from workflow_engine import Step, execute, print_timings
+from step_cache import cached, digest_geometries
+from preview import render_preview
+import tracing
+
+# Job runs (rag/job_queue.py) get their own output folder and workflow copy
+UPLOAD_DIR = os.path.abspath(os.environ.get("RAG_UPLOAD_DIR", "rag/uploads"))
+OUTPUT_DIR = os.path.abspath(os.environ.get("RAG_OUTPUT_DIR", "rag/outputs"))
+WORKFLOW_PATH = os.environ.get("RAG_WORKFLOW_PATH", "rag/workflows/sample_workflow.json")
 GEOJSON_DIR = os.path.abspath("rag/geojson")
 
 os.makedirs(UPLOAD_DIR, exist_ok=True)
@@ -21,20 +25,17 @@ os.makedirs(GEOJSON_DIR, exist_ok=True)
 wbt = WhiteboxTools()
 wbt.set_working_dir(UPLOAD_DIR)
 
-def download_boundary(location_name):
-    geojson_path = os.path.join(GEOJSON_DIR, f"{location_name.lower().replace(',', '').replace(' ', '_')}_boundary.geojson")
-    gdf = ox.geocode_to_gdf(location_name)
-    gdf.to_file(geojson_path, driver="GeoJSON")
-    return gdf, geojson_path
-
 def run_workflow(json_path):
     with open(json_path) as f:
-        workflow = json.load(f)["workflow"]
+        workflow_json = json.load(f)
+    workflow = workflow_json["workflow"]
+    # "whitebox" (default) or "numpy", the in-process small-DEM fallback (rag/hydrology.py)
+    engine = workflow_json.get("engine", "whitebox").lower()
 
     location = ""
     for step in workflow:
         if "task" in step and "flood-prone" in step["task"].lower():
-            location = step["task"].split("for")[-1].strip()
+            location = step["task"].rsplit(" for ", 1)[-1].strip()
             break
 
     if not location:
@@ -42,80 +43,119 @@ def run_workflow(json_path):
 
     print(f"\n📍 Region: {location}")
 
-    print("📥 Downloading boundary...")
-    boundary_gdf, geojson_path = download_boundary(location)
-    print(f"✅ Saved boundary: {geojson_path}")
-
-    for step in workflow:
-        args = step.get("args", {})
-        tool = args.get("tool", "").lower()
-        action = step["action"]
-        input_path = os.path.join("rag/uploads", os.path.basename(args["input_file"]))
-        output_path = os.path.join("rag/outputs", os.path.basename(args["output_file"]))
-
-        print(f"\n🔧 Step: {action}\n  ➤ Input: {input_path}\n  ➤ Output: {output_path}")
-
-        if not os.path.exists(input_path):
-            raise FileNotFoundError(f"❌ Input file not found: {input_path}")
-
-        if "clip" in action.lower():
-            with rasterio.open(input_path) as src:
-                boundary_gdf = boundary_gdf.to_crs(src.crs)
-                geojson_geom = boundary_gdf.geometry.values[0]
-                try:
-                    clipped, transform = mask(src, [geojson_geom], crop=True)
-                except ValueError:
-                    raise ValueError(f"❌ The DEM does not overlap with {location}.")
-                meta = src.meta.copy()
-            meta.update({"height": clipped.shape[1], "width": clipped.shape[2], "transform": transform})
-            with rasterio.open(output_path, "w", **meta) as dst:
-                dst.write(clipped)
-            continue
-
-        if tool == "whiteboxtools":
-            if "fill_depressions" in action.lower():
-                wbt.fill_depressions(input_path, output_path)
-            elif "flow_accumulation" in action.lower():
-                wbt.d8_pointer(input_path, os.path.join("rag", "flow_direction.tif"))
+    # Steps run as a dependency graph (input_file -> output_file); the boundary
+    # download is a step of its own, so non-clip steps don't wait for it.
+    boundary = {}
+
+    def load_boundary():
+        print("📥 Loading boundary...")
+        boundary["gdf"], geojson_path = download_boundary(location)
+        results.digests["boundary"] = digest_geometries(boundary["gdf"])
+        print(f"✅ Saved boundary: {geojson_path}")
+
+    # Step results stay in memory; only the files listed in "outputs" are written
+    outputs = workflow_outputs(workflow_json)
+    with StepResults(OUTPUT_DIR, outputs, search_dirs=[UPLOAD_DIR]) as results:
+        steps = [Step("Load boundary", load_boundary, outputs=["boundary"])]
+        produced = set()
+        for number, step in enumerate(workflow, 1):
+            input_name, output_name = step_files(step, produced)
+            produced.add(output_name)
+            inputs = [input_name] + (["boundary"] if "clip" in step["action"].lower() else [])
+            # Raster steps are memoized by content (rag/step_cache.py); rendering is not
+            run = partial(run_step, step, input_name, output_name, results, boundary, location, engine)
+            steps.append(Step(
+                f"{number}. {step['action']}",
+                cached(results, step_spec(step, engine), inputs, [output_name], run),
+                inputs=inputs,
+                outputs=[output_name],
+            ))
+            if step.get("args", {}).get("tool", "").lower() == "rasterio" and "clip" not in step["action"].lower():
+                steps.append(Step(f"{number}. Render flood map", partial(render_step, results, output_name),
+                                  inputs=[output_name]))
+        print_timings(execute(steps))
+
+
+def step_spec(step, engine):
+    # What a step's result depends on besides its input data
+    args = step.get("args", {})
+    tool = args.get("tool", "").lower()
+    return {
+        "tool": tool,
+        "action": step["action"].lower().replace(" ", "_"),
+        "engine": engine if tool == "whiteboxtools" else None,
+        "args": {k: v for k, v in args.items() if k not in ("input_file", "output_file")},
+    }
+
+
+def run_step(step, input_name, output_name, results, boundary, location, engine="whitebox"):
+    args = step.get("args", {})
+    tool = args.get("tool", "").lower()
+    action = step["action"]
+    action_key = action.lower().replace(" ", "_")
+
+    print(f"\n🔧 Step: {action}\n  ➤ Input: {input_name}\n  ➤ Output: {output_name}")
+
+    if input_name not in results:
+        raise FileNotFoundError(f"❌ Input file not found: {input_name}")
+
+    if "clip" in action.lower():
+        try:
+            results.put_clip(output_name, results.file_for(input_name), boundary["gdf"])
+        except ValueError:
+            raise ValueError(f"❌ The DEM does not overlap with {location}.")
+
+    elif tool == "whiteboxtools" and engine == "numpy":
+        array, profile = results.get(input_name).read()
+        dem, valid = hydrology.dem_from_array(array, profile.get("nodata"))
+        if "fill_depressions" in action_key:
+            filled = hydrology.fill_depressions(dem, valid)
+            results.put(RasterHandle(output_name, filled, profile), dtype="float32")
+        elif "flow_accumulation" in action_key:
+            transform = profile["transform"]
+            with tracing.span("D8 pointer"):
+                pointer = hydrology.d8_pointer(dem, valid, (transform.a, transform.e))
+            with tracing.span("D8 flow accumulation"):
+                flow = hydrology.d8_flow_accumulation(pointer, valid)
+            results.put(RasterHandle(output_name, flow, profile), dtype="float32", nodata=hydrology.FLOW_NODATA)
+
+    elif tool == "whiteboxtools":
+        input_path = results.file_for(input_name)
+        output_path = results.target_path(output_name)
+        if "fill_depressions" in action_key:
+            wbt.fill_depressions(input_path, output_path)
+        elif "flow_accumulation" in action_key:
+            with tracing.span("D8 pointer"):
+                wbt.d8_pointer(input_path, results.scratch_path("flow_direction.tif"))
+            with tracing.span("D8 flow accumulation"):
                 wbt.run_tool(
                     "D8FlowAccumulation",
                     [f"--dem={input_path}", f"--output={output_path}", "--out_type=cells"]
                 )
+        results.put(RasterHandle(output_name, path=output_path))
+
+    elif tool == "rasterio":
+        flow = results.get(input_name)
+
+        # Pass 1: thresholds from a streaming log-histogram of flow > 0
+        with tracing.span("Thresholds"):
+            sketch = LogQuantileSketch()
+            for _, data in flow.blocks():
+                sketch.update(data)
+            LOW, MEDIUM, HIGH = sketch.quantiles([0.70, 0.85, 0.95])
+        print(f"  ➤ Thresholds (±{sketch.relative_accuracy:.1%}): {LOW:.1f}, {MEDIUM:.1f}, {HIGH:.1f}")
+
+        # Pass 2: Risk map 0 = Sea/Water, 1 Safe, 2 Low, 3 Medium, 4 High, block by block
+        # (streamed to a tiled GTiff when the map is too large to keep in memory)
+        classify = flood_risk_classifier(LOW, MEDIUM, HIGH)
+        risk_blocks = ((window, classify(data)) for window, data in flow.blocks())
+        results.put_blocks(output_name, flow.meta(), risk_blocks, dtype="uint8", nodata=0)
+
 
-        elif tool == "rasterio":
-            with rasterio.open(input_path) as src:
-                flow = src.read(1)
-                meta = src.meta.copy()
-
-            # Thresholds
-            valid = flow > 0
-            LOW, MEDIUM, HIGH = np.percentile(flow[valid], [70, 85, 95])
-
-            # Initialize risk map: 0 = Sea/Water (default), then 1–4
-            risk = np.full_like(flow, 0, dtype=np.uint8)
-            risk[(flow > 0) & (flow <= LOW)] = 1  # Safe
-            risk[(flow > LOW) & (flow <= MEDIUM)] = 2  # Low
-            risk[(flow > MEDIUM) & (flow <= HIGH)] = 3  # Medium
-            risk[flow > HIGH] = 4  # High
-
-            # Save classified raster
-            meta.update(dtype=rasterio.uint8, count=1, nodata=0)
-            with rasterio.open(output_path, "w", **meta) as dst:
-                dst.write(risk, 1)
-
-            # Visualization with sea (0) as light blue
-            cmap = ListedColormap(["lightblue", "lightgray", "yellow", "orange", "red"])
-            labels = ["Water/Sea", "Safe", "Low", "Medium", "High"]
-
-            plt.figure(figsize=(8, 5))
-            im = plt.imshow(risk, cmap=cmap, vmin=0, vmax=4)
-            cbar = plt.colorbar(im, ticks=[0, 1, 2, 3, 4])
-            cbar.ax.set_yticklabels(labels)
-            plt.title("Flood Risk Zones")
-            plt.axis("off")
-            plt.tight_layout()
-            plt.savefig("rag/outputs/flood_risk_map.png")
-            plt.close()
+def render_step(results, name):
+    # Downsampled Pillow preview, from memory or the written COG's overviews
+    risk = results.get(name)
+    render_preview(risk.array if risk.in_memory else risk.path, "flood", os.path.join(OUTPUT_DIR, "flood_risk_map.png"))
 
 if __name__ == "__main__":
-    run_workflow("rag/workflows/sample_workflow.json")
+    run_workflow(WORKFLOW_PATH)
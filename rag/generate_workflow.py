@@ -3,168 +3,83 @@ import json
 import os
 import regex as re
 import sys
+import threading
+import time
 from llama_cpp import Llama
+from workflow_prompt import PROMPT_PREFIX, prompt_suffix
+from prefix_cache import PrefixStateCache
+from workflow_planner import get_planner
 
 model_path = "D:/AI/lmstudio-community/DeepSeek-R1-0528-Qwen3-8B-GGUF/DeepSeek-R1-0528-Qwen3-8B-Q4_K_M.gguf"
 output_path = "rag/workflows/sample_workflow.json"
 cot_path = "rag/llm_response.txt"
-
-def get_workflow_from_prompt(prompt: str):
-    llm = Llama(
-        model_path=model_path,
-        n_ctx=2048,
-        n_threads=4,
-        seed=1337
-    )
-
-    system_prompt = """
-You are a GIS workflow generator. Given a user task, generate a concrete JSON workflow using the following schema.
-Return the JSON object followed by your step-by-step reasoning (Chain-of-Thought) explaining how you constructed the workflow.
-
-Schema:
-{
-  "workflow": [
-    {
-      "task": string,
-      "action": string,
-      "args": {
-        "tool": one of [whiteboxtools, qgis, gdal, rasterio, osmnx, ndvi],
-        "input_file": string,
-        "output_file": string
-      }
-    }
-  ]
-}
-
-Examples:
-
-Generate flood prone zones from DEM for Chennai:
-{
-  "workflow": [
-    {
-      "task": "hydrology",
-      "action": "Fill depressions",
-      "args": {
-        "tool": "whiteboxtools",
-        "input_file": "uploads/input.tif",
-        "output_file": "filled_dem.tif"
-      }
-    },
-    {
-      "task": "hydrology",
-      "action": "Calculate flow accumulation",
-      "args": {
-        "tool": "whiteboxtools",
-        "input_file": "filled_dem.tif",
-        "output_file": "flow_accum.tif"
-      }
-    },
-    {
-      "task": "risk_analysis",
-      "action": "Classify flood risk",
-      "args": {
-        "tool": "rasterio",
-        "input_file": "flow_accum.tif",
-        "output_file": "flood_risk_levels.tif"
-      }
-    }
-  ]
-}
-
-Generate site suitability map from DEM for Chennai:
-{
-  "workflow": [
-    {
-      "task": "boundary",
-      "action": "Download city boundary",
-      "args": {
-        "tool": "osmnx",
-        "input_file": "Chennai",
-        "output_file": "chennai_boundary.geojson"
-      }
-    },
-    {
-      "task": "preprocessing",
-      "action": "Clip DEM using boundary",
-      "args": {
-        "tool": "rasterio",
-        "input_file": "uploads/input.tif",
-        "output_file": "clipped_chennai.tif"
-      }
-    },
-    {
-      "task": "terrain",
-      "action": "Calculate slope",
-      "args": {
-        "tool": "whiteboxtools",
-        "input_file": "clipped_chennai.tif",
-        "output_file": "chennai_slope.tif"
-      }
-    },
-    {
-      "task": "suitability",
-      "action": "Classify elevation and slope",
-      "args": {
-        "tool": "rasterio",
-        "input_file": "clipped_chennai.tif",
-        "output_file": "site_suitability.tif"
-      }
-    }
-  ]
-}
-
-Generate land cover classification from Sentinel-2 bands for Chennai:
-{
-  "workflow": [
-    {
-      "task": "landcover",
-      "action": "Stack Sentinel bands B02, B03, B04, B08",
-      "args": {
-        "tool": "rasterio",
-        "input_file": "uploads/B02,B03,B04,B08.jp2",
-        "output_file": "sentinel_stacked.tif"
-      }
-    },
-    {
-      "task": "landcover",
-      "action": "Compute NDVI",
-      "args": {
-        "tool": "rasterio",
-        "input_file": "sentinel_stacked.tif",
-        "output_file": "ndvi.tif"
-      }
-    },
-    {
-      "task": "landcover",
-      "action": "Classify LULC from NDVI",
-      "args": {
-        "tool": "rasterio",
-        "input_file": "ndvi.tif",
-        "output_file": "lulc_class.tif"
-      }
-    }
-  ]
-}
-
-After the JSON, add reasoning like:
-Reasoning:
-1. Since the task involves DEM, we first fill depressions.
-2. Then calculate flow accumulation...
-3. Classify using raster thresholds, etc.
-"""
-    prompt_input = f"[INST] {system_prompt.strip()} Task: {prompt.strip()} [/INST]"
-    resp = llm.create_completion(
-        prompt=prompt_input,
-        max_tokens=1024,
-        temperature=0.7,
-        stop=["</s>", "[INST]"]
-    )
-    text = resp["choices"][0]["text"]
-
-    # Save full CoT reasoning
-    with open(cot_path, "w", encoding="utf-8") as f:
-        f.write(text.strip())
-
+server_url = os.environ.get("WORKFLOW_SERVER_URL", "http://127.0.0.1:8765")
+
+
+class WorkflowGenerator:
+    # Holds one resident Llama instance. The shared system prompt is evaluated
+    # once into a saved llama.cpp state and restored before every request, so
+    # only the task tokens go through prompt processing.
+    def __init__(self, model_path=model_path, n_ctx=2048, n_threads=4, seed=1337, prefix_cache=None):
+        start = time.perf_counter()
+        self.llm = Llama(
+            model_path=model_path,
+            n_ctx=n_ctx,
+            n_threads=n_threads,
+            seed=seed
+        )
+        self.load_seconds = time.perf_counter() - start
+        self.prefix_cache = prefix_cache or PrefixStateCache()
+        self.prefix_tokens = self.llm.tokenize(PROMPT_PREFIX.encode("utf-8"), add_bos=True, special=True)
+        self.requests_served = 0
+        self._lock = threading.Lock()
+
+    def generate(self, prompt: str, max_tokens=1024, temperature=0.7):
+        with self._lock:
+            start = time.perf_counter()
+            prefix_source = self.prefix_cache.restore(self.llm, self.prefix_tokens)
+            task_tokens = self.llm.tokenize(prompt_suffix(prompt).encode("utf-8"), add_bos=False, special=True)
+
+            first_token_seconds = None
+            chunks = []
+            for chunk in self.llm.create_completion(
+                prompt=self.prefix_tokens + task_tokens,
+                max_tokens=max_tokens,
+                temperature=temperature,
+                stop=["</s>", "[INST]"],
+                stream=True
+            ):
+                if first_token_seconds is None:
+                    first_token_seconds = time.perf_counter() - start
+                chunks.append(chunk["choices"][0]["text"])
+            self.requests_served += 1
+
+        stats = {
+            "load_seconds": round(self.load_seconds, 3),
+            "first_token_seconds": round(first_token_seconds or 0.0, 3),
+            "total_seconds": round(time.perf_counter() - start, 3),
+            "prefix_tokens": len(self.prefix_tokens),
+            "task_tokens": len(task_tokens),
+            "prefix_source": prefix_source,
+            "completion_chunks": len(chunks),
+            "requests_served": self.requests_served,
+        }
+        return "".join(chunks), stats
+
+
+_generator = None
+_generator_lock = threading.Lock()
+
+
+def get_generator() -> WorkflowGenerator:
+    global _generator
+    with _generator_lock:
+        if _generator is None:
+            _generator = WorkflowGenerator()
+    return _generator
+
+
+def parse_workflow(text: str):
     # Extract JSON from response
     json_blocks = re.findall(r"\{(?:[^{}]|(?R))*\}", text, re.DOTALL)
     snippet = json_blocks[0] if json_blocks else ""
@@ -172,19 +87,90 @@ Reasoning:
     if not snippet.strip():
         raise ValueError("No JSON object found.")
 
-    workflow_data = json.loads(snippet)
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    return json.loads(snippet)
 
+
+def write_workflow(workflow_data, text: str):
+    # Save full CoT reasoning
+    with open(cot_path, "w", encoding="utf-8") as f:
+        f.write(text.strip())
+
+    os.makedirs(os.path.dirname(output_path), exist_ok=True)
     with open(output_path, "w", encoding="utf-8") as f:
         json.dump(workflow_data, f, indent=2)
 
+    return workflow_data
+
+
+def save_workflow(text: str):
+    return write_workflow(parse_workflow(text), text)
+
+
+def plan_workflow(prompt: str, get_model=get_generator, hint=None):
+    # Template planner first; get_model() (which loads the model) is only called for prompts it can't plan.
+    # Returns (workflow, reasoning text, info) without saving; only the CLI saves them (write_workflow)
+    planner = get_planner(model_path)
+    return planner.plan(prompt, generate=lambda p: get_model().generate(p), parse=parse_workflow, hint=hint)
+
+
+def print_plan(info):
+    if info["source"] == "template":
+        print(f"⚡ Planned from the {info['intent']} template ({info['match']}) in {info['seconds'] * 1000:.1f} ms, no LLM call.")
+    elif info["source"] == "cache":
+        print(f"♻️ Reused the cached LLM workflow for this prompt ({info['reason']}).")
+    else:
+        print(f"⏱️ Model load: {info['load_seconds']}s | First token: {info['first_token_seconds']}s | Total: {info['total_seconds']}s")
+
+
+def get_workflow_from_prompt(prompt: str, generator=None):
+    workflow, text, info = plan_workflow(prompt, (lambda: generator) if generator else get_generator)
+    write_workflow(workflow, text)
+
     print("✅ Workflow saved.")
     print(f"📘 Reasoning saved to: {cot_path}")
+    print_plan(info)
+    return info
+
+
+def request_from_server(prompt: str, timeout=600):
+    # Ask a running workflow_server.py daemon; returns None when none is listening
+    import urllib.error
+    import urllib.request
+
+    body = json.dumps({"prompt": prompt}).encode("utf-8")
+    req = urllib.request.Request(f"{server_url}/generate", data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            return json.loads(resp.read().decode("utf-8"))
+    except urllib.error.HTTPError as e:
+        return json.loads(e.read().decode("utf-8") or "{}") or {"error": str(e)}
+    except urllib.error.URLError:
+        return None
 
 # Entry point
 if __name__ == "__main__":
     if len(sys.argv) > 1:
         prompt_text = " ".join(sys.argv[1:])
-        get_workflow_from_prompt(prompt_text)
+        planned = get_planner(model_path).plan(prompt_text)
+        result = None if planned else request_from_server(prompt_text)
+        if planned:
+            write_workflow(planned[0], planned[1])
+            print("✅ Workflow saved.")
+            print(f"📘 Reasoning saved to: {cot_path}")
+            print_plan(planned[2])
+        elif result is None:
+            get_workflow_from_prompt(prompt_text)
+        elif "error" in result:
+            print(f"❌ {result['error']}")
+            sys.exit(1)
+        else:
+            stats = result["stats"]
+            write_workflow(result["workflow"], result.get("reasoning", ""))
+            print("✅ Workflow saved (served by resident model).")
+            print(f"📘 Reasoning saved to: {cot_path}")
+            if "first_token_seconds" in stats:
+                print(f"⏱️ First token: {stats['first_token_seconds']}s | Total: {stats['total_seconds']}s")
+            else:
+                print_plan(stats)
     else:
-        print("❌ Please provide prompt as command-line argument.")
\ No newline at end of file
+        print("❌ Please provide prompt as command-line argument.")
@@ -0,0 +1,172 @@
+# rag/hydrology.py
+# In-process D8 hydrology on NumPy arrays (in-memory or np.memmap): depression
+# filling, D8 pointer and flow accumulation, chained without intermediate files.
+# Selected with "engine": "numpy" in the workflow JSON; WhiteboxTools remains
+# the default engine. This is a fallback for small DEMs and for machines
+# without the WhiteboxTools binary, not a faster engine: depression filling is
+# a pure-Python priority queue over a list copy of the DEM (~1.5 s and ~100 MB
+# per megapixel, even for a memmap DEM), slower than WhiteboxTools on large
+# DEMs, so it refuses DEMs above NUMPY_FILL_MAX_CELLS.
+import heapq
+import math
+import os
+from collections import deque
+import numpy as np
+import rasterio
+from cog import write_cog
+
+# (row offset, col offset, WhiteboxTools D8 pointer code)
+D8_NEIGHBOURS = [
+    (-1, 1, 1),     # NE
+    (0, 1, 2),      # E
+    (1, 1, 4),      # SE
+    (1, 0, 8),      # S
+    (1, -1, 16),    # SW
+    (0, -1, 32),    # W
+    (-1, -1, 64),   # NW
+    (-1, 0, 128),   # N
+]
+FLOW_NODATA = -32768.0
+# 16 million cells (4000 x 4000) take ~25 s and ~1.6 GB to fill
+FILL_MAX_CELLS = int(float(os.environ.get("NUMPY_FILL_MAX_CELLS", 16e6)))
+
+
+def dem_from_array(array, nodata=None):
+    # float64 DEM with NaN for nodata, and the valid-cell mask
+    dem = np.asarray(array, dtype=np.float64)
+    valid = np.isfinite(dem)
+    if nodata is not None:
+        valid &= dem != nodata
+    return np.where(valid, dem, np.nan), valid
+
+
+def read_dem(path):
+    with rasterio.open(path) as src:
+        dem, valid = dem_from_array(src.read(1), src.nodata)
+        profile = src.profile
+    return dem, profile, valid
+
+
+def _edge_cells(valid):
+    # Valid cells on the raster edge or next to nodata: where water can leave
+    padded = np.pad(~valid, 1, constant_values=True)
+    rows, cols = valid.shape
+    touches_outside = np.zeros_like(valid)
+    for dr, dc, _ in D8_NEIGHBOURS:
+        touches_outside |= padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+    return np.flatnonzero(valid & touches_outside)
+
+
+def fill_depressions(dem, valid=None):
+    # Priority-Flood+epsilon (Barnes et al. 2014): fills pits and gives flats a
+    # tiny gradient toward the outlet so every cell drains in the D8 step.
+    rows, cols = dem.shape
+    if rows * cols > FILL_MAX_CELLS:
+        raise ValueError(
+            f"❌ The numpy engine fills DEMs of up to {FILL_MAX_CELLS:,} cells (NUMPY_FILL_MAX_CELLS); "
+            f"this one has {rows * cols:,}. Use the default WhiteboxTools engine for larger DEMs."
+        )
+    if valid is None:
+        valid = np.isfinite(dem)
+    z = np.asarray(dem, dtype=np.float64).ravel().tolist()
+    closed = bytearray(np.ascontiguousarray(~valid, dtype=np.uint8).tobytes())
+
+    heap = []
+    for i in _edge_cells(valid).tolist():
+        closed[i] = 1
+        heap.append((z[i], i))
+    heapq.heapify(heap)
+    pit = deque()
+    neighbours = [(dr, dc, dr * cols + dc) for dr, dc, _ in D8_NEIGHBOURS]
+    inf = math.inf
+
+    while heap or pit:
+        c = pit.popleft() if pit else heapq.heappop(heap)[1]
+        zc = z[c]
+        r, col = divmod(c, cols)
+        for dr, dc, delta in neighbours:
+            rr, cc = r + dr, col + dc
+            if rr < 0 or rr >= rows or cc < 0 or cc >= cols:
+                continue
+            n = c + delta
+            if closed[n]:
+                continue
+            closed[n] = 1
+            if z[n] <= zc:
+                z[n] = math.nextafter(zc, inf)
+                pit.append(n)
+            else:
+                heapq.heappush(heap, (z[n], n))
+
+    filled = np.array(z, dtype=np.float64).reshape(rows, cols)
+    filled[~valid] = np.nan
+    return filled
+
+
+def d8_pointer(filled, valid=None, cell_size=(1.0, 1.0)):
+    # Steepest-descent neighbour per cell as a WhiteboxTools-style code; 0 = no outflow
+    rows, cols = filled.shape
+    if valid is None:
+        valid = np.isfinite(filled)
+    size_x, size_y = abs(cell_size[0]), abs(cell_size[1])
+    padded = np.pad(np.where(valid, filled, np.inf), 1, constant_values=np.inf)
+
+    pointer = np.zeros((rows, cols), dtype=np.uint8)
+    best = np.zeros((rows, cols), dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        for dr, dc, code in D8_NEIGHBOURS:
+            distance = math.hypot(dr * size_y, dc * size_x)
+            drop = (filled - padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]) / distance
+            steeper = drop > best
+            pointer[steeper] = code
+            best[steeper] = drop[steeper]
+    pointer[~valid] = 0
+    return pointer
+
+
+def d8_flow_accumulation(pointer, valid=None):
+    # Contributing cells (including the cell itself), processed in topological
+    # order: each wave moves the cells whose upstream neighbours are all done.
+    rows, cols = pointer.shape
+    if valid is None:
+        valid = np.ones(pointer.shape, dtype=bool)
+    flat_pointer = pointer.ravel()
+
+    target = np.full(flat_pointer.size, -1, dtype=np.int64)
+    for dr, dc, code in D8_NEIGHBOURS:
+        cells = np.flatnonzero(flat_pointer == code)
+        target[cells] = cells + dr * cols + dc
+
+    has_target = target >= 0
+    indegree = np.bincount(target[has_target], minlength=flat_pointer.size)
+    acc = valid.ravel().astype(np.float64)
+
+    frontier = np.flatnonzero((indegree == 0) & valid.ravel())
+    while frontier.size:
+        sources = frontier[has_target[frontier]]
+        if sources.size == 0:
+            break
+        receivers, inverse = np.unique(target[sources], return_inverse=True)
+        acc[receivers] += np.bincount(inverse, weights=acc[sources])
+        indegree[receivers] -= np.bincount(inverse)
+        frontier = receivers[indegree[receivers] == 0]
+
+    acc = acc.reshape(rows, cols)
+    acc[~valid] = FLOW_NODATA
+    return acc
+
+
+def flow_accumulation_from_dem(dem, valid=None, cell_size=(1.0, 1.0), fill=True):
+    # Full chain on arrays: fill -> D8 pointer -> accumulation
+    if valid is None:
+        valid = np.isfinite(dem)
+    filled = fill_depressions(dem, valid) if fill else dem
+    pointer = d8_pointer(filled, valid, cell_size)
+    return d8_flow_accumulation(pointer, valid)
+
+
+def write_raster(path, array, profile, dtype="float32", nodata=FLOW_NODATA):
+    profile = dict(profile)
+    profile.update(count=1, dtype=dtype, nodata=nodata)
+    data = np.where(np.isfinite(array), array, nodata).astype(dtype)
+    return write_cog(path, data, profile)
@@ -1,20 +1,147 @@
+# rag/ingest_docs.py
+# Incremental ingestion of rag/docs into the FAISS store. A manifest of file
+# and chunk content hashes lets repeat runs embed only new or changed chunks
+# and drop the vectors of deleted files.
+#   python rag/ingest_docs.py [--batch-size 64] [--workers 4] [--rebuild]
+#                             [--index-type ivf --param nlist=128 --param nprobe=16]
+import argparse
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
 from langchain.embeddings import HuggingFaceEmbeddings
 from langchain.vectorstores import FAISS
 from langchain.document_loaders import TextLoader
 from langchain.text_splitter import CharacterTextSplitter
-import os
+from ann_index import INDEX_TYPES, load_config, save_config, write_ann_index
 
 docs_path = "rag/docs"
-texts = []
+db_path = "rag/rag_db"
+manifest_path = os.path.join(db_path, "manifest.json")
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
+
+
+def sha256_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def load_manifest():
+    if os.path.exists(manifest_path):
+        with open(manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+    return {"files": {}}
+
+
+def save_manifest(manifest):
+    tmp_path = f"{manifest_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+
+def split_file(path, text_splitter):
+    return text_splitter.split_documents(TextLoader(path).load())
+
+
+def embed_in_batches(embeddings, texts, batch_size, workers):
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if not batches:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        results = pool.map(embeddings.embed_documents, batches)
+    return [vector for batch in results for vector in batch]
+
+
+def ingest(batch_size=64, workers=4, rebuild=False, index_type=None, params=None):
+    text_splitter = CharacterTextSplitter(chunk_size=800, chunk_overlap=100)
+    embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+
+    index_exists = os.path.exists(os.path.join(db_path, "index.faiss"))
+    manifest = load_manifest() if index_exists and not rebuild else {"files": {}}
+    db = FAISS.load_local(db_path, embeddings) if index_exists and not rebuild else None
+    if db is not None and not manifest["files"]:
+        # Index predates the manifest: chunk ids are unknown, so rebuild once
+        print("ℹ️ No manifest for existing index, rebuilding.")
+        db = None
+
+    current = {}
+    for file in sorted(os.listdir(docs_path)):
+        if file.endswith(".txt"):
+            path = os.path.join(docs_path, file)
+            with open(path, "rb") as f:
+                current[file] = (path, hashlib.sha256(f.read()).hexdigest())
+
+    stale_ids = []
+    new_chunks = []  # (file, chunk_id, document)
+    files = {}
+    for file, (path, file_hash) in current.items():
+        previous = manifest["files"].get(file)
+        if previous and previous["sha256"] == file_hash:
+            files[file] = previous
+            continue
+
+        old_chunks = previous["chunks"] if previous else {}
+        chunk_ids = {}
+        for doc in split_file(path, text_splitter):
+            chunk_hash = sha256_text(doc.page_content)
+            if chunk_hash in chunk_ids:
+                continue
+            chunk_id = sha256_text(f"{file}\0{chunk_hash}")
+            chunk_ids[chunk_hash] = chunk_id
+            if chunk_hash not in old_chunks or db is None:
+                new_chunks.append((file, chunk_id, doc))
+        stale_ids.extend(cid for h, cid in old_chunks.items() if h not in chunk_ids)
+        files[file] = {"sha256": file_hash, "chunks": chunk_ids}
+
+    for file, previous in manifest["files"].items():
+        if file not in current:
+            stale_ids.extend(previous["chunks"].values())
+
+    if db is not None and stale_ids:
+        db.delete(stale_ids)
+
+    if new_chunks:
+        print(f"🧮 Embedding {len(new_chunks)} chunks (batch size {batch_size}, {workers} workers)...")
+        vectors = embed_in_batches(embeddings, [doc.page_content for _, _, doc in new_chunks], batch_size, workers)
+        text_embeddings = [(doc.page_content, vec) for (_, _, doc), vec in zip(new_chunks, vectors)]
+        metadatas = [doc.metadata for _, _, doc in new_chunks]
+        ids = [chunk_id for _, chunk_id, _ in new_chunks]
+        if db is None:
+            db = FAISS.from_embeddings(text_embeddings, embeddings, metadatas=metadatas, ids=ids)
+        else:
+            db.add_embeddings(text_embeddings, metadatas=metadatas, ids=ids)
+
+    if db is None:
+        print("⚠️ No documents to index.")
+        return
+
+    db.save_local(db_path)
+    save_manifest({"files": files})
+    print(f"✅ Index updated: {len(new_chunks)} chunks embedded, {len(stale_ids)} removed, {len(files)} files tracked.")
 
-for file in os.listdir(docs_path):
-    if file.endswith(".txt"):
-        loader = TextLoader(os.path.join(docs_path, file))
-        texts.extend(loader.load())
+    config = load_config(db_path)
+    if index_type and index_type != config["index_type"]:
+        config = {"index_type": index_type, "params": dict(INDEX_TYPES[index_type])}
+    if params:
+        config["params"].update(params)
+    save_config(config, db_path)
+    ann_path = write_ann_index(db.index, config, db_path, retrain=rebuild)
+    if ann_path:
+        print(f"✅ {config['index_type']} index written: {ann_path} ({config['effective_params']})")
 
-text_splitter = CharacterTextSplitter(chunk_size=800, chunk_overlap=100)
-docs = text_splitter.split_documents(texts)
 
-embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-db = FAISS.from_documents(docs, embeddings)
-db.save_local("rag/rag_db")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Incrementally ingest rag/docs into the FAISS index")
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rebuild", action="store_true", help="Ignore the manifest and re-embed everything")
+    parser.add_argument("--index-type", choices=sorted(INDEX_TYPES), help="Search index backend (default: keep current)")
+    parser.add_argument("--param", action="append", default=[], metavar="KEY=VALUE",
+                        help="Index build/search parameter, e.g. nlist=128, nprobe=16, m=32")
+    args = parser.parse_args()
+    params = {}
+    for item in args.param:
+        key, _, value = item.partition("=")
+        params[key.strip()] = int(value)
+    ingest(batch_size=args.batch_size, workers=args.workers, rebuild=args.rebuild,
+           index_type=args.index_type, params=params)
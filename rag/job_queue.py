@@ -0,0 +1,199 @@
+# rag/job_queue.py
+# Local job queue for the Streamlit app: executor runs are submitted as jobs,
+# run as subprocesses on a bounded worker pool shared by all sessions, and keep
+# their status in SQLite and their output in rag/jobs/<id>/. Each job gets its
+# own workflow copy and output folder, reports per-step progress through
+# WORKFLOW_PROGRESS_FILE (rag/workflow_engine.py), leaves a per-step trace
+# (rag/tracing.py) and can be cancelled. Finished jobs are pruned, with their
+# folders, once they are older than JOB_RETENTION_DAYS or beyond the newest
+# JOB_RETENTION_COUNT finished jobs.
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+JOBS_DIR = os.path.abspath(os.environ.get("RAG_JOBS_DIR", "rag/jobs"))
+MAX_WORKERS = int(os.environ.get("JOB_WORKERS", 2))
+CANCEL_GRACE_SECONDS = 10
+RETENTION_DAYS = float(os.environ.get("JOB_RETENTION_DAYS", 7))
+RETENTION_COUNT = int(os.environ.get("JOB_RETENTION_COUNT", 50))
+
+FINISHED = ("succeeded", "failed", "cancelled")
+
+
+class JobQueue:
+    def __init__(self, jobs_dir=JOBS_DIR, max_workers=MAX_WORKERS,
+                 retention_days=RETENTION_DAYS, retention_count=RETENTION_COUNT):
+        self.jobs_dir = jobs_dir
+        self.retention_days = retention_days
+        self.retention_count = retention_count
+        self.db_path = os.path.join(jobs_dir, "jobs.sqlite")
+        os.makedirs(jobs_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max(1, max_workers), thread_name_prefix="job")
+        self._procs = {}
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                "id TEXT PRIMARY KEY, kind TEXT, script TEXT, status TEXT, workdir TEXT, "
+                "submitted REAL, started REAL, finished REAL, returncode INTEGER)"
+            )
+            # Jobs of a previous server process can't be resumed
+            conn.execute(
+                "UPDATE jobs SET status = 'failed', finished = ? WHERE status IN ('queued', 'running')",
+                (time.time(),),
+            )
+        self.prune()
+
+    def _connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def _update(self, job_id, **fields):
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._connect() as conn:
+            conn.execute(f"UPDATE jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    def paths(self, job_id):
+        workdir = os.path.join(self.jobs_dir, job_id)
+        return {
+            "workdir": workdir,
+            "workflow": os.path.join(workdir, "workflow.json"),
+            "outputs": os.path.join(workdir, "outputs"),
+            "log": os.path.join(workdir, "job.log"),
+            "progress": os.path.join(workdir, "progress.jsonl"),
+            "trace": os.path.join(workdir, "trace.json"),
+        }
+
+    def prune(self):
+        # Drop finished jobs past the retention age or count; queued and running jobs are never touched
+        cutoff = time.time() - self.retention_days * 86400
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT id, finished FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED))}) "
+                "ORDER BY finished DESC",
+                FINISHED,
+            ).fetchall()
+            expired = [job_id for rank, (job_id, finished) in enumerate(rows)
+                       if rank >= self.retention_count or (finished or 0) < cutoff]
+            conn.executemany("DELETE FROM jobs WHERE id = ?", [(job_id,) for job_id in expired])
+        for job_id in expired:
+            shutil.rmtree(self.paths(job_id)["workdir"], ignore_errors=True)
+        return expired
+
+    def submit(self, kind, script, workflow=None, env=None):
+        self.prune()
+        job_id = uuid.uuid4().hex[:12]
+        paths = self.paths(job_id)
+        os.makedirs(paths["outputs"], exist_ok=True)
+        # Snapshot of the workflow at submission; later edits don't affect the job
+        if workflow is not None:
+            with open(paths["workflow"], "w") as f:
+                json.dump(workflow, f, indent=2)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, script, status, workdir, submitted) VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, script, paths["workdir"], time.time()),
+            )
+        self._pool.submit(self._run, job_id, script, dict(env or {}))
+        return job_id
+
+    def _run(self, job_id, script, extra_env):
+        paths = self.paths(job_id)
+        env = dict(os.environ)
+        env.update(
+            RAG_OUTPUT_DIR=paths["outputs"],
+            RAG_WORKFLOW_PATH=paths["workflow"],
+            WORKFLOW_PROGRESS_FILE=paths["progress"],
+            WORKFLOW_TRACE_FILE=paths["trace"],
+            PYTHONUNBUFFERED="1",
+        )
+        env.update(extra_env)
+        with self._lock:
+            if job_id in self._cancelled:
+                return
+            log = open(paths["log"], "w", encoding="utf-8")
+            proc = subprocess.Popen([sys.executable, script], stdout=log, stderr=subprocess.STDOUT, env=env)
+            self._procs[job_id] = proc
+        self._update(job_id, status="running", started=time.time())
+        try:
+            returncode = proc.wait()
+        finally:
+            log.close()
+            with self._lock:
+                self._procs.pop(job_id, None)
+                cancelled = job_id in self._cancelled
+        status = "cancelled" if cancelled else ("succeeded" if returncode == 0 else "failed")
+        self._update(job_id, status=status, finished=time.time(), returncode=returncode)
+
+    def cancel(self, job_id):
+        with self._lock:
+            self._cancelled.add(job_id)
+            proc = self._procs.get(job_id)
+        if proc is None:
+            # Still queued: _run will skip it
+            if self.status(job_id)["status"] == "queued":
+                self._update(job_id, status="cancelled", finished=time.time())
+            return
+        proc.terminate()
+        # Escalate in the background so the caller (a Streamlit rerun) never blocks
+        threading.Thread(target=self._kill_after_grace, args=(proc,), daemon=True).start()
+
+    def _kill_after_grace(self, proc):
+        try:
+            proc.wait(timeout=CANCEL_GRACE_SECONDS)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    def status(self, job_id):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            raise KeyError(f"❌ Unknown job {job_id}")
+        return dict(row)
+
+    def progress(self, job_id):
+        # {"steps": [...], "done": {step: seconds}, "running": [...], "failed": {step: error}}
+        state = {"steps": [], "done": {}, "running": [], "failed": {}}
+        path = self.paths(job_id)["progress"]
+        if not os.path.exists(path):
+            return state
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    event = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # partially written last line
+                step = event.get("step")
+                if event["status"] == "planned":
+                    state["steps"] = event["steps"]
+                elif event["status"] == "started":
+                    state["running"].append(step)
+                elif step in state["running"]:
+                    state["running"].remove(step)
+                    if event["status"] == "done":
+                        state["done"][step] = event["seconds"]
+                    else:
+                        state["failed"][step] = event.get("error", "")
+        return state
+
+    def log(self, job_id, tail_bytes=20000):
+        path = self.paths(job_id)["log"]
+        if not os.path.exists(path):
+            return ""
+        with open(path, "rb") as f:
+            f.seek(max(0, os.path.getsize(path) - tail_bytes))
+            return f.read().decode("utf-8", errors="replace")
+
+    def list_jobs(self, limit=50):
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            rows = conn.execute("SELECT * FROM jobs ORDER BY submitted DESC LIMIT ?", (limit,)).fetchall()
+        return [dict(row) for row in rows]
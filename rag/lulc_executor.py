@@ -1,83 +1,196 @@
+import json
 import rasterio
 import numpy as np
 import os
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
+import threading
+from contextlib import ExitStack
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor
+from clip_engine import DEFAULT_BLOCK_SIZE, block_windows, tiled_profile
+from reclassify import LULC_CLASSES
+from raster_handle import RasterHandle, StepResults, fits_in_memory, workflow_outputs
+from workflow_engine import Step, execute, print_timings
+from step_cache import cached
+from preview import render_preview
 
-UPLOAD_DIR = "rag/uploads"
-OUTPUT_DIR = "rag/outputs"
+# Job runs (rag/job_queue.py) get their own band folder, output folder and workflow copy
+UPLOAD_DIR = os.environ.get("RAG_UPLOAD_DIR", "rag/uploads")
+OUTPUT_DIR = os.environ.get("RAG_OUTPUT_DIR", "rag/outputs")
+WORKFLOW_PATH = os.environ.get("RAG_WORKFLOW_PATH", os.path.join("rag", "workflows", "sample_workflow.json"))
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
-# Filenames must contain band identifiers
-required_bands = {"B02": None, "B03": None, "B04": None, "B08": None}
-
-# --- Locate JP2 band files ---
-for file in os.listdir(UPLOAD_DIR):
-    for band in required_bands:
-        if band in file and file.endswith(".jp2"):
-            required_bands[band] = os.path.join(UPLOAD_DIR, file)
-
-if None in required_bands.values():
-    missing = [b for b, v in required_bands.items() if v is None]
-    raise FileNotFoundError(f"❌ Missing bands: {missing}")
-
-print("🔁 Stacking bands into multiband GeoTIFF...")
-bands = []
-for band_name in ["B02", "B03", "B04", "B08"]:
-    with rasterio.open(required_bands[band_name]) as src:
-        band_data = src.read(1)
-        bands.append(band_data)
-        profile = src.profile
-
-stacked = np.stack(bands)
-profile.update(count=4,driver="GTiff")
-stacked_tif = os.path.join(OUTPUT_DIR, "sentinel_stacked.tif")
-with rasterio.open(stacked_tif, "w", **profile) as dst:
-    dst.write(stacked)
-print(f"✅ Stacked image saved: {stacked_tif}")
-
-# --- NDVI & LULC ---
-print("🌱 Computing NDVI and classifying into 5 LULC classes...")
-
-blue, green, red, nir = stacked
-ndvi = (nir.astype("float32") - red) / (nir + red + 1e-6)
-
-# Save NDVI
-ndvi_tif = os.path.join(OUTPUT_DIR, "ndvi.tif")
-meta = profile.copy()
-meta.update(count=1, dtype=rasterio.float32)
-with rasterio.open(ndvi_tif, "w", **meta) as dst:
-    dst.write(ndvi, 1)
-
-# --- LULC Classification ---
-lulc = np.zeros_like(ndvi, dtype=np.uint8)
-lulc[ndvi < 0.0] = 1         # Water
-lulc[(ndvi >= 0.0) & (ndvi < 0.2)] = 2   # Barren
-lulc[(ndvi >= 0.2) & (ndvi < 0.4)] = 3   # Built-up
-lulc[(ndvi >= 0.4) & (ndvi < 0.6)] = 4   # Sparse Vegetation
-lulc[ndvi >= 0.6] = 5                   # Dense Vegetation
-
-# Save LULC raster
-lulc_tif = os.path.join(OUTPUT_DIR, "lulc_class.tif")
-meta.update(dtype=rasterio.uint8)
-with rasterio.open(lulc_tif, "w", **meta) as dst:
-    dst.write(lulc, 1)
-
-# --- Plot ---
-cmap = ListedColormap(["blue", "tan", "gray", "yellowgreen", "green"])
-labels = ["Water", "Barren", "Built-up", "Sparse Veg", "Dense Veg"]
-colors = dict(zip(range(1, 6), labels))
-
-plt.figure(figsize=(10, 6))
-im = plt.imshow(lulc, cmap=cmap, vmin=1, vmax=5)
-cbar = plt.colorbar(im, ticks=[1, 2, 3, 4, 5])
-cbar.ax.set_yticklabels(labels)
-plt.title("Land Use / Land Cover Classification")
-plt.axis("off")
-plt.tight_layout()
-
-lulc_map = os.path.join(OUTPUT_DIR, "lulc_map.png")
-plt.savefig(lulc_map)
-plt.close()
-
-print(f"🗺️ LULC Map saved to: {lulc_map}")
+BAND_ORDER = ["B02", "B03", "B04", "B08"]
+BAND_EXTENSIONS = (".jp2", ".tif", ".tiff")
+LULC_TIF = "lulc_class.tif"
+RASTER_OUTPUTS = ["sentinel_stacked.tif", "ndvi.tif", LULC_TIF]
+WORKERS = int(os.environ.get("LULC_WORKERS", os.cpu_count() or 4))
+
+
+def find_band_files(upload_dir=UPLOAD_DIR):
+    # Filenames must contain band identifiers
+    required_bands = {"B02": None, "B03": None, "B04": None, "B08": None}
+
+    # --- Locate JP2 (or GeoTIFF) band files ---
+    for file in os.listdir(upload_dir):
+        for band in required_bands:
+            if band in file and file.lower().endswith(BAND_EXTENSIONS):
+                required_bands[band] = os.path.join(upload_dir, file)
+
+    if None in required_bands.values():
+        missing = [b for b, v in required_bands.items() if v is None]
+        raise FileNotFoundError(f"❌ Missing bands: {missing}")
+    return required_bands
+
+
+def classify_window(red, nir):
+    # NDVI and the 5 LULC classes in one pass over the window
+    red = red.astype("float32")
+    nir = nir.astype("float32")
+    ndvi = (nir - red) / (nir + red + 1e-6)
+
+    # 1 Water, 2 Barren, 3 Built-up, 4 Sparse Vegetation, 5 Dense Vegetation
+    lulc = LULC_CLASSES(ndvi)
+    return ndvi, lulc
+
+
+def process_windows(band_paths, windows, handle_result, workers=WORKERS):
+    # Each worker thread keeps its own dataset handles (GDAL handles are not
+    # thread-safe); rasterio releases the GIL while decoding JP2 tiles.
+    local = threading.local()
+    opened = []
+    opened_lock = threading.Lock()
+
+    def sources():
+        if not hasattr(local, "srcs"):
+            local.srcs = [rasterio.open(band_paths[b]) for b in BAND_ORDER]
+            with opened_lock:
+                opened.extend(local.srcs)
+        return local.srcs
+
+    def work(window):
+        bands = [src.read(1, window=window) for src in sources()]
+        ndvi, lulc = classify_window(bands[2], bands[3])
+        return window, bands, ndvi, lulc
+
+    # Bound the number of windows in flight so results never pile up in memory
+    max_in_flight = max(1, workers * 2)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+            pending = []
+            for window in windows:
+                pending.append(pool.submit(work, window))
+                if len(pending) >= max_in_flight:
+                    handle_result(*pending.pop(0).result())
+            for future in pending:
+                handle_result(*future.result())
+    finally:
+        for src in opened:
+            src.close()
+
+
+def check_band(path):
+    # Header only: grid and internal tiling of one band
+    with rasterio.open(path) as src:
+        return {"profile": src.profile, "grid": (src.width, src.height, src.transform),
+                "block_shape": src.block_shapes[0]}
+
+
+def run_lulc_workflow(upload_dir=UPLOAD_DIR, output_dir=OUTPUT_DIR, block_size=DEFAULT_BLOCK_SIZE, workers=WORKERS,
+                      outputs=None):
+    band_paths = find_band_files(upload_dir)
+    bands = {}
+
+    def check(name):
+        bands[name] = check_band(band_paths[name])
+
+    def classify():
+        classify_bands(band_paths, bands, results, block_size, workers)
+
+    def render():
+        lulc = results.get(LULC_TIF)
+        render_lulc_map(lulc.array if lulc.in_memory else lulc.path, output_dir)
+
+    with StepResults(output_dir, outputs, search_dirs=[upload_dir]) as results:
+        # The four band headers are read concurrently, then the fused
+        # stack/NDVI/classify pass runs (itself window-parallel), then the map.
+        # The fused pass is memoized on the band contents (rag/step_cache.py).
+        band_files = [band_paths[name] for name in BAND_ORDER]
+        cached_outputs = [name for name in RASTER_OUTPUTS if name == LULC_TIF or results.wants(name)]
+        steps = [Step(f"Check {name}", partial(check, name), inputs=[band_paths[name]], outputs=[name])
+                 for name in BAND_ORDER]
+        steps.append(Step("Stack, NDVI and classify",
+                          cached(results, {"step": "lulc"}, band_files, cached_outputs, classify),
+                          inputs=BAND_ORDER, outputs=[LULC_TIF]))
+        steps.append(Step("Render map", render, inputs=[LULC_TIF], outputs=["lulc_map.png"]))
+        print_timings(execute(steps))
+        lulc = results.get(LULC_TIF)
+        # The class array, or the written file when it was too large to keep in memory
+        return lulc.array if lulc.in_memory else (lulc.path if results.wants(LULC_TIF) else None)
+
+
+def classify_bands(band_paths, bands, results, block_size=DEFAULT_BLOCK_SIZE, workers=WORKERS):
+    reference = bands["B02"]
+    profile = reference["profile"]
+    # Walk the band's own internal tiles when it has them
+    block_h, block_w = reference["block_shape"]
+    if block_w < profile["width"] and block_h < profile["height"]:
+        block_size = max(block_size, min(block_h, block_w))
+    for name in BAND_ORDER[1:]:
+        if bands[name]["grid"] != reference["grid"]:
+            raise ValueError(f"❌ Band {name} is not on the same grid as B02.")
+
+    stacked_profile = tiled_profile(profile, block_size)
+    stacked_profile.update(count=4, driver="GTiff")
+    meta = stacked_profile.copy()
+    meta.update(count=1, dtype=rasterio.float32)
+    lulc_meta = meta.copy()
+    lulc_meta.update(dtype=rasterio.uint8)
+
+    # Only the rasters listed in the workflow's "outputs" are written (all by default);
+    # the LULC classes are also kept in memory for the map when they fit, else
+    # they always go to a file (scratch unless requested).
+    keep_lulc = fits_in_memory(profile["width"], profile["height"], "uint8")
+    targets = dict(zip(RASTER_OUTPUTS, [stacked_profile, meta, lulc_meta]))
+    targets = {name: p for name, p in targets.items() if results.wants(name) or (name == LULC_TIF and not keep_lulc)}
+    lulc = np.zeros((profile["height"], profile["width"]), dtype=np.uint8) if keep_lulc else None
+
+    print("🔁 Stacking bands, computing NDVI and classifying into 5 LULC classes (windowed)...")
+    windows = list(block_windows(profile["width"], profile["height"], stacked_profile["blockxsize"]))
+    with ExitStack() as stack:
+        dsts = {name: stack.enter_context(rasterio.open(results.target_path(name), "w", **p))
+                for name, p in targets.items()}
+
+        # Writes happen on this thread, one window at a time
+        def write(window, bands, ndvi, lulc_block):
+            if lulc is not None:
+                rows, cols = window.toslices()
+                lulc[rows, cols] = lulc_block
+            if "sentinel_stacked.tif" in dsts:
+                dsts["sentinel_stacked.tif"].write(np.stack(bands), window=window)
+            if "ndvi.tif" in dsts:
+                dsts["ndvi.tif"].write(ndvi, 1, window=window)
+            if "lulc_class.tif" in dsts:
+                dsts["lulc_class.tif"].write(lulc_block, 1, window=window)
+
+        process_windows(band_paths, windows, write, workers)
+
+    for name in targets:
+        if name != LULC_TIF:
+            results.put(RasterHandle(name, path=results.target_path(name)))
+    lulc_path = results.target_path(LULC_TIF) if LULC_TIF in targets else None
+    results.put(RasterHandle(LULC_TIF, lulc, lulc_meta, path=lulc_path), dtype="uint8")
+    return lulc
+
+
+def render_lulc_map(lulc, output_dir=OUTPUT_DIR):
+    lulc_map = render_preview(lulc, "lulc", os.path.join(output_dir, "lulc_map.png"))
+    print(f"🗺️ LULC Map saved to: {lulc_map}")
+    return lulc_map
+
+
+if __name__ == "__main__":
+    outputs = None
+    if os.path.exists(WORKFLOW_PATH):
+        with open(WORKFLOW_PATH) as f:
+            outputs = workflow_outputs(json.load(f))
+    run_lulc_workflow(outputs=outputs)
@@ -0,0 +1,76 @@
+# rag/prefix_cache.py
+# Saves the llama.cpp state after evaluating a fixed prompt prefix (the
+# few-shot system prompt) and restores it before each new request. States are
+# kept in memory and, when PREFIX_CACHE_DISK is set, pickled under
+# rag/models/.prefix_cache so a restarted process skips the prefix too.
+import hashlib
+import os
+import pickle
+import threading
+import time
+import numpy as np
+
+CACHE_DIR = os.path.abspath(os.environ.get("PREFIX_CACHE_DIR", "rag/models/.prefix_cache"))
+PERSIST = os.environ.get("PREFIX_CACHE_DISK", "").lower() in ("1", "true", "yes")
+
+
+class PrefixStateCache:
+    def __init__(self, cache_dir=CACHE_DIR, persist=PERSIST):
+        self.cache_dir = cache_dir
+        self.persist = persist
+        self._states = {}
+        self._lock = threading.Lock()
+        self.last_prime_seconds = 0.0
+
+    def key(self, llm, prefix_tokens):
+        h = hashlib.sha256()
+        h.update(os.path.basename(llm.model_path).encode("utf-8"))
+        h.update(str(llm.n_ctx()).encode("utf-8"))
+        h.update(np.asarray(prefix_tokens, dtype=np.int32).tobytes())
+        return h.hexdigest()[:32]
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.state")
+
+    def prime(self, llm, prefix_tokens):
+        # Returns (state, source) where source is "memory", "disk" or "eval"
+        key = self.key(llm, prefix_tokens)
+        with self._lock:
+            state = self._states.get(key)
+            if state is not None:
+                return state, "memory"
+
+            start = time.perf_counter()
+            path = self._disk_path(key)
+            if self.persist and os.path.exists(path):
+                with open(path, "rb") as f:
+                    state = pickle.load(f)
+                source = "disk"
+            else:
+                llm.reset()
+                llm.eval(prefix_tokens)
+                state = llm.save_state()
+                source = "eval"
+                if self.persist:
+                    os.makedirs(self.cache_dir, exist_ok=True)
+                    tmp_path = f"{path}.tmp"
+                    with open(tmp_path, "wb") as f:
+                        pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+                    os.replace(tmp_path, path)
+
+            self._states[key] = state
+            self.last_prime_seconds = time.perf_counter() - start
+            return state, source
+
+    def restore(self, llm, prefix_tokens):
+        state, source = self.prime(llm, prefix_tokens)
+        llm.load_state(state)
+        return source
+
+    def clear(self, remove_files=False):
+        with self._lock:
+            self._states.clear()
+            if remove_files and os.path.isdir(self.cache_dir):
+                for name in os.listdir(self.cache_dir):
+                    if name.endswith(".state"):
+                        os.remove(os.path.join(self.cache_dir, name))
@@ -0,0 +1,98 @@
+# rag/preview.py
+# Map previews for class rasters without a pyplot figure: the raster is read
+# decimated to the target size (rasterio out_shape, served from the COG
+# overviews when the file has them), colored with a palette lookup table and
+# written with Pillow, legend included.
+import os
+import numpy as np
+import rasterio
+from rasterio.enums import Resampling
+from PIL import Image, ImageDraw, ImageFont
+import tracing
+
+PREVIEW_SIZE = int(os.environ.get("PREVIEW_SIZE", 1024))
+NODATA_RGB = (255, 255, 255)
+
+# class value -> (RGB, label); same colors the maps have always used
+PALETTES = {
+    "flood": {
+        "title": "Flood Risk Zones",
+        "classes": {
+            0: ((173, 216, 230), "Water/Sea"),   # lightblue
+            1: ((211, 211, 211), "Safe"),        # lightgray
+            2: ((255, 255, 0), "Low"),           # yellow
+            3: ((255, 165, 0), "Medium"),        # orange
+            4: ((255, 0, 0), "High"),            # red
+        },
+    },
+    "site": {
+        "title": "Site Suitability Map",
+        "classes": {
+            1: ((128, 128, 128), "Very Low"),    # gray
+            2: ((255, 255, 224), "Low"),         # lightyellow
+            3: ((240, 230, 140), "Moderate"),    # khaki
+            4: ((143, 188, 143), "High"),        # darkseagreen
+            5: ((34, 139, 34), "Very High"),     # forestgreen
+        },
+    },
+    "lulc": {
+        "title": "Land Use / Land Cover Classification",
+        "classes": {
+            1: ((0, 0, 255), "Water"),           # blue
+            2: ((210, 180, 140), "Barren"),      # tan
+            3: ((128, 128, 128), "Built-up"),    # gray
+            4: ((154, 205, 50), "Sparse Veg"),   # yellowgreen
+            5: ((0, 128, 0), "Dense Veg"),       # green
+        },
+    },
+}
+
+
+def preview_shape(height, width, max_size=PREVIEW_SIZE):
+    scale = max(1.0, max(height, width) / max_size)
+    return max(1, int(round(height / scale))), max(1, int(round(width / scale)))
+
+
+def read_preview(source, max_size=PREVIEW_SIZE):
+    # Decimated class array from an array (strided) or a raster path (out_shape read)
+    if isinstance(source, np.ndarray):
+        height, width = source.shape
+        step = max(1, int(np.ceil(max(height, width) / max_size)))
+        return np.asarray(source[::step, ::step])
+    with rasterio.open(source) as src:
+        shape = preview_shape(src.height, src.width, max_size)
+        return src.read(1, out_shape=shape, resampling=Resampling.nearest)
+
+
+def palette_lut(palette):
+    # 256-entry RGB table; values outside the palette render as nodata
+    lut = np.array([NODATA_RGB] * 256, dtype=np.uint8)
+    for value, (rgb, _) in palette["classes"].items():
+        lut[value] = rgb
+    return lut
+
+
+def _draw_legend(draw, palette, left, top, font):
+    swatch = 14
+    for i, (rgb, label) in enumerate(palette["classes"].values()):
+        y = top + i * (swatch + 8)
+        draw.rectangle([left, y, left + swatch, y + swatch], fill=rgb, outline=(0, 0, 0))
+        draw.text((left + swatch + 8, y), label, fill=(0, 0, 0), font=font)
+
+
+def render_preview(source, kind, output_path, max_size=PREVIEW_SIZE):
+    palette = PALETTES[kind]
+    classes = read_preview(source, max_size)
+    rgb = palette_lut(palette)[classes.astype(np.uint8, copy=False)]
+    tracing.annotate(preview=f"{classes.shape[1]}×{classes.shape[0]}")
+    image = Image.fromarray(rgb, mode="RGB")
+
+    font = ImageFont.load_default()
+    title_h, legend_w, margin = 28, 130, 10
+    canvas = Image.new("RGB", (image.width + legend_w + 2 * margin, image.height + title_h + margin), "white")
+    canvas.paste(image, (margin, title_h))
+    draw = ImageDraw.Draw(canvas)
+    draw.text((margin, 8), palette["title"], fill=(0, 0, 0), font=font)
+    _draw_legend(draw, palette, image.width + 2 * margin, title_h, font)
+    canvas.save(output_path, optimize=False)
+    return output_path
@@ -0,0 +1,232 @@
+# rag/raster_handle.py
+# Step results that stay in memory between workflow steps. A handle wraps an
+# array + rasterio profile, or a file on disk; GeoTIFFs are only written for the
+# files the workflow JSON lists under "outputs" (all of them when it has none),
+# as Cloud-Optimized GeoTIFFs (rag/cog.py). Results larger than
+# IN_MEMORY_MAX_MB are never held in RAM: clips and classifications stream
+# block by block into tiled GTiffs and their handles stay file-backed.
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+import rasterio
+from clip_engine import DEFAULT_BLOCK_SIZE, block_windows, clip_to_array, tiled_profile
+from cog import finalize_cog, write_cog
+import tracing
+
+IN_MEMORY_MAX_BYTES = int(float(os.environ.get("IN_MEMORY_MAX_MB", 512)) * 2**20)
+
+
+def fits_in_memory(width, height, dtype, count=1):
+    return width * height * count * np.dtype(dtype).itemsize <= IN_MEMORY_MAX_BYTES
+
+
+def workflow_outputs(workflow_json):
+    # Top-level "outputs": ["flood_risk_levels.tif", ...]; None = materialize everything
+    outputs = workflow_json.get("outputs")
+    if outputs is None:
+        return None
+    return {os.path.basename(name.replace("\\", "/")) for name in outputs}
+
+
+def step_files(step, produced=()):
+    # (input name, output name) of a workflow step; Windows-style paths from the
+    # LLM ("rag/uploads\\x.tif") are normalized first
+    args = step.get("args", {})
+    # (a folder of DEM tiles may end in a slash)
+    input_file = args["input_file"].replace("\\", "/").rstrip("/")
+    input_name = os.path.basename(input_file)
+    output_name = os.path.basename(args["output_file"].replace("\\", "/"))
+    # An input no earlier step produces is used as given when that path exists
+    # (e.g. a folder of DEM tiles elsewhere on the server); otherwise it is
+    # looked up by name in the upload and output folders
+    if input_name not in produced and os.path.exists(input_file):
+        input_name = os.path.abspath(input_file)
+    return input_name, output_name
+
+
+class RasterHandle:
+    def __init__(self, name, array=None, profile=None, path=None):
+        if array is None and path is None:
+            raise ValueError(f"❌ No data for raster {name}")
+        self.name = name
+        self.array = array
+        self.profile = dict(profile) if profile is not None else None
+        self.path = path
+        # dtype/nodata used when written, remembered for cached copies
+        self.write_options = {"dtype": None, "nodata": None}
+        # Steps running in parallel may load the same file
+        self._lock = threading.Lock()
+
+    @property
+    def in_memory(self):
+        return self.array is not None
+
+    def meta(self):
+        if self.profile is None:
+            with rasterio.open(self.path) as src:
+                self.profile = src.profile
+        return self.profile
+
+    def describe(self):
+        # "cols×rows dtype", for traces
+        if self.array is not None:
+            rows, cols = self.array.shape[-2:]
+            return f"{cols}×{rows} {self.array.dtype.name}"
+        meta = self.meta()
+        return f"{meta['width']}×{meta['height']} {meta['dtype']}"
+
+    def read(self):
+        # Single-band array and profile, loaded from disk on first use. Large
+        # files are read for the caller but the handle stays file-backed.
+        with self._lock:
+            if self.array is not None:
+                return self.array, self.profile
+            with rasterio.open(self.path) as src:
+                array = src.read(1)
+                self.profile = src.profile
+            if fits_in_memory(array.shape[1], array.shape[0], array.dtype):
+                self.array = array
+        return array, self.profile
+
+    def blocks(self, block_size=DEFAULT_BLOCK_SIZE):
+        # (window, data) pairs: slices of the array, or windowed reads of the file
+        if self.array is not None:
+            rows, cols = self.array.shape
+            for window in block_windows(cols, rows, block_size):
+                row_slice, col_slice = window.toslices()
+                yield window, self.array[row_slice, col_slice]
+            return
+        with rasterio.open(self.path) as src:
+            for window in block_windows(src.width, src.height, block_size):
+                yield window, src.read(1, window=window)
+
+    def materialize(self, path, dtype=None, nodata=None, cog=True):
+        if self.path and os.path.abspath(path) == os.path.abspath(self.path):
+            return path
+        if self.array is None:
+            # File-backed results are copied as they are
+            shutil.copyfile(self.path, path)
+            self.path = path
+            return path
+        profile = dict(self.profile)
+        dtype = dtype or self.array.dtype.name
+        nodata = profile.get("nodata") if nodata is None else nodata
+        profile.update(count=1, dtype=dtype, nodata=nodata)
+
+        data = self.array
+        if np.issubdtype(data.dtype, np.floating) and nodata is not None:
+            data = np.where(np.isnan(data), nodata, data)
+        if cog:
+            write_cog(path, data.astype(dtype, copy=False), profile)
+        else:
+            # Scratch copies for file-based tools: plain tiled GTiff, no overviews
+            with rasterio.open(path, "w", **tiled_profile(profile)) as dst:
+                dst.write(data.astype(dtype, copy=False), 1)
+        self.path = path
+        return path
+
+
+class StepResults:
+    # Handles produced during one workflow run, keyed by file name. Inputs are
+    # looked up in memory first, then in the upload and output folders.
+    def __init__(self, output_dir, outputs=None, search_dirs=()):
+        self.output_dir = output_dir
+        self.outputs = outputs
+        self.search_dirs = list(search_dirs) + [output_dir]
+        self.handles = {}
+        # Content digests of results, filled in by the step cache
+        self.digests = {}
+        self._scratch = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __contains__(self, name):
+        return name in self.handles or self._find(name) is not None
+
+    def wants(self, name):
+        return self.outputs is None or name in self.outputs
+
+    def _find(self, name):
+        for folder in self.search_dirs:
+            path = os.path.join(folder, name)
+            if os.path.exists(path):
+                return path
+        return None
+
+    def get(self, name):
+        with self._lock:
+            if name not in self.handles:
+                path = self._find(name)
+                if path is None:
+                    raise FileNotFoundError(f"❌ Input file not found: {name}")
+                self.handles[name] = RasterHandle(name, path=path)
+            return self.handles[name]
+
+    def put(self, handle, dtype=None, nodata=None):
+        handle.write_options = {"dtype": dtype, "nodata": nodata}
+        self.handles[handle.name] = handle
+        if tracing.active():
+            tracing.annotate(rasters={handle.name: handle.describe()})
+        if self.wants(handle.name):
+            with tracing.span(f"Write {handle.name}"):
+                path = handle.materialize(os.path.join(self.output_dir, handle.name), dtype, nodata)
+                # Files written by other tools (WhiteboxTools, streamed writers) become COGs too
+                finalize_cog(path)
+            print(f"  ➤ Saved: {path}")
+        elif handle.in_memory:
+            print(f"  ➤ Kept in memory: {handle.name}")
+        return handle
+
+    def put_clip(self, name, source, boundary_gdf):
+        # Clipped DEM: in memory when it fits, else streamed to a tiled GTiff (outputs or scratch)
+        path = self.target_path(name)
+        data, profile = clip_to_array(source, boundary_gdf, max_bytes=IN_MEMORY_MAX_BYTES, spill_path=path)
+        if data is None:
+            return self.put(RasterHandle(name, profile=profile, path=path))
+        return self.put(RasterHandle(name, data[0], profile))
+
+    def put_blocks(self, name, profile, blocks, dtype, nodata=None):
+        # Result computed as (window, data) blocks: assembled in memory when it
+        # fits, else written block by block to a tiled GTiff
+        profile = dict(profile)
+        profile.update(count=1, dtype=dtype, nodata=nodata)
+        if fits_in_memory(profile["width"], profile["height"], dtype):
+            array = np.zeros((profile["height"], profile["width"]), dtype=dtype)
+            for window, data in blocks:
+                rows, cols = window.toslices()
+                array[rows, cols] = data
+            return self.put(RasterHandle(name, array, profile), dtype=dtype, nodata=nodata)
+        path = self.target_path(name)
+        with rasterio.open(path, "w", **tiled_profile(profile)) as dst:
+            for window, data in blocks:
+                dst.write(data.astype(dtype, copy=False), 1, window=window)
+        return self.put(RasterHandle(name, profile=profile, path=path), dtype=dtype, nodata=nodata)
+
+    def scratch_path(self, name):
+        with self._lock:
+            if self._scratch is None:
+                self._scratch = tempfile.TemporaryDirectory(prefix="rag_steps_")
+        return os.path.join(self._scratch.name, name)
+
+    def file_for(self, name):
+        # A path for file-based tools (WhiteboxTools), written to scratch if needed
+        handle = self.get(name)
+        if handle.path and os.path.exists(handle.path):
+            return handle.path
+        return handle.materialize(self.scratch_path(name), cog=False)
+
+    def target_path(self, name):
+        # Where a file-based tool should write: outputs if requested, else scratch
+        return os.path.join(self.output_dir, name) if self.wants(name) else self.scratch_path(name)
+
+    def close(self):
+        if self._scratch is not None:
+            self._scratch.cleanup()
+            self._scratch = None
@@ -0,0 +1,113 @@
+# rag/reclassify.py
+# Single-pass raster reclassification shared by the executors: a sorted
+# breakpoint table plus a class lookup table, applied with np.searchsorted and
+# np.take into a preallocated output in bounded chunks. NaN is routed to its
+# own lookup slot by a trailing NaN breakpoint, so no boolean masks are built.
+import numpy as np
+
+CHUNK_PIXELS = 1 << 18
+
+
+def _output(values, out, dtype):
+    if out is None:
+        return np.empty(values.shape, dtype=dtype)
+    if out.shape != values.shape or not out.flags.c_contiguous:
+        raise ValueError("out must be a C-contiguous array with the input's shape")
+    return out
+
+
+class Reclassifier:
+    def __init__(self, breaks, classes, right=False, nan_class=0, dtype=np.uint8):
+        # right=False: bins are [b[i-1], b[i]); right=True: bins are (b[i-1], b[i]].
+        # classes[i] is the class of bin i, so len(classes) == len(breaks) + 1.
+        breaks = [float(b) for b in breaks]
+        if len(classes) != len(breaks) + 1:
+            raise ValueError("classes must have exactly one more entry than breaks")
+        if breaks != sorted(breaks):
+            raise ValueError("breaks must be sorted ascending")
+
+        if right:
+            # side="left": the +inf breakpoint keeps +inf in the top bin and
+            # NaN (sorted after inf) lands on the NaN slot
+            self.side = "left"
+            self.breaks = np.array(breaks + [np.inf, np.nan], dtype=np.float64)
+            self.lut = np.array(list(classes) + [nan_class], dtype=dtype)
+        else:
+            # side="right": +inf stays in the top bin, NaN lands on the NaN slot
+            self.side = "right"
+            self.breaks = np.array(breaks + [np.nan], dtype=np.float64)
+            self.lut = np.array(list(classes) + [nan_class], dtype=dtype)
+        self.dtype = np.dtype(dtype)
+        self.n_bins = len(breaks) + 1
+
+    def bins(self, values, out=None):
+        # Bin index per pixel (0..len(breaks)), NaN -> len(breaks) + 1
+        values = np.asarray(values)
+        out = _output(values, out, np.intp)
+        flat_in, flat_out = values.reshape(-1), out.reshape(-1)
+        for start in range(0, flat_in.size, CHUNK_PIXELS):
+            stop = start + CHUNK_PIXELS
+            flat_out[start:stop] = np.searchsorted(self.breaks, flat_in[start:stop], side=self.side)
+        return out
+
+    def __call__(self, values, out=None):
+        values = np.asarray(values)
+        out = _output(values, out, self.dtype)
+        flat_in, flat_out = values.reshape(-1), out.reshape(-1)
+        for start in range(0, flat_in.size, CHUNK_PIXELS):
+            stop = start + CHUNK_PIXELS
+            idx = np.searchsorted(self.breaks, flat_in[start:stop], side=self.side)
+            np.take(self.lut, idx, out=flat_out[start:stop])
+        return out
+
+
+def combine(first: Reclassifier, second: Reclassifier, table, a, b, out=None, dtype=np.uint8):
+    # Two-factor lookup: table[bin_a][bin_b] gives the class, computed in one
+    # pass over both rasters. Bin n_bins is the NaN slot of each factor.
+    table = np.asarray(table, dtype=dtype)
+    rows, cols = first.n_bins + 1, second.n_bins + 1
+    if table.shape != (rows, cols):
+        raise ValueError(f"table must have shape {(rows, cols)}")
+    lut = table.reshape(-1)
+
+    a, b = np.asarray(a), np.asarray(b)
+    out = _output(a, out, dtype)
+    flat_a, flat_b, flat_out = a.reshape(-1), b.reshape(-1), out.reshape(-1)
+    for start in range(0, flat_a.size, CHUNK_PIXELS):
+        stop = start + CHUNK_PIXELS
+        idx = np.searchsorted(first.breaks, flat_a[start:stop], side=first.side)
+        idx *= cols
+        idx += np.searchsorted(second.breaks, flat_b[start:stop], side=second.side)
+        np.take(lut, idx, out=flat_out[start:stop])
+    return out
+
+
+# === Classification tables used by the executors ===
+
+def flood_risk_classifier(low, medium, high):
+    # 0 = Sea/Water (flow <= 0), 1 Safe, 2 Low, 3 Medium, 4 High; upper bounds inclusive
+    return Reclassifier([0, low, medium, high], [0, 1, 2, 3, 4], right=True, nan_class=0)
+
+
+# Elevation score: <= 0 is masked (0), then [0,5)=1, [5,20)=2, [20,50)=3, [50,100)=4, >=100=5
+ELEVATION_SCORE = Reclassifier([np.nextafter(0, 1), 5, 20, 50, 100], [0, 1, 2, 3, 4, 5], nan_class=0)
+# Slope score: < 0 is nodata (0), then [0,5)=5, [5,15)=3, >=15=1
+SLOPE_SCORE = Reclassifier([0, 5, 15], [0, 5, 3, 1], nan_class=0)
+
+
+def _suitability_table():
+    elev_scores = list(ELEVATION_SCORE.lut[:ELEVATION_SCORE.n_bins]) + [0]
+    slope_scores = list(SLOPE_SCORE.lut[:SLOPE_SCORE.n_bins]) + [0]
+    return [[min(max((int(e) + int(s)) // 2, 1), 5) for s in slope_scores] for e in elev_scores]
+
+
+SUITABILITY_TABLE = _suitability_table()
+
+
+def site_suitability(elevation, slope, out=None):
+    # Suitability 1-5 = clip((elevation score + slope score) // 2, 1, 5)
+    return combine(ELEVATION_SCORE, SLOPE_SCORE, SUITABILITY_TABLE, elevation, slope, out=out)
+
+
+# NDVI classes: <0 Water, [0,.2) Barren, [.2,.4) Built-up, [.4,.6) Sparse Veg, >=.6 Dense Veg; NaN = 0
+LULC_CLASSES = Reclassifier([0.0, 0.2, 0.4, 0.6], [1, 2, 3, 4, 5], nan_class=0)
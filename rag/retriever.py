@@ -1,11 +1,81 @@
+import threading
+import numpy as np
 from langchain.vectorstores import FAISS
 from langchain.embeddings import HuggingFaceEmbeddings
+from ann_index import load_ann_index
 
-def load_vectorstore():
-    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-    db = FAISS.load_local("rag/rag_db", embeddings)
-    return db
+DB_PATH = "rag/rag_db"
+EMBEDDING_MODEL = "sentence-transformers/all-MiniLM-L6-v2"
 
-def retrieve_explanation(query: str, k=3):
+_db = None
+_embeddings = None
+_db_lock = threading.Lock()
+
+
+def get_embeddings():
+    # Embedding model alone (no index), loaded once per process
+    global _embeddings
+    with _db_lock:
+        if _embeddings is None:
+            _embeddings = HuggingFaceEmbeddings(model_name=EMBEDDING_MODEL)
+    return _embeddings
+
+
+def embed_texts(texts):
+    return np.asarray(get_embeddings().embed_documents(list(texts)), dtype="float32")
+
+
+def load_vectorstore(reload=False):
+    # Embedding model and FAISS index are loaded once per process
+    global _db
+    embeddings = get_embeddings()
+    with _db_lock:
+        if _db is None or reload:
+            _db = FAISS.load_local(DB_PATH, embeddings)
+            # Swap in the configured IVF/HNSW/PQ/SQ8 index when one was built
+            ann = load_ann_index(DB_PATH)
+            if ann is not None and ann.ntotal == _db.index.ntotal:
+                _db.index = ann
+    return _db
+
+
+def reset_vectorstore():
+    # The next load_vectorstore() reads the index from disk again (after ingest_docs.py rebuilt it)
+    global _db
+    with _db_lock:
+        _db = None
+
+
+def embed_queries(queries):
+    load_vectorstore()
+    # embed_documents encodes the whole list in batched forward passes
+    return np.asarray(_embeddings.embed_documents(list(queries)), dtype="float32")
+
+
+def search_by_vectors(vectors, k=3):
     db = load_vectorstore()
-    return db.similarity_search(query, k)
+    _, indices = db.index.search(np.asarray(vectors, dtype="float32"), k)
+
+    results = []
+    for row in indices:
+        docs = []
+        for i in row:
+            if i == -1:
+                continue
+            doc = db.docstore.search(db.index_to_docstore_id[int(i)])
+            if not isinstance(doc, str):
+                docs.append(doc)
+        results.append(docs)
+    return results
+
+
+def retrieve_explanations(queries, k=3):
+    # One embedding pass and one index.search over the query matrix
+    queries = list(queries)
+    if not queries:
+        return []
+    return search_by_vectors(embed_queries(queries), k)
+
+
+def retrieve_explanation(query: str, k=3):
+    return retrieve_explanations([query], k)[0]
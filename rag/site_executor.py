@@ -1,23 +1,25 @@
 import json
-import rasterio
-import numpy as np
 import os
-from rasterio.mask import mask
+from functools import partial
+from reclassify import site_suitability
 from whitebox.whitebox_tools import WhiteboxTools
-import geopandas as gpd
-import matplotlib.pyplot as plt
-from matplotlib.colors import ListedColormap
-import osmnx as ox
+from boundary_store import download_boundary
+import hydrology
+from raster_handle import RasterHandle, StepResults, step_files, workflow_outputs
+from terrain import cell_size_metres, slope_degrees
+from workflow_engine import Step, execute, print_timings
+from step_cache import cached, digest_geometries
+from preview import render_preview
 
 # === FIXED PATHS ===
 UPLOADS_DIR = os.path.abspath("rag/uploads")
-OUTPUT_DIR = os.path.abspath("rag/outputs")
+# Job runs (rag/job_queue.py) get their own output folder and workflow copy
+OUTPUT_DIR = os.path.abspath(os.environ.get("RAG_OUTPUT_DIR", "rag/outputs"))
+WORKFLOW_PATH = os.environ.get("RAG_WORKFLOW_PATH", os.path.join("rag", "workflows", "sample_workflow.json"))
 GEOJSON_DIR = os.path.abspath("rag/geojson")
 
 # === OUTPUT FILES ===
-CLIPPED_TIF_PATH = os.path.join(OUTPUT_DIR, "clipped_input.tif")
-SLOPE_TIF_PATH = os.path.join(OUTPUT_DIR, "slope.tif")
-SUITABILITY_TIF_PATH = os.path.join(OUTPUT_DIR, "site_suitability.tif")
+# (raster names come from the workflow's input_file/output_file)
 MAP_OUTPUT_PATH = os.path.join(OUTPUT_DIR, "site_suitability_map.png")
 
 # === SETUP ===
@@ -28,113 +30,131 @@ os.makedirs(GEOJSON_DIR, exist_ok=True)
 wbt = WhiteboxTools()
 wbt.set_working_dir(OUTPUT_DIR)
 
-def download_boundary(location_name):
-    geojson_path = os.path.join(GEOJSON_DIR, f"{location_name.lower().replace(',', '').replace(' ', '_')}_boundary.geojson")
-    gdf = ox.geocode_to_gdf(location_name)
-    gdf.to_file(geojson_path, driver="GeoJSON")
-    return gdf, geojson_path
-
-def run_site_suitability_workflow(location_name: str, uploaded_tif: str):
-    print(f"\n📍 Region: {location_name}\n📄 DEM File: {uploaded_tif}")
-
-    # === STEP 1: Download GeoJSON ===
-    print("📥 Downloading boundary...")
-    boundary_gdf, geojson_path = download_boundary(location_name)
-    print(f"✅ Saved boundary: {geojson_path}")
-
-    # === STEP 2: Clip DEM ===
-    print("🔍 Clipping DEM with boundary...")
-    with rasterio.open(uploaded_tif) as src:
-        boundary_gdf = boundary_gdf.to_crs(src.crs)
-        geojson_geom = boundary_gdf.geometry.values[0]
+
+def plan_site_steps(workflow):
+    # [(number, action, kind, input name, output name, slope name)] for the
+    # workflow's steps, kind being "clip", "slope" or "classify". Boundary
+    # downloads (e.g. the osmnx step of the few-shot example) are left out: the
+    # executor's own "Load boundary" step already provides the boundary.
+    planned = []
+    produced = set()
+    slope_name = None
+    for number, step in enumerate(workflow, 1):
+        action = step["action"]
+        key = action.lower()
+        tool = step.get("args", {}).get("tool", "").lower()
+        if "clip" not in key and (tool == "osmnx" or "boundary" in key):
+            continue
+        input_name, output_name = step_files(step, produced)
+        produced.add(output_name)
+        if "clip" in key:
+            kind = "clip"
+        elif "classif" in key or "suitab" in key:
+            if slope_name is None:
+                raise ValueError(f"❌ Step {number}. {action} needs a slope step before it.")
+            kind = "classify"
+        elif "slope" in key:
+            kind = "slope"
+            slope_name = output_name
+        else:
+            raise ValueError(f"❌ Unsupported site suitability step: {action}")
+        planned.append((number, action, kind, input_name, output_name, slope_name))
+    return planned
+
+
+def run_site_suitability_workflow(location_name: str, workflow, outputs=None, engine="whitebox"):
+    # workflow: the JSON's "workflow" step list (the DEM is the clip step's input_file)
+    print(f"\n📍 Region: {location_name}")
+    boundary = {}
+
+    # === Download GeoJSON ===
+    def load_boundary():
+        print("📥 Loading boundary...")
+        boundary["gdf"], geojson_path = download_boundary(location_name)
+        results.digests["boundary"] = digest_geometries(boundary["gdf"])
+        print(f"✅ Saved boundary: {geojson_path}")
+
+    # === Clip DEM ===
+    def clip_dem(input_name, output_name):
+        print(f"🔍 Clipping {input_name} with boundary...")
         try:
-            clipped, transform = mask(src, [geojson_geom], crop=True)
+            results.put_clip(output_name, results.file_for(input_name), boundary["gdf"])
         except ValueError:
             raise ValueError(f"❌ The uploaded DEM does not overlap with {location_name}. Please upload a matching DEM.")
-        meta = src.meta.copy()
-
-    meta.update({"height": clipped.shape[1], "width": clipped.shape[2], "transform": transform})
-    with rasterio.open(CLIPPED_TIF_PATH, "w", **meta) as dst:
-        dst.write(clipped)
-    print(f"✅ Clipped DEM saved to: {CLIPPED_TIF_PATH}")
-
-    # === STEP 3: Slope using WhiteboxTools ===
-    print("📐 Calculating slope...")
-    wbt.slope(dem=CLIPPED_TIF_PATH, output=SLOPE_TIF_PATH, units="degrees")
-    print(f"✅ Slope saved to: {SLOPE_TIF_PATH}")
-
-    # === STEP 4: Elevation + Slope to Site Suitability ===
-    print("⚙️ Generating site suitability map...")
-    with rasterio.open(CLIPPED_TIF_PATH) as elev_src:
-        elevation = elev_src.read(1)
-        elev_meta = elev_src.meta.copy()
-
-    with rasterio.open(SLOPE_TIF_PATH) as slope_src:
-        slope = slope_src.read(1)
-
-    # === Classification ===
-    elevation_masked = np.where(elevation <= 0, np.nan, elevation)
-    suitability = np.zeros_like(elevation, dtype=np.uint8)
-
-    suitability[np.where((elevation_masked >= 0) & (elevation_masked < 5))] += 1
-    suitability[np.where((elevation_masked >= 5) & (elevation_masked < 20))] += 2
-    suitability[np.where((elevation_masked >= 20) & (elevation_masked < 50))] += 3
-    suitability[np.where((elevation_masked >= 50) & (elevation_masked < 100))] += 4
-    suitability[np.where(elevation_masked >= 100)] += 5
 
-    suitability[np.where((slope >= 0) & (slope < 5))] += 5
-    suitability[np.where((slope >= 5) & (slope < 15))] += 3
-    suitability[np.where(slope >= 15)] += 1
-
-    suitability = np.nan_to_num(suitability, nan=0)
-    suitability = np.clip(suitability // 2, 1, 5)
-
-    elev_meta.update(dtype=rasterio.uint8, count=1, nodata=0)
-    with rasterio.open(SUITABILITY_TIF_PATH, "w", **elev_meta) as dst:
-        dst.write(suitability, 1)
-
-    print(f"✅ Site suitability raster saved to: {SUITABILITY_TIF_PATH}")
+    # === Slope ===
+    def compute_slope(input_name, output_name):
+        print(f"📐 Calculating slope of {input_name}...")
+        if engine == "numpy":
+            elevation, profile = results.get(input_name).read()
+            dem, valid = hydrology.dem_from_array(elevation, profile.get("nodata"))
+            slope = slope_degrees(dem, valid, cell_size_metres(profile))
+            results.put(RasterHandle(output_name, slope, profile), dtype="float32", nodata=-32768.0)
+        else:
+            slope_path = results.target_path(output_name)
+            wbt.slope(dem=results.file_for(input_name), output=slope_path, units="degrees")
+            results.put(RasterHandle(output_name, path=slope_path))
+
+    # === Elevation + Slope to Site Suitability ===
+    def classify(input_name, slope_name, output_name):
+        print("⚙️ Generating site suitability map...")
+        elevation, slope = results.get(input_name), results.get(slope_name)
+        # Elevation and slope scores combined through one lookup table, block by block
+        blocks = ((window, site_suitability(e, s)) for (window, e), (_, s) in zip(elevation.blocks(), slope.blocks()))
+        results.put_blocks(output_name, elevation.meta(), blocks, dtype="uint8", nodata=0)
 
     # === VISUALIZE ===
-    print("🖼️ Rendering map image...")
-    cmap = ListedColormap(["gray", "lightyellow", "khaki", "darkseagreen", "forestgreen"])
-    labels = ["Very Low", "Low", "Moderate", "High", "Very High"]
-    plt.figure(figsize=(8, 5))
-    im = plt.imshow(suitability, cmap=cmap)
-    cbar = plt.colorbar(im, ticks=[1, 2, 3, 4, 5])
-    cbar.ax.set_yticklabels(labels)
-    plt.title("Site Suitability Map")
-    plt.axis("off")
-    plt.tight_layout()
-    plt.savefig(MAP_OUTPUT_PATH)
-    plt.close()
-    print(f"✅ Map image saved to: {MAP_OUTPUT_PATH}")
+    def render(name):
+        print("🖼️ Rendering map image...")
+        suitability = results.get(name)
+        render_preview(suitability.array if suitability.in_memory else suitability.path, "site", MAP_OUTPUT_PATH)
+        print(f"✅ Map image saved to: {MAP_OUTPUT_PATH}")
+
+    # Intermediates stay in memory; only the files listed in outputs are written.
+    # Steps run as a dependency graph (input_file -> output_file) like the flood
+    # executor's: clip steps wait for the boundary, slope steps compute slope of
+    # their input, and classify steps score their input (elevation) together
+    # with the latest slope output before them.
+    with StepResults(OUTPUT_DIR, outputs, search_dirs=[UPLOADS_DIR]) as results:
+        steps = [Step("Load boundary", load_boundary, outputs=["boundary"])]
+        for number, action, kind, input_name, output_name, slope_name in plan_site_steps(workflow):
+            if kind == "clip":
+                inputs, spec = [input_name, "boundary"], {"step": "clip"}
+                run = partial(clip_dem, input_name, output_name)
+            elif kind == "slope":
+                inputs, spec = [input_name], {"step": "slope", "engine": engine}
+                run = partial(compute_slope, input_name, output_name)
+            else:
+                inputs, spec = [input_name, slope_name], {"step": "suitability"}
+                run = partial(classify, input_name, slope_name, output_name)
+            # Raster steps are memoized by content (rag/step_cache.py); rendering is not
+            steps.append(Step(f"{number}. {action}", cached(results, spec, inputs, [output_name], run),
+                              inputs=inputs, outputs=[output_name]))
+            if kind == "classify":
+                steps.append(Step(f"{number}. Render map", partial(render, output_name), inputs=[output_name],
+                                  outputs=[os.path.basename(MAP_OUTPUT_PATH)]))
+        print_timings(execute(steps))
 
 if __name__ == "__main__":
     # Example usage for direct test:
-    with open(os.path.join("rag", "workflows", "sample_workflow.json")) as f:
+    with open(WORKFLOW_PATH) as f:
         workflow = json.load(f)
     location_name = None
     for step in workflow.get("workflow", []):
         if "task" in step and "site suitability" in step["task"].lower():
             # Extract location from the task string, e.g., "site suitability for Kochi"
             task = step["task"]
-            if "for" in task:
-                location_name = task.split("for", 1)[1].strip()
+            if " for " in task:
+                location_name = task.rsplit(" for ", 1)[-1].strip()
             else:
                 location_name = "Vellore, India"  # fallback
             break
     if not location_name:
         location_name = "Vellore, India"  # fallback
 
-    # Find the uploaded tif file path from workflow JSON
-    uploaded_tif = None
-    for step in workflow.get("workflow", []):
-        args = step.get("args", {})
-        if "input_file" in args:
-            uploaded_tif = args["input_file"]
-            break
-    if not uploaded_tif:
-        uploaded_tif = "rag/uploads/input_20250706_130716.tif"  # fallback
-
-    run_site_suitability_workflow(location_name=location_name, uploaded_tif=uploaded_tif)
+    run_site_suitability_workflow(
+        location_name=location_name,
+        workflow=workflow.get("workflow", []),
+        outputs=workflow_outputs(workflow),
+        engine=workflow.get("engine", "whitebox").lower(),
+    )
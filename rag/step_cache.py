@@ -0,0 +1,210 @@
+# rag/step_cache.py
+# Content-addressed cache of workflow step results under rag/outputs/.cache.
+# A step's key hashes its tool/action/parameters together with the digests of
+# its inputs: files are hashed by content (memoized by size + mtime), results of
+# earlier steps carry the digest of the step that produced them. Re-running a
+# workflow therefore only recomputes the steps downstream of what changed.
+# Entries live in a SQLite index and are evicted least-recently-used once the
+# cache grows past STEP_CACHE_MAX_GB.
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import sqlite3
+import threading
+import time
+import numpy as np
+from clip_engine import tile_paths
+from raster_handle import RasterHandle
+
+CACHE_DIR = os.path.abspath(os.environ.get("STEP_CACHE_DIR", "rag/outputs/.cache"))
+MAX_BYTES = int(float(os.environ.get("STEP_CACHE_MAX_GB", 5)) * 2**30)
+ENABLED = os.environ.get("STEP_CACHE", "1").lower() not in ("0", "false", "no")
+# Bump when a step's implementation changes its results
+CACHE_VERSION = 1
+HASH_CHUNK = 1 << 20
+
+
+def digest_text(*parts):
+    return hashlib.sha256(json.dumps(parts, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def digest_geometries(gdf):
+    h = hashlib.sha256(str(gdf.crs).encode())
+    for geometry in gdf.geometry:
+        h.update(geometry.wkb)
+    return h.hexdigest()
+
+
+def _tree_size(path):
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+class StepCache:
+    def __init__(self, cache_dir=CACHE_DIR, max_bytes=MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(cache_dir, "index.sqlite")
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                "key TEXT PRIMARY KEY, size INTEGER, created REAL, last_used REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS files ("
+                "path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha256 TEXT)"
+            )
+
+    def _connect(self):
+        return sqlite3.connect(self.index_path, timeout=30)
+
+    def _entry_dir(self, key):
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def file_digest(self, path):
+        # Content hash, recomputed only when the file's size or mtime changes
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            # Folder of DEM tiles: names and contents of the tiles
+            return digest_text(*[(os.path.basename(tile), self.file_digest(tile)) for tile in tile_paths(path)])
+        stat = os.stat(path)
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT sha256 FROM files WHERE path = ? AND size = ? AND mtime_ns = ?",
+                (path, stat.st_size, stat.st_mtime_ns),
+            ).fetchone()
+        if row is not None:
+            return row[0]
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK), b""):
+                h.update(chunk)
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)",
+                (path, stat.st_size, stat.st_mtime_ns, h.hexdigest()),
+            )
+        return h.hexdigest()
+
+    def input_digest(self, results, name):
+        if name in results.digests:
+            return results.digests[name]
+        if name in results.handles or name in results:
+            handle = results.get(name)
+            if handle.path and os.path.exists(handle.path):
+                return self.file_digest(handle.path)
+        elif os.path.exists(name):
+            return self.file_digest(name)
+        raise KeyError(f"❌ No digest for step input {name}")
+
+    def key(self, spec, input_digests):
+        return digest_text(CACHE_VERSION, spec, input_digests)
+
+    def load(self, key):
+        # {name: RasterHandle} of a cached step, or None on a miss
+        entry_dir = self._entry_dir(key)
+        manifest_path = os.path.join(entry_dir, "manifest.pkl")
+        if not os.path.exists(manifest_path):
+            return None
+        with open(manifest_path, "rb") as f:
+            manifest = pickle.load(f)
+        handles = {}
+        for name, item in manifest.items():
+            if item["kind"] == "array":
+                array = np.load(os.path.join(entry_dir, f"{name}.npy"), mmap_mode="r")
+                handle = RasterHandle(name, array, item["profile"])
+            else:
+                handle = RasterHandle(name, path=os.path.join(entry_dir, name))
+            handle.write_options = item["write_options"]
+            handles[name] = handle
+        with self._lock, self._connect() as conn:
+            conn.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return handles
+
+    def store(self, key, handles):
+        entry_dir = self._entry_dir(key)
+        staging = f"{entry_dir}.tmp{threading.get_ident()}"
+        os.makedirs(staging, exist_ok=True)
+        manifest = {}
+        for name, handle in handles.items():
+            if handle.in_memory:
+                np.save(os.path.join(staging, f"{name}.npy"), np.asarray(handle.array))
+                manifest[name] = {"kind": "array", "profile": handle.profile}
+            else:
+                shutil.copyfile(handle.path, os.path.join(staging, name))
+                manifest[name] = {"kind": "file"}
+            manifest[name]["write_options"] = handle.write_options
+        with open(os.path.join(staging, "manifest.pkl"), "wb") as f:
+            pickle.dump(manifest, f)
+
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        os.replace(staging, entry_dir)
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)", (key, _tree_size(entry_dir), now, now))
+        self.evict()
+
+    def _remove(self, key):
+        entry_dir = self._entry_dir(key)
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        try:
+            os.rmdir(os.path.dirname(entry_dir))
+        except OSError:
+            pass
+
+    def evict(self):
+        with self._lock, self._connect() as conn:
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+            rows = conn.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall()
+            for key, size in rows:
+                if total <= self.max_bytes:
+                    break
+                self._remove(key)
+                conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                total -= size
+
+    def clear(self):
+        with self._lock, self._connect() as conn:
+            for (key,) in conn.execute("SELECT key FROM entries").fetchall():
+                self._remove(key)
+            conn.execute("DELETE FROM entries")
+
+    def wrap(self, results, spec, inputs, outputs, run):
+        # The step callable with memoization: on a hit the cached outputs are
+        # put into results (and written if requested) instead of running the step.
+        def cached():
+            digests = {name: self.input_digest(results, name) for name in inputs}
+            key = self.key([spec, sorted(outputs)], digests)
+            hit = self.load(key)
+            if hit is not None and set(outputs) <= set(hit):
+                print(f"  ♻️ Reused cached {', '.join(outputs)} ({key[:12]})")
+                for name in outputs:
+                    results.put(hit[name], **hit[name].write_options)
+            else:
+                run()
+                produced = {name: results.handles[name] for name in outputs if name in results.handles}
+                if len(produced) == len(outputs):
+                    self.store(key, produced)
+            for name in outputs:
+                results.digests[name] = digest_text(key, name)
+
+        return cached
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None and ENABLED:
+        _cache = StepCache()
+    return _cache
+
+
+def cached(results, spec, inputs, outputs, run):
+    # run unchanged when the cache is disabled (STEP_CACHE=0)
+    cache = get_cache()
+    return run if cache is None else cache.wrap(results, spec, inputs, outputs, run)
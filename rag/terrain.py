@@ -0,0 +1,39 @@
+# rag/terrain.py
+# In-process terrain derivatives for the numpy engine (slope in degrees, Horn's
+# 3x3 method as used by WhiteboxTools' Slope tool).
+import math
+import numpy as np
+
+
+def cell_size_metres(profile):
+    # Geographic DEMs (degrees) are converted at the raster's mid-latitude
+    transform = profile["transform"]
+    size_x, size_y = abs(transform.a), abs(transform.e)
+    crs = profile.get("crs")
+    if crs is not None and crs.is_geographic:
+        mid_lat = transform.f + transform.e * profile["height"] / 2
+        size_x *= 111320.0 * math.cos(math.radians(mid_lat))
+        size_y *= 110540.0
+    return size_x, size_y
+
+
+def slope_degrees(dem, valid=None, cell_size=(1.0, 1.0)):
+    rows, cols = dem.shape
+    if valid is None:
+        valid = np.isfinite(dem)
+    size_x, size_y = abs(cell_size[0]), abs(cell_size[1])
+    z = np.where(valid, dem, np.nan).astype(np.float64)
+    padded = np.pad(z, 1, mode="edge")
+
+    def neighbour(dr, dc):
+        # Nodata and out-of-raster neighbours take the centre cell's value
+        values = padded[1 + dr:1 + dr + rows, 1 + dc:1 + dc + cols]
+        return np.where(np.isnan(values), z, values)
+
+    dz_dx = ((neighbour(-1, 1) + 2 * neighbour(0, 1) + neighbour(1, 1))
+             - (neighbour(-1, -1) + 2 * neighbour(0, -1) + neighbour(1, -1))) / (8 * size_x)
+    dz_dy = ((neighbour(1, -1) + 2 * neighbour(1, 0) + neighbour(1, 1))
+             - (neighbour(-1, -1) + 2 * neighbour(-1, 0) + neighbour(-1, 1))) / (8 * size_y)
+    slope = np.degrees(np.arctan(np.hypot(dz_dx, dz_dy)))
+    slope[~valid] = np.nan
+    return slope
@@ -0,0 +1,241 @@
+# rag/tracing.py
+# Per-step tracing for the workflow engine. With WORKFLOW_TRACE_FILE set, every
+# step (and nested span, e.g. the D8 pointer inside flow accumulation) records
+# start/end, CPU time of its thread and of the process, peak RSS while it ran,
+# I/O bytes and the rasters it produced, and the run is written as a Chrome
+# trace (open in chrome://tracing or https://ui.perfetto.dev). RSS is sampled
+# in the background and also written as a memory counter track.
+# WORKFLOW_PROFILE adds a profile of the steps next to the trace:
+#   cprofile -> <trace>.prof (pstats; snakeviz, python -m pstats); the engine
+#               then runs one step at a time, as profilers can't overlap
+#   sample   -> <trace>.folded, stacks sampled every WORKFLOW_SAMPLE_MS in the
+#               collapsed format of py-spy record --format raw (speedscope,
+#               flamegraph.pl, inferno), rooted at the step name
+# CPU, RSS and I/O are process-wide, so steps running concurrently share them.
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager, nullcontext
+
+TRACE_FILE = os.environ.get("WORKFLOW_TRACE_FILE")
+PROFILE = os.environ.get("WORKFLOW_PROFILE", "").lower()
+SAMPLE_INTERVAL = float(os.environ.get("WORKFLOW_SAMPLE_MS", 10)) / 1000
+MEMORY_INTERVAL = 0.02
+MAX_COUNTER_EVENTS = 2000
+
+try:
+    PAGE_SIZE = os.sysconf("SC_PAGE_SIZE")
+except (AttributeError, ValueError, OSError):
+    PAGE_SIZE = None
+
+
+def rss_bytes():
+    # Current resident set size (Linux); None elsewhere
+    if PAGE_SIZE is None:
+        return None
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE
+    except OSError:
+        return None
+
+
+def io_bytes():
+    # (read, written) through read/write calls, incl. finished child processes such as WhiteboxTools
+    try:
+        with open("/proc/self/io") as f:
+            fields = dict(line.split(": ") for line in f.read().splitlines())
+        return int(fields["rchar"]), int(fields["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+
+
+def _depth(frame):
+    depth = 0
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    return depth
+
+
+class Tracer:
+    def __init__(self, path, profile=PROFILE, sample_interval=SAMPLE_INTERVAL):
+        self.path = path
+        self.profile = profile
+        self.sample_interval = sample_interval
+        self.events = []
+        self.memory = []  # (seconds since start, rss bytes)
+        self.stacks = Counter()
+        self.profiles = []
+        self._t0 = time.perf_counter()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._thread_steps = {}  # thread ident -> (step running on it, stack depth of its caller)
+        self._threads = {}
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, name="trace-sampler", daemon=True)
+        self._sampler.start()
+
+    def _now(self):
+        return time.perf_counter() - self._t0
+
+    def _sample(self):
+        interval = self.sample_interval if self.profile == "sample" else MEMORY_INTERVAL
+        last_memory = -MEMORY_INTERVAL
+        while not self._stop.wait(interval):
+            now = self._now()
+            if now - last_memory >= MEMORY_INTERVAL:
+                rss = rss_bytes()
+                if rss is not None:
+                    self.memory.append((now, rss))
+                last_memory = now
+            if self.profile == "sample":
+                frames = sys._current_frames()
+                for ident, (step, depth) in list(self._thread_steps.items()):
+                    frame = frames.get(ident)
+                    stack = []
+                    while frame is not None:
+                        stack.append(_frame_label(frame))
+                        frame = frame.f_back
+                    # Only the frames below the traced call (thread pool and engine frames dropped)
+                    stack = stack[::-1][depth:]
+                    if stack:
+                        self.stacks[";".join([step] + stack)] += 1
+
+    def _peak_rss(self, start, end):
+        peak = max((rss for t, rss in self.memory if start <= t <= end), default=None)
+        current = rss_bytes()
+        if current is not None:
+            peak = max(peak or 0, current)
+        return peak
+
+    @contextmanager
+    def span(self, name, cat="span", **args):
+        ident = threading.get_ident()
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        top_level = not stack
+        if top_level:
+            cat = "step"
+            self._thread_steps[ident] = (name, _depth(sys._getframe(2)))
+            self._threads[ident] = threading.current_thread().name
+        record = {"args": dict(args)}
+        stack.append(record)
+        profiler = None
+        if top_level and self.profile == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        start, thread_cpu, process_cpu, io = self._now(), time.thread_time(), time.process_time(), io_bytes()
+        try:
+            yield record["args"]
+        except BaseException as e:
+            record["args"]["error"] = str(e) or type(e).__name__
+            raise
+        finally:
+            end = self._now()
+            if profiler is not None:
+                profiler.disable()
+            stack.pop()
+            if top_level:
+                self._thread_steps.pop(ident, None)
+            event_args = record["args"]
+            event_args.update(cpu_s=round(time.thread_time() - thread_cpu, 4),
+                              process_cpu_s=round(time.process_time() - process_cpu, 4))
+            peak = self._peak_rss(start, end)
+            if peak is not None:
+                event_args["peak_rss_mb"] = round(peak / 2**20, 1)
+            io_end = io_bytes()
+            if io and io_end:
+                event_args.update(read_bytes=io_end[0] - io[0], write_bytes=io_end[1] - io[1])
+            with self._lock:
+                self.events.append({"name": name, "cat": cat, "ph": "X", "pid": os.getpid(), "tid": ident,
+                                    "ts": round(start * 1e6), "dur": round((end - start) * 1e6), "args": event_args})
+                if profiler is not None:
+                    self.profiles.append(profiler)
+
+    def annotate(self, **args):
+        # Merge into the innermost open span on this thread (dicts are merged)
+        stack = getattr(self._local, "stack", None)
+        if not stack:
+            return
+        target = stack[-1]["args"]
+        for key, value in args.items():
+            if isinstance(value, dict) and isinstance(target.get(key), dict):
+                target[key].update(value)
+            else:
+                target[key] = value
+
+    def close(self):
+        self._stop.set()
+        self._sampler.join()
+        pid = os.getpid()
+        events = [{"name": "process_name", "ph": "M", "pid": pid, "args": {"name": os.path.basename(sys.argv[0])}}]
+        events += [{"name": "thread_name", "ph": "M", "pid": pid, "tid": ident, "args": {"name": thread}}
+                   for ident, thread in self._threads.items()]
+        step = max(1, len(self.memory) // MAX_COUNTER_EVENTS)
+        events += [{"name": "memory", "ph": "C", "pid": pid, "ts": round(t * 1e6), "args": {"rss_mb": round(rss / 2**20, 1)}}
+                   for t, rss in self.memory[::step]]
+        events += sorted(self.events, key=lambda e: e["ts"])
+
+        folder = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(folder, exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"🧭 Trace saved to: {self.path}")
+
+        base = os.path.splitext(self.path)[0]
+        if self.profiles:
+            stats = pstats.Stats(*self.profiles)
+            stats.dump_stats(f"{base}.prof")
+            print(f"🧭 cProfile stats saved to: {base}.prof")
+        if self.stacks:
+            with open(f"{base}.folded", "w", encoding="utf-8") as f:
+                for stack, count in self.stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+            print(f"🧭 Sampled stacks saved to: {base}.folded")
+
+
+_tracer = None
+
+
+@contextmanager
+def trace_run(path=None):
+    # Traces the steps run inside it; a no-op unless WORKFLOW_TRACE_FILE or WORKFLOW_PROFILE is set
+    global _tracer
+    path = path or TRACE_FILE
+    if path is None and PROFILE:
+        path = os.path.join(os.environ.get("RAG_OUTPUT_DIR", "rag/outputs"), "trace.json")
+    if path is None or _tracer is not None:
+        yield _tracer
+        return
+    _tracer = Tracer(path)
+    try:
+        yield _tracer
+    finally:
+        tracer, _tracer = _tracer, None
+        tracer.close()
+
+
+def active():
+    return _tracer is not None
+
+
+def span(name, **args):
+    return nullcontext({}) if _tracer is None else _tracer.span(name, **args)
+
+
+def annotate(**args):
+    if _tracer is not None:
+        _tracer.annotate(**args)
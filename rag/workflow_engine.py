@@ -0,0 +1,130 @@
+# rag/workflow_engine.py
+# Runs workflow steps as a dependency graph: a step depends on the steps that
+# produce its inputs (file names or other named results such as "boundary").
+# Ready steps run concurrently on a thread pool; each step's wall time is reported.
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+import tracing
+
+# Steps mostly wait on GDAL, WhiteboxTools subprocesses or the network, so this
+# is not tied to the CPU count
+WORKERS = int(os.environ.get("WORKFLOW_WORKERS", 4))
+# JSON-lines step events for whoever launched the executor (rag/job_queue.py)
+PROGRESS_FILE = os.environ.get("WORKFLOW_PROGRESS_FILE")
+_progress_lock = threading.Lock()
+
+
+def report_progress(**event):
+    if not PROGRESS_FILE:
+        return
+    event["time"] = time.time()
+    with _progress_lock, open(PROGRESS_FILE, "a", encoding="utf-8") as f:
+        f.write(json.dumps(event) + "\n")
+
+
+class Step:
+    def __init__(self, name, run, inputs=(), outputs=()):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __repr__(self):
+        return f"Step({self.name!r}, inputs={self.inputs}, outputs={self.outputs})"
+
+
+def build_graph(steps):
+    # {step name: names of the steps it waits for}; external inputs have no producer
+    names = [step.name for step in steps]
+    if len(set(names)) != len(names):
+        raise ValueError("❌ Step names must be unique.")
+    producers = {}
+    for step in steps:
+        for output in step.outputs:
+            if output in producers:
+                raise ValueError(f"❌ {output} is produced by both '{producers[output]}' and '{step.name}'.")
+            producers[output] = step.name
+
+    graph = {}
+    for step in steps:
+        graph[step.name] = {producers[i] for i in step.inputs if i in producers and producers[i] != step.name}
+
+    # Kahn's algorithm, only to reject cycles before anything runs
+    remaining = {name: set(deps) for name, deps in graph.items()}
+    while remaining:
+        ready = [name for name, deps in remaining.items() if not deps]
+        if not ready:
+            raise ValueError(f"❌ Workflow has a dependency cycle between: {sorted(remaining)}")
+        for name in ready:
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return graph
+
+
+def execute(steps, workers=WORKERS):
+    # Returns [{"step", "start", "end", "seconds"}] in completion order (times relative to the run start)
+    graph = build_graph(steps)
+    by_name = {step.name: step for step in steps}
+    waiting = {name: set(deps) for name, deps in graph.items()}
+    timings = []
+    run_start = time.perf_counter()
+    report_progress(status="planned", steps=[step.name for step in steps])
+
+    def timed(step):
+        report_progress(step=step.name, status="started")
+        start = time.perf_counter()
+        with tracing.span(step.name, inputs=step.inputs, outputs=step.outputs):
+            step.run()
+        end = time.perf_counter()
+        report_progress(step=step.name, status="done", seconds=end - start)
+        return {"step": step.name, "start": start - run_start, "end": end - run_start, "seconds": end - start}
+
+    # Per-step cProfile profilers can't overlap (Python 3.12+ allows one active profiler), so steps run one at a time
+    if tracing.PROFILE == "cprofile":
+        workers = 1
+    # Per-step trace (rag/tracing.py) when WORKFLOW_TRACE_FILE / WORKFLOW_PROFILE is set
+    with tracing.trace_run(), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        running = {}
+        error = None
+
+        def submit_ready():
+            for name in [n for n, deps in waiting.items() if not deps]:
+                del waiting[name]
+                running[pool.submit(timed, by_name[name])] = name
+
+        submit_ready()
+        while running:
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    timing = future.result()
+                except Exception as e:
+                    # Let running steps finish, start nothing new, re-raise the first failure
+                    report_progress(step=name, status="failed", error=str(e))
+                    error = error or e
+                    waiting.clear()
+                    continue
+                timings.append(timing)
+                print(f"⏱️ {name}: {timing['seconds']:.2f}s")
+                for deps in waiting.values():
+                    deps.discard(name)
+            if error is None:
+                submit_ready()
+        if error is not None:
+            raise error
+
+    return timings
+
+
+def print_timings(timings):
+    total = max((t["end"] for t in timings), default=0.0)
+    busy = sum(t["seconds"] for t in timings)
+    print("\n⏱️ Step timings")
+    for t in sorted(timings, key=lambda t: t["start"]):
+        print(f"  {t['start']:7.2f}s → {t['end']:7.2f}s  {t['seconds']:7.2f}s  {t['step']}")
+    print(f"  wall {total:.2f}s, summed step time {busy:.2f}s")
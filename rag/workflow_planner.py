@@ -0,0 +1,294 @@
+# rag/workflow_planner.py
+# Deterministic planner in front of the workflow LLM. Prompts that ask for one
+# of the analyses the executors implement (flood, site suitability, land cover)
+# are classified by keywords, or by MiniLM similarity to example prompts when no
+# keyword matches, and the matching template is filled in with the location.
+# That takes milliseconds instead of a model load plus generation. Only
+# prompts with no single clear intent or no location go to the LLM, and its
+# workflows are cached by normalized prompt in rag/workflows/llm_cache.json
+# (emptied when the system prompt or model changes).
+import copy
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import numpy as np
+from workflow_prompt import SYSTEM_PROMPT
+
+CACHE_PATH = os.path.join("rag", "workflows", "llm_cache.json")
+EMBEDDING_THRESHOLD = float(os.environ.get("PLANNER_EMBEDDING_THRESHOLD", 0.6))
+EMBEDDING_MARGIN = 0.05
+# Set PLANNER_EMBEDDINGS=0 to skip the similarity tier (no embedding model load)
+USE_EMBEDDINGS = os.environ.get("PLANNER_EMBEDDINGS", "1") != "0"
+
+TEMPLATES = {
+    "flood": {
+        "keywords": ("flood", "inundat", "waterlog", "low-lying", "flow accumulation", "runoff", "drainage"),
+        "examples": (
+            "Find flood-prone zones in Chennai",
+            "Which areas of Mumbai are at risk of flooding?",
+            "Map inundation hazard from the DEM for Patna",
+            "Show low-lying areas where water collects during heavy rain in Kochi",
+        ),
+        "task": "Identify flood-prone zones for {location}",
+        "steps": [
+            ("Clip DEM to boundary", "rasterio", "uploads/input.tif", "clipped_dem.tif"),
+            ("Fill depressions", "whiteboxtools", "clipped_dem.tif", "filled_dem.tif"),
+            ("Calculate flow accumulation", "whiteboxtools", "filled_dem.tif", "flow_accum.tif"),
+            ("Classify flood risk", "rasterio", "flow_accum.tif", "flood_risk_levels.tif"),
+        ],
+        "reasoning": [
+            "Since the task asks for flood-prone zones from a DEM, we first clip the DEM to the {location} boundary.",
+            "Fill depressions so water can be routed across sinks.",
+            "Calculate flow accumulation on the filled DEM.",
+            "Classify flow accumulation into flood risk levels with raster thresholds.",
+        ],
+    },
+    "site": {
+        "keywords": ("suitab", "site", "construct", "build", "housing", "develop", "settlement", "siting"),
+        "examples": (
+            "Find suitable sites for building in Vellore",
+            "Where can we construct new housing in Madurai?",
+            "Site suitability map from DEM for Chennai",
+            "Identify flat, elevated land for development around Salem",
+        ),
+        "task": "site suitability for {location}",
+        "steps": [
+            ("Clip DEM using boundary", "rasterio", "uploads/input.tif", "clipped_{slug}.tif"),
+            ("Calculate slope", "whiteboxtools", "clipped_{slug}.tif", "{slug}_slope.tif"),
+            ("Classify elevation and slope", "rasterio", "clipped_{slug}.tif", "site_suitability.tif"),
+        ],
+        "reasoning": [
+            "Since the task asks for site suitability from a DEM, we first clip the DEM to the {location} boundary.",
+            "Calculate slope from the clipped DEM.",
+            "Classify elevation and slope into suitability classes.",
+        ],
+    },
+    "lulc": {
+        "keywords": ("land cover", "landcover", "land use", "lulc", "ndvi", "sentinel", "vegetation", "built-up", "forest"),
+        "examples": (
+            "Classify land cover from Sentinel 2 for Coimbatore",
+            "Map land use and land cover around Bengaluru",
+            "Compute NDVI and classify vegetation for Trichy",
+            "Show forest, water and built-up areas from satellite bands in Erode",
+        ),
+        "task": "land cover classification for {location}",
+        "steps": [
+            ("Stack Sentinel bands B02, B03, B04, B08", "rasterio", "uploads/B02,B03,B04,B08.jp2", "sentinel_stacked.tif"),
+            ("Compute NDVI", "rasterio", "sentinel_stacked.tif", "ndvi.tif"),
+            ("Classify LULC from NDVI", "rasterio", "ndvi.tif", "lulc_class.tif"),
+        ],
+        "reasoning": [
+            "Since the task asks for land cover, we stack the Sentinel-2 bands B02, B03, B04 and B08 for {location}.",
+            "Compute NDVI from the red and near-infrared bands.",
+            "Classify LULC from NDVI thresholds.",
+        ],
+    },
+}
+
+PREPOSITIONS = {"in", "for", "at", "around", "near", "of", "across"}
+# Lowercase words (and commas) that may join the capitalized words of one place name
+NAME_CONNECTORS = {"of", "de", "del", "da", "la", "upon", "on", ","}
+NOT_PLACES = {"dem", "dems", "ndvi", "lulc", "sentinel", "landsat", "srtm", "geotiff", "tif", "json", "gis"}
+TOKEN_PATTERN = re.compile(r"[^\W\d_][\w'-]*|\d+|[^\w\s]")
+
+
+def normalize_prompt(prompt: str) -> str:
+    return " ".join(re.sub(r"[^\w\s,-]", " ", prompt.lower()).split())
+
+
+def _is_name_word(token: str) -> bool:
+    return token[0].isupper() and token.lower() not in NOT_PLACES
+
+
+def _read_name(tokens, i):
+    # Capitalized words from tokens[i] on, joined by connectors ("Port of Spain",
+    # "Vellore, India"); stops at the first other lowercase word or punctuation
+    if i < len(tokens) and tokens[i] == "the":
+        i += 1
+    words = []
+    while i < len(tokens):
+        token = tokens[i]
+        if _is_name_word(token):
+            words.append(token)
+        elif token in NAME_CONNECTORS and words and i + 1 < len(tokens) and _is_name_word(tokens[i + 1]):
+            words.append(token)
+        else:
+            break
+        i += 1
+    return " ".join(words).replace(" ,", ","), i
+
+
+def extract_location(prompt: str):
+    # The place named after in/for/at/...; None when there is none or several
+    # different ones, so the prompt goes to the LLM instead of a wrong template.
+    # Capitalized prepositions only count at the start of a sentence ("In Chennai, ...").
+    tokens = TOKEN_PATTERN.findall(prompt)
+    places = []
+    sentence_start = True
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        is_preposition = token.lower() in PREPOSITIONS and (token.islower() or sentence_start)
+        sentence_start = token in ".?!;:"
+        i += 1
+        if is_preposition:
+            name, i = _read_name(tokens, i)
+            if name and name not in places:
+                places.append(name)
+    return places[0] if len(places) == 1 else None
+
+
+def keyword_scores(prompt: str):
+    # Keywords match at the start of a word ("suitab" -> suitable, "site" but not "composite")
+    text = normalize_prompt(prompt)
+    return {intent: sum(re.search(rf"\b{re.escape(keyword)}", text) is not None for keyword in template["keywords"])
+            for intent, template in TEMPLATES.items()}
+
+
+def slugify(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "_", text.split(",")[0].lower()).strip("_") or "region"
+
+
+def build_workflow(intent: str, location: str):
+    template = TEMPLATES[intent]
+    slug = slugify(location)
+    task = template["task"].format(location=location)
+    workflow = {"workflow": [
+        {"task": task, "action": action,
+         "args": {"tool": tool, "input_file": input_file.format(slug=slug), "output_file": output_file.format(slug=slug)}}
+        for action, tool, input_file, output_file in template["steps"]
+    ]}
+    reasoning = "\n".join(f"{number}. {line.format(location=location)}"
+                          for number, line in enumerate(template["reasoning"], 1))
+    text = f"{json.dumps(workflow, indent=2)}\n\nReasoning:\n{reasoning}"
+    return workflow, text
+
+
+def cache_fingerprint(model_name="") -> str:
+    h = hashlib.sha256(SYSTEM_PROMPT.encode("utf-8"))
+    h.update(os.path.basename(model_name).encode("utf-8"))
+    return h.hexdigest()[:16]
+
+
+class WorkflowPlanner:
+    def __init__(self, cache_path=CACHE_PATH, model_name="", use_embeddings=USE_EMBEDDINGS,
+                 threshold=EMBEDDING_THRESHOLD):
+        self.cache_path = cache_path
+        self.fingerprint = cache_fingerprint(model_name)
+        self.use_embeddings = use_embeddings
+        self.threshold = threshold
+        self.stats = {"template": 0, "cache": 0, "llm": 0}
+        self._examples = None
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(cache_path):
+            try:
+                with open(cache_path, encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, json.JSONDecodeError):
+                data = {}
+            if data.get("fingerprint") == self.fingerprint:
+                self.entries = data.get("entries", {})
+
+    def _example_matrix(self):
+        # Example prompts embedded once; None when the embedding model isn't available
+        if self._examples is None:
+            try:
+                from retriever import embed_texts
+                intents = [intent for intent, t in TEMPLATES.items() for _ in t["examples"]]
+                matrix = embed_texts([e for t in TEMPLATES.values() for e in t["examples"]])
+                matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+                self._examples = (intents, matrix, embed_texts)
+            except Exception as e:
+                print(f"⚠️ Planner similarity tier disabled: {e}")
+                self._examples = False
+        return self._examples or None
+
+    def classify(self, prompt: str, hint=None):
+        # (intent, how) or (None, reason)
+        scores = keyword_scores(prompt)
+        best = max(scores.values())
+        matched = [intent for intent, score in scores.items() if score == best]
+        # The app's mode (hint) only breaks ties between matching templates
+        if best > 0:
+            if len(matched) == 1:
+                return matched[0], "keywords"
+            if hint in matched:
+                return hint, "keywords+mode"
+            return None, "ambiguous keywords"
+        if self.use_embeddings:
+            examples = self._example_matrix()
+            if examples is not None:
+                intents, matrix, embed_texts = examples
+                query = embed_texts([prompt])[0]
+                similarity = matrix @ (query / max(np.linalg.norm(query), 1e-12))
+                per_intent = {}
+                for intent, value in zip(intents, similarity):
+                    per_intent[intent] = max(per_intent.get(intent, -1.0), float(value))
+                top_score = max(per_intent.values())
+                close = [intent for intent, score in per_intent.items() if top_score - score < EMBEDDING_MARGIN]
+                if top_score >= self.threshold:
+                    if len(close) == 1:
+                        return close[0], f"similarity {top_score:.2f}"
+                    if hint in close:
+                        return hint, f"similarity {top_score:.2f}+mode"
+                    return None, "ambiguous similarity"
+        return None, "no matching template"
+
+    def cached(self, prompt: str):
+        with self._lock:
+            return self.entries.get(normalize_prompt(prompt))
+
+    def remember(self, prompt: str, workflow, text: str):
+        key = normalize_prompt(prompt)
+        with self._lock:
+            self.entries[key] = {"workflow": workflow, "text": text, "created": time.time()}
+            folder = os.path.dirname(self.cache_path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"fingerprint": self.fingerprint, "entries": self.entries}, f, indent=2)
+            os.replace(tmp_path, self.cache_path)
+
+    def plan(self, prompt: str, generate=None, parse=None, hint=None):
+        # Returns (workflow, text, info), or None on a miss when no generate callable is given.
+        # generate(prompt) -> (text, stats); parse(text) -> workflow dict
+        start = time.perf_counter()
+        intent, how = self.classify(prompt, hint)
+        location = extract_location(prompt)
+        if intent is not None and location:
+            workflow, text = build_workflow(intent, location)
+            self.stats["template"] += 1
+            info = {"source": "template", "intent": intent, "match": how, "location": location}
+        else:
+            reason = how if intent is None else "no single place name found"
+            entry = self.cached(prompt)
+            if entry is not None:
+                workflow, text = entry["workflow"], entry["text"]
+                self.stats["cache"] += 1
+                info = {"source": "cache", "reason": reason}
+            elif generate is None:
+                return None
+            else:
+                text, llm_stats = generate(prompt)
+                workflow = parse(text) if parse else None
+                if workflow is not None:
+                    self.remember(prompt, workflow, text)
+                self.stats["llm"] += 1
+                info = {"source": "llm", "reason": reason, **llm_stats}
+        info["seconds"] = round(time.perf_counter() - start, 4)
+        return copy.deepcopy(workflow), text, info
+
+
+_planner = None
+
+
+def get_planner(model_name="") -> WorkflowPlanner:
+    global _planner
+    if _planner is None:
+        _planner = WorkflowPlanner(model_name=model_name)
+    return _planner
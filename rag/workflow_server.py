@@ -0,0 +1,76 @@
+# rag/workflow_server.py
+# Local HTTP daemon that keeps the workflow-generation model resident.
+# Run from the repo root:  python rag/workflow_server.py --port 8765
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from generate_workflow import get_generator, plan_workflow
+
+
+class WorkflowRequestHandler(BaseHTTPRequestHandler):
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path != "/health":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        generator = get_generator()
+        self._send_json(200, {
+            "status": "ok",
+            "load_seconds": round(generator.load_seconds, 3),
+            "requests_served": generator.requests_served,
+        })
+
+    def do_POST(self):
+        if self.path != "/generate":
+            self._send_json(404, {"error": f"Unknown path {self.path}"})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            prompt = json.loads(self.rfile.read(length) or b"{}").get("prompt", "").strip()
+        except json.JSONDecodeError:
+            prompt = ""
+        if not prompt:
+            self._send_json(400, {"error": "Request body must be JSON with a non-empty 'prompt'."})
+            return
+
+        # Template prompts are planned without touching the model. Nothing is
+        # written here: concurrent requests would overwrite each other's files,
+        # so the client saves the workflow and reasoning it gets back.
+        try:
+            workflow, text, stats = plan_workflow(prompt)
+        except ValueError as e:
+            self._send_json(422, {"error": str(e)})
+            return
+        self._send_json(200, {"workflow": workflow, "reasoning": text.strip(), "stats": stats})
+
+    def log_message(self, fmt, *args):
+        print(f"🛰️ {self.address_string()} {fmt % args}")
+
+
+def serve(host="127.0.0.1", port=8765):
+    print("⏳ Loading workflow model...")
+    generator = get_generator()
+    print(f"✅ Model loaded in {generator.load_seconds:.2f}s")
+    server = ThreadingHTTPServer((host, port), WorkflowRequestHandler)
+    print(f"🚀 Workflow server listening on http://{host}:{port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Resident workflow-generation server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    serve(args.host, args.port)
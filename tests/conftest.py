@@ -0,0 +1,5 @@
+# The rag/ modules import each other as siblings (scripts run from the repo root)
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rag"))
@@ -0,0 +1,47 @@
+import os
+
+import geopandas as gpd
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+from batch_executor import FLOW, process_region
+
+
+def write_flow(path):
+    flow = np.arange(1, 65, dtype="float32").reshape(8, 8)
+    profile = {"driver": "GTiff", "width": 8, "height": 8, "count": 1, "dtype": "float32", "nodata": -32768.0,
+               "crs": "EPSG:32643", "transform": from_origin(500000, 1000080, 10, 10)}
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(flow, 1)
+    return path
+
+
+def region(minx, miny, maxx, maxy):
+    return gpd.GeoDataFrame({"region": ["r"]}, geometry=[box(minx, miny, maxx, maxy)], crs="EPSG:32643")
+
+
+def test_region_outside_the_dem_is_skipped(tmp_path):
+    shared = {FLOW: write_flow(str(tmp_path / FLOW))}
+    folder = str(tmp_path / "far")
+    row = process_region("far", folder, region(0, 0, 10, 10), shared, ["flood"])
+    assert row["status"] == "no overlap with DEM"
+    assert not os.path.exists(folder)
+
+
+def test_region_inside_the_dem_is_classified(tmp_path):
+    shared = {FLOW: write_flow(str(tmp_path / FLOW))}
+    folder = str(tmp_path / "inside")
+    row = process_region("inside", folder, region(500000, 1000000, 500080, 1000080), shared, ["flood"])
+    assert row["status"] == "ok"
+    assert os.path.exists(os.path.join(folder, "flood_risk_levels.tif"))
+
+
+def test_other_errors_are_reported_not_skipped(tmp_path):
+    # A missing shared raster is a bug, not a region outside the DEM
+    folder = str(tmp_path / "broken")
+    row = process_region("broken", folder, region(500000, 1000000, 500080, 1000080),
+                         {FLOW: str(tmp_path / "missing.tif")}, ["flood"])
+    assert row["status"].startswith("error: ")
+    assert os.path.isdir(folder)
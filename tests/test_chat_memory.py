@@ -0,0 +1,48 @@
+import threading
+
+from chat_memory import ConversationMemory
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_eviction_folds_extractively_without_waiting_for_the_model():
+    release = threading.Event()
+
+    def slow_summarize(summary, evicted, max_tokens):
+        release.wait(5)
+        return "model summary"
+
+    memory = ConversationMemory(count_words, slow_summarize, history_tokens=8, summary_tokens=20)
+    memory.add_turn("where is Chennai", "in India")
+    memory.add_turn("and Kochi", "in Kerala")
+    # add_turn returned while the model summary is still running
+    assert "Chennai" in memory.summary
+    release.set()
+    memory.wait(5)
+    assert memory.summary == "model summary"
+    assert memory.context().startswith("Summary of earlier conversation: model summary")
+
+
+def test_clear_drops_a_pending_model_summary():
+    release = threading.Event()
+    memory = ConversationMemory(count_words, lambda *args: release.wait(5) and "stale", history_tokens=8)
+    memory.add_turn("where is Chennai", "in India")
+    memory.add_turn("and Kochi", "in Kerala")
+    memory.clear()
+    release.set()
+    memory.wait(5)
+    assert memory.summary == ""
+    assert memory.context() == ""
+
+
+def test_failed_model_summary_keeps_the_extractive_one():
+    def failing(summary, evicted, max_tokens):
+        raise RuntimeError("model busy")
+
+    memory = ConversationMemory(count_words, failing, history_tokens=8)
+    memory.add_turn("where is Chennai", "in India")
+    memory.add_turn("and Kochi", "in Kerala")
+    memory.wait(5)
+    assert memory.summary == "User: where is Chennai\nAI: in India"
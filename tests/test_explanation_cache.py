@@ -0,0 +1,81 @@
+import json
+
+import numpy as np
+import pytest
+
+from explanation_cache import CACHE_VERSION, ExplanationCache, normalize_key, similarity_text
+from workflow_planner import TEMPLATES
+from workflow_prompt import SYSTEM_PROMPT
+
+
+def make_cache(tmp_path, **kwargs):
+    db_path = tmp_path / "rag_db"
+    db_path.mkdir(parents=True, exist_ok=True)
+    return ExplanationCache(path=str(db_path / "explanation_cache.json"), db_path=str(db_path), **kwargs)
+
+
+def test_similarity_text_is_the_bare_tool_and_action():
+    assert similarity_text(normalize_key("WhiteboxTools", "Fill  depressions")) == "whiteboxtools fill depressions"
+
+
+def test_similar_entries_of_another_tool_are_not_candidates(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(normalize_key("gdal", "Clip raster"), "gdal clip", [1.0, 0.0])
+    assert cache.get_similar(normalize_key("rasterio", "Clip raster"), [1.0, 0.0]) is None
+    assert cache.get_similar(normalize_key("gdal", "Clip a raster"), [0.99, 0.05]) == "gdal clip"
+
+
+def test_older_cache_versions_are_dropped(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.put(normalize_key("gdal", "Clip raster"), "gdal clip", [1.0, 0.0])
+    cache.save()
+    assert make_cache(tmp_path).entries
+    with open(cache.path) as f:
+        data = json.load(f)
+    data["version"] = CACHE_VERSION - 1
+    with open(cache.path, "w") as f:
+        json.dump(data, f)
+    assert make_cache(tmp_path).entries == {}
+
+
+def step_actions():
+    # (tool, action) of every template step and few-shot example step
+    pairs = {(tool, action) for template in TEMPLATES.values() for action, tool, _, _ in template["steps"]}
+    decoder, text = json.JSONDecoder(), SYSTEM_PROMPT[SYSTEM_PROMPT.index("Examples:"):]
+    start = text.find('{\n  "workflow"')
+    while start != -1:
+        workflow, end = decoder.raw_decode(text, start)
+        pairs |= {(step["args"]["tool"], step["action"]) for step in workflow["workflow"]}
+        start = text.find('{\n  "workflow"', end)
+    return sorted(pairs)
+
+
+def test_different_actions_of_one_tool_do_not_collide(tmp_path):
+    sentence_transformers = pytest.importorskip("sentence_transformers")
+    try:
+        model = sentence_transformers.SentenceTransformer("sentence-transformers/all-MiniLM-L6-v2")
+    except Exception as e:  # model not downloadable here
+        pytest.skip(f"embedding model unavailable: {e}")
+    keys = [normalize_key(tool, action) for tool, action in step_actions()]
+    # Same meaning in other words; these are not asserted on
+    synonyms = {frozenset({normalize_key("rasterio", "Clip DEM to boundary"),
+                           normalize_key("rasterio", "Clip DEM using boundary")})}
+    vectors = np.asarray(model.encode([similarity_text(key) for key in keys]))
+    for i, key in enumerate(keys):
+        cache = make_cache(tmp_path / str(i))
+        cache.put(key, key, vectors[i])
+        for j, other in enumerate(keys):
+            if j == i or other.split("|")[0] != key.split("|")[0] or frozenset({key, other}) in synonyms:
+                continue
+            assert cache.get_similar(other, vectors[j]) is None, f"{other} collides with {key}"
+
+
+def test_rebuilt_index_empties_the_cache_and_notifies(tmp_path):
+    reloads = []
+    cache = make_cache(tmp_path, on_index_change=lambda: reloads.append(True))
+    key = normalize_key("gdal", "Clip raster")
+    cache.put(key, "gdal clip", [1.0, 0.0])
+    assert cache.get_exact(key) == "gdal clip" and not reloads
+    (tmp_path / "rag_db" / "index.faiss").write_bytes(b"rebuilt")
+    assert cache.get_exact(key) is None
+    assert reloads == [True]
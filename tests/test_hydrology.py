@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+
+import hydrology
+from hydrology import D8_NEIGHBOURS, FLOW_NODATA, d8_flow_accumulation, d8_pointer, fill_depressions
+
+OFFSETS = {code: (dr, dc) for dr, dc, code in D8_NEIGHBOURS}
+
+
+def random_dem(seed, shape=(24, 31)):
+    rng = np.random.default_rng(seed)
+    dem = rng.uniform(0, 50, shape)
+    # A few nodata holes and flat plateaus (ties) for the fill to resolve
+    dem[rng.random(shape) < 0.05] = np.nan
+    dem[3:7, 10:15] = 20.0
+    return dem
+
+
+def brute_force_accumulation(pointer, valid):
+    # Walk downstream from every cell, counting it in each cell it passes
+    rows, cols = pointer.shape
+    acc = np.zeros(pointer.shape)
+    for r in range(rows):
+        for c in range(cols):
+            if not valid[r, c]:
+                continue
+            y, x, steps = r, c, 0
+            while True:
+                acc[y, x] += 1
+                if pointer[y, x] == 0:
+                    break
+                dr, dc = OFFSETS[int(pointer[y, x])]
+                y, x = y + dr, x + dc
+                steps += 1
+                assert steps <= rows * cols, "pointer cycle"
+                assert 0 <= y < rows and 0 <= x < cols and valid[y, x]
+    acc[~valid] = FLOW_NODATA
+    return acc
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_accumulation_matches_walking_every_flow_path(seed):
+    dem = random_dem(seed)
+    valid = np.isfinite(dem)
+    pointer = d8_pointer(fill_depressions(dem, valid), valid, cell_size=(10.0, -10.0))
+    np.testing.assert_array_equal(d8_flow_accumulation(pointer, valid), brute_force_accumulation(pointer, valid))
+
+
+def test_filled_dem_has_no_pits():
+    dem = random_dem(7)
+    valid = np.isfinite(dem)
+    filled = fill_depressions(dem, valid)
+    assert np.all(filled[valid] >= dem[valid])
+    assert np.all(np.isnan(filled[~valid]))
+    pointer = d8_pointer(filled, valid)
+    # Only cells where water leaves the raster (edges, next to nodata) have no outflow
+    padded = np.pad(~valid, 1, constant_values=True)
+    touches_outside = np.zeros_like(valid)
+    for dr, dc, _ in D8_NEIGHBOURS:
+        touches_outside |= padded[1 + dr:1 + dr + dem.shape[0], 1 + dc:1 + dc + dem.shape[1]]
+    assert np.all(touches_outside[valid & (pointer == 0)])
+
+
+def test_fill_refuses_dems_above_the_cell_cap(monkeypatch):
+    monkeypatch.setattr(hydrology, "FILL_MAX_CELLS", 100)
+    fill_depressions(np.zeros((10, 10)))
+    with pytest.raises(ValueError, match="NUMPY_FILL_MAX_CELLS"):
+        fill_depressions(np.zeros((10, 11)))
@@ -0,0 +1,122 @@
+import json
+import os
+import time
+
+from job_queue import FINISHED, JobQueue
+
+
+def write_script(tmp_path, name, body):
+    path = tmp_path / name
+    path.write_text(body)
+    return str(path)
+
+
+def wait_for(queue, job_id, statuses, timeout=15):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = queue.status(job_id)
+        if status["status"] in statuses:
+            return status
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} still {queue.status(job_id)['status']}")
+
+
+def add_job(queue, job_id, status, finished=None):
+    os.makedirs(queue.paths(job_id)["workdir"], exist_ok=True)
+    with queue._connect() as conn:
+        conn.execute(
+            "INSERT INTO jobs (id, kind, script, status, workdir, submitted, finished) VALUES (?, 'flood', 'x.py', ?, ?, ?, ?)",
+            (job_id, status, queue.paths(job_id)["workdir"], finished or time.time(), finished),
+        )
+
+
+def test_job_runs_with_its_own_workflow_and_output_folder(tmp_path):
+    script = write_script(tmp_path, "ok.py", (
+        "import json, os\n"
+        "workflow = json.load(open(os.environ['RAG_WORKFLOW_PATH']))\n"
+        "open(os.path.join(os.environ['RAG_OUTPUT_DIR'], 'out.txt'), 'w').write(workflow['task'])\n"
+        "print('finished')\n"
+    ))
+    queue = JobQueue(jobs_dir=str(tmp_path / "jobs"), max_workers=1)
+    job_id = queue.submit("flood", script, workflow={"task": "Chennai"})
+    status = wait_for(queue, job_id, FINISHED)
+    assert status["status"] == "succeeded" and status["returncode"] == 0
+    with open(os.path.join(queue.paths(job_id)["outputs"], "out.txt")) as f:
+        assert f.read() == "Chennai"
+    assert "finished" in queue.log(job_id)
+
+
+def test_queued_job_is_cancelled_without_running(tmp_path):
+    blocker = write_script(tmp_path, "sleep.py", "import time\ntime.sleep(30)\n")
+    queue = JobQueue(jobs_dir=str(tmp_path / "jobs"), max_workers=1)
+    running = queue.submit("flood", blocker)
+    queued = queue.submit("flood", blocker)
+    wait_for(queue, running, ("running",))
+
+    queue.cancel(queued)
+    assert queue.status(queued)["status"] == "cancelled"
+    queue.cancel(running)
+    assert wait_for(queue, running, FINISHED)["status"] == "cancelled"
+    queue._pool.shutdown(wait=True)
+    assert queue.status(queued)["status"] == "cancelled"
+    assert not os.path.exists(queue.paths(queued)["log"])
+
+
+def test_jobs_of_a_previous_process_are_marked_failed(tmp_path):
+    queue = JobQueue(jobs_dir=str(tmp_path / "jobs"))
+    add_job(queue, "queued1", "queued")
+    add_job(queue, "running1", "running")
+    add_job(queue, "done1", "succeeded", finished=time.time())
+
+    restarted = JobQueue(jobs_dir=str(tmp_path / "jobs"))
+    assert restarted.status("queued1")["status"] == "failed"
+    assert restarted.status("running1")["status"] == "failed"
+    assert restarted.status("running1")["finished"] is not None
+    assert restarted.status("done1")["status"] == "succeeded"
+
+
+def test_prune_keeps_the_newest_finished_jobs(tmp_path):
+    queue = JobQueue(jobs_dir=str(tmp_path / "jobs"), retention_count=2)
+    now = time.time()
+    for i in range(4):
+        add_job(queue, f"old{i}", "succeeded", finished=now - 100 + i)
+    add_job(queue, "running1", "running")
+
+    assert sorted(queue.prune()) == ["old0", "old1"]
+    assert {job["id"] for job in queue.list_jobs()} == {"old2", "old3", "running1"}
+    assert not os.path.exists(queue.paths("old0")["workdir"])
+    assert os.path.exists(queue.paths("old3")["workdir"])
+
+
+def test_prune_drops_finished_jobs_past_the_retention_age(tmp_path):
+    queue = JobQueue(jobs_dir=str(tmp_path / "jobs"), retention_days=1)
+    add_job(queue, "stale", "failed", finished=time.time() - 2 * 86400)
+    add_job(queue, "fresh", "cancelled", finished=time.time() - 3600)
+
+    assert queue.prune() == ["stale"]
+    assert {job["id"] for job in queue.list_jobs()} == {"fresh"}
+    assert not os.path.exists(queue.paths("stale")["workdir"])
+
+
+def test_progress_tracks_steps_and_skips_a_partial_last_line(tmp_path):
+    queue = JobQueue(jobs_dir=str(tmp_path / "jobs"))
+    add_job(queue, "job1", "running")
+    events = [
+        {"status": "planned", "steps": ["Clip", "Slope", "Flow"]},
+        {"step": "Clip", "status": "started"},
+        {"step": "Clip", "status": "done", "seconds": 1.5},
+        {"step": "Slope", "status": "started"},
+        {"step": "Flow", "status": "started"},
+        {"step": "Flow", "status": "failed", "error": "boom"},
+    ]
+    with open(queue.paths("job1")["progress"], "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(event) + "\n" for event in events)
+        f.write('{"step": "Slope", "sta')
+
+    assert queue.progress("job1") == {
+        "steps": ["Clip", "Slope", "Flow"],
+        "done": {"Clip": 1.5},
+        "running": ["Slope"],
+        "failed": {"Flow": "boom"},
+    }
+    assert queue.progress("missing") == {"steps": [], "done": {}, "running": [], "failed": {}}
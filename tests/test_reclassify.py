@@ -0,0 +1,99 @@
+import numpy as np
+import pytest
+
+import reclassify
+from reclassify import LULC_CLASSES, flood_risk_classifier, site_suitability
+
+LOW, MEDIUM, HIGH = 12.0, 68.0, 500.0
+
+
+# The mask code the executors used before the lookup tables
+def old_flood_risk(flow):
+    risk = np.full_like(flow, 0, dtype=np.uint8)
+    risk[(flow > 0) & (flow <= LOW)] = 1
+    risk[(flow > LOW) & (flow <= MEDIUM)] = 2
+    risk[(flow > MEDIUM) & (flow <= HIGH)] = 3
+    risk[flow > HIGH] = 4
+    return risk
+
+
+def old_site_suitability(elevation, slope):
+    elevation_masked = np.where(elevation <= 0, np.nan, elevation)
+    suitability = np.zeros_like(elevation, dtype=np.uint8)
+    suitability[np.where((elevation_masked >= 0) & (elevation_masked < 5))] += 1
+    suitability[np.where((elevation_masked >= 5) & (elevation_masked < 20))] += 2
+    suitability[np.where((elevation_masked >= 20) & (elevation_masked < 50))] += 3
+    suitability[np.where((elevation_masked >= 50) & (elevation_masked < 100))] += 4
+    suitability[np.where(elevation_masked >= 100)] += 5
+    suitability[np.where((slope >= 0) & (slope < 5))] += 5
+    suitability[np.where((slope >= 5) & (slope < 15))] += 3
+    suitability[np.where(slope >= 15)] += 1
+    return np.clip(suitability // 2, 1, 5)
+
+
+def old_lulc(ndvi):
+    lulc = np.zeros(ndvi.shape, dtype=np.uint8)
+    lulc[ndvi < 0.0] = 1
+    lulc[(ndvi >= 0.0) & (ndvi < 0.2)] = 2
+    lulc[(ndvi >= 0.2) & (ndvi < 0.4)] = 3
+    lulc[(ndvi >= 0.4) & (ndvi < 0.6)] = 4
+    lulc[ndvi >= 0.6] = 5
+    return lulc
+
+
+def with_edge_cases(values, thresholds, shape):
+    # Random values plus every threshold, its float32 neighbours, NaN and ±inf
+    special = [np.nan, np.inf, -np.inf, -0.0]
+    for t in thresholds:
+        t = np.float32(t)
+        special += [t, np.nextafter(t, np.float32(-np.inf)), np.nextafter(t, np.float32(np.inf))]
+    values = values.astype("float32").ravel()
+    values[:len(special)] = special
+    return values.reshape(shape)
+
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Several chunks per raster, with a partial last one
+    monkeypatch.setattr(reclassify, "CHUNK_PIXELS", 97)
+
+
+def test_flood_risk_matches_the_mask_code():
+    rng = np.random.default_rng(0)
+    flow = with_edge_cases(np.floor(rng.lognormal(2.0, 2.0, 60 * 70)) * rng.choice([-1, 1], 60 * 70),
+                           [0, LOW, MEDIUM, HIGH], (60, 70))
+    np.testing.assert_array_equal(flood_risk_classifier(LOW, MEDIUM, HIGH)(flow), old_flood_risk(flow))
+
+
+def test_flood_risk_tied_thresholds_keep_the_lower_class():
+    # Thresholds from heavily tied counts can coincide (e.g. low == medium)
+    classify = flood_risk_classifier(5.0, 5.0, 68.0)
+    flow = np.array([0, 1, 5, 6, 68, 69, np.nan, np.inf, -np.inf], dtype="float32")
+    assert classify(flow).tolist() == [0, 1, 1, 3, 3, 4, 0, 4, 0]
+
+
+def test_site_suitability_matches_the_mask_code():
+    rng = np.random.default_rng(1)
+    shape = (50, 40)
+    elevation = with_edge_cases(rng.uniform(-20, 150, shape), [0, 5, 20, 50, 100], shape)
+    slope = with_edge_cases(rng.uniform(-5, 40, shape), [0, 5, 15], shape)
+    # Every elevation edge case paired with every slope edge case
+    pairs = np.meshgrid(elevation.ravel()[:19], slope.ravel()[:13])
+    elevation = np.concatenate([elevation.ravel(), pairs[0].ravel()])
+    slope = np.concatenate([slope.ravel(), pairs[1].ravel()])
+    with np.errstate(invalid="ignore"):
+        expected = old_site_suitability(elevation, slope)
+    np.testing.assert_array_equal(site_suitability(elevation, slope), expected)
+
+
+def test_lulc_matches_the_mask_code():
+    rng = np.random.default_rng(2)
+    ndvi = with_edge_cases(rng.uniform(-1, 1, (30, 30)), [0.0, 0.2, 0.4, 0.6], (30, 30))
+    np.testing.assert_array_equal(LULC_CLASSES(ndvi), old_lulc(ndvi))
+
+
+def test_output_buffer_is_reused():
+    flow = np.array([[0, 20], [100, 600]], dtype="float32")
+    out = np.empty(flow.shape, dtype=np.uint8)
+    assert flood_risk_classifier(LOW, MEDIUM, HIGH)(flow, out=out) is out
+    assert out.tolist() == [[0, 2], [3, 4]]
@@ -0,0 +1,46 @@
+import json
+
+import pytest
+
+pytest.importorskip("whitebox")
+
+from site_executor import plan_site_steps
+from workflow_planner import build_workflow
+from workflow_prompt import SYSTEM_PROMPT
+
+
+def few_shot_workflow(heading):
+    # The example workflow that follows a heading of the LLM's system prompt
+    text = SYSTEM_PROMPT[SYSTEM_PROMPT.index(heading) + len(heading):]
+    workflow, _ = json.JSONDecoder().raw_decode(text.lstrip())
+    return workflow["workflow"]
+
+
+def test_few_shot_site_workflow_skips_the_boundary_download():
+    planned = plan_site_steps(few_shot_workflow("Generate site suitability map from DEM for Chennai:"))
+    assert [(kind, input_name, output_name, slope) for _, _, kind, input_name, output_name, slope in planned] == [
+        ("clip", "input.tif", "clipped_chennai.tif", None),
+        ("slope", "clipped_chennai.tif", "chennai_slope.tif", "chennai_slope.tif"),
+        ("classify", "clipped_chennai.tif", "site_suitability.tif", "chennai_slope.tif"),
+    ]
+    # Step numbers still refer to the workflow's own steps
+    assert [number for number, *_ in planned] == [2, 3, 4]
+
+
+def test_template_site_workflow():
+    planned = plan_site_steps(build_workflow("site", "Vellore")[0]["workflow"])
+    assert [kind for _, _, kind, *_ in planned] == ["clip", "slope", "classify"]
+
+
+def test_classify_needs_a_slope_step():
+    step = {"action": "Classify elevation and slope", "args": {"tool": "rasterio", "input_file": "a.tif",
+                                                               "output_file": "b.tif"}}
+    with pytest.raises(ValueError, match="needs a slope step"):
+        plan_site_steps([step])
+
+
+def test_unknown_steps_are_rejected():
+    step = {"action": "Fill depressions", "args": {"tool": "whiteboxtools", "input_file": "a.tif",
+                                                   "output_file": "b.tif"}}
+    with pytest.raises(ValueError, match="Unsupported"):
+        plan_site_steps([step])
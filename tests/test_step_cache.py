@@ -0,0 +1,104 @@
+import os
+import sqlite3
+
+import numpy as np
+
+import step_cache
+from raster_handle import RasterHandle, StepResults
+from step_cache import StepCache
+
+PROFILE = {"width": 4, "height": 3, "count": 1, "dtype": "float32"}
+
+
+def write_input(folder, data):
+    path = os.path.join(folder, "dem.tif")
+    with open(path, "wb") as f:
+        f.write(data)
+    return path
+
+
+def run_cached(cache, folder, spec, calls, value=1.0):
+    # One "step" from dem.tif to an in-memory array and a file, kept out of outputs
+    results = StepResults(str(folder), outputs=set())
+
+    def run():
+        calls.append(spec)
+        results.put(RasterHandle("slope.tif", np.full((3, 4), value, dtype="float32"), PROFILE), dtype="float32")
+        side_file = os.path.join(folder, f"side{len(calls)}.bin")
+        with open(side_file, "wb") as f:
+            f.write(bytes(range(16)) * len(calls))
+        results.put(RasterHandle("side.bin", path=side_file))
+
+    cache.wrap(results, spec, ["dem.tif"], ["slope.tif", "side.bin"], run)()
+    return results
+
+
+def entry_sizes(cache):
+    with sqlite3.connect(cache.index_path) as conn:
+        return dict(conn.execute("SELECT key, size FROM entries").fetchall())
+
+
+def test_hit_restores_identical_array_and_file_without_running(tmp_path):
+    cache = StepCache(str(tmp_path / "cache"), max_bytes=2**30)
+    write_input(tmp_path, b"dem v1")
+    calls = []
+    first = run_cached(cache, tmp_path, {"tool": "slope"}, calls, value=2.5)
+    second = run_cached(cache, tmp_path, {"tool": "slope"}, calls, value=9.0)
+
+    assert len(calls) == 1
+    restored = second.handles["slope.tif"]
+    assert isinstance(restored.array, np.memmap)
+    np.testing.assert_array_equal(restored.array, first.handles["slope.tif"].array)
+    assert restored.profile == PROFILE
+    assert restored.write_options == {"dtype": "float32", "nodata": None}
+    with open(first.handles["side.bin"].path, "rb") as a, open(second.handles["side.bin"].path, "rb") as b:
+        assert a.read() == b.read()
+    assert second.digests == first.digests
+
+
+def test_changed_input_or_spec_arg_misses(tmp_path):
+    cache = StepCache(str(tmp_path / "cache"), max_bytes=2**30)
+    write_input(tmp_path, b"dem v1")
+    calls = []
+    first = run_cached(cache, tmp_path, {"tool": "slope", "units": "degrees"}, calls)
+    changed_spec = run_cached(cache, tmp_path, {"tool": "slope", "units": "percent"}, calls)
+    assert len(calls) == 2
+    assert changed_spec.digests["slope.tif"] != first.digests["slope.tif"]
+
+    write_input(tmp_path, b"dem version 2")
+    changed_input = run_cached(cache, tmp_path, {"tool": "slope", "units": "degrees"}, calls)
+    assert len(calls) == 3
+    assert changed_input.digests["slope.tif"] != first.digests["slope.tif"]
+
+
+def test_eviction_keeps_the_cache_under_its_cap_least_recently_used_first(tmp_path):
+    cache = StepCache(str(tmp_path / "cache"), max_bytes=2**30)
+
+    def handles():
+        return {"flow.tif": RasterHandle("flow.tif", np.zeros((100, 100)), PROFILE)}
+
+    cache.store("a" * 64, handles())
+    entry_size = entry_sizes(cache)["a" * 64]
+    cache.max_bytes = 2 * entry_size
+    cache.store("b" * 64, handles())
+    # Using "a" makes "b" the least recently used entry
+    assert cache.load("a" * 64) is not None
+    cache.store("c" * 64, handles())
+
+    sizes = entry_sizes(cache)
+    assert set(sizes) == {"a" * 64, "c" * 64}
+    assert sum(sizes.values()) <= cache.max_bytes
+    assert cache.load("b" * 64) is None
+    assert not os.path.exists(os.path.join(cache.cache_dir, "bb"))
+
+
+def test_disabled_cache_returns_the_step_unchanged(tmp_path, monkeypatch):
+    monkeypatch.setattr(step_cache, "ENABLED", False)
+    monkeypatch.setattr(step_cache, "_cache", None)
+
+    def run():
+        pass
+
+    results = StepResults(str(tmp_path), outputs=set())
+    assert step_cache.cached(results, {"tool": "slope"}, ["dem.tif"], ["slope.tif"], run) is run
+    assert step_cache._cache is None
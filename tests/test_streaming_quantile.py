@@ -0,0 +1,51 @@
+import numpy as np
+import pytest
+
+from streaming_quantile import LogQuantileSketch
+
+QUANTILES = [0.70, 0.85, 0.95]
+
+
+def integer_flow(seed, size=20000):
+    rng = np.random.default_rng(seed)
+    flow = np.floor(rng.lognormal(1.0, 1.5, size))
+    return flow[flow > 0]
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_integer_thresholds_below_100_cells_are_exact(seed):
+    flow = integer_flow(seed)
+    sketch = LogQuantileSketch()
+    for block in np.array_split(flow, 7):
+        sketch.update(block)
+    for exact, estimate in zip(np.percentile(flow, [70, 85, 95]), sketch.quantiles(QUANTILES)):
+        if exact < 100:
+            assert estimate == exact
+        else:
+            assert abs(estimate - exact) <= sketch.relative_accuracy * exact + 0.5
+
+
+def test_tied_integer_threshold_is_not_moved_off_the_value():
+    # p85 of these counts is exactly 68; an approximate 67.69 would move every 68 up a class
+    flow = np.array([1] * 50 + [5] * 20 + [68] * 20 + [500] * 10, dtype="float32")
+    sketch = LogQuantileSketch()
+    sketch.update(flow)
+    assert sketch.quantiles([0.85]) == [68.0]
+
+
+def test_fractional_values_keep_the_relative_bound():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(1.0, 2.0, 20000)
+    sketch = LogQuantileSketch()
+    sketch.update(values)
+    assert not sketch.integral
+    for exact, estimate in zip(np.percentile(values, [70, 85, 95]), sketch.quantiles(QUANTILES)):
+        assert abs(estimate - exact) <= sketch.relative_accuracy * exact
+
+
+def test_merge_keeps_integral_only_if_both_are():
+    whole, fractional = LogQuantileSketch(), LogQuantileSketch()
+    whole.update(np.array([3.0, 4.0]))
+    fractional.update(np.array([2.5]))
+    whole.merge(fractional)
+    assert not whole.integral
@@ -0,0 +1,83 @@
+import threading
+
+import pytest
+
+from workflow_engine import Step, build_graph, execute
+
+
+def record(log, name, before=None, after=None):
+    def run():
+        if before is not None:
+            before()
+        log.append(name)
+        if after is not None:
+            after()
+
+    return run
+
+
+def test_graph_links_steps_to_the_producers_of_their_inputs():
+    steps = [
+        Step("Clip", None, ["dem.tif", "boundary"], ["clipped.tif"]),
+        Step("Boundary", None, [], ["boundary"]),
+        Step("Slope", None, ["clipped.tif"], ["slope.tif"]),
+    ]
+    assert build_graph(steps) == {"Clip": {"Boundary"}, "Boundary": set(), "Slope": {"Clip"}}
+
+
+def test_cycle_is_rejected_before_anything_runs():
+    log = []
+    steps = [
+        Step("A", record(log, "A"), ["b.tif"], ["a.tif"]),
+        Step("B", record(log, "B"), ["a.tif"], ["b.tif"]),
+        Step("C", record(log, "C"), [], ["c.tif"]),
+    ]
+    with pytest.raises(ValueError, match="dependency cycle"):
+        execute(steps)
+    assert log == []
+
+
+def test_output_with_two_producers_is_rejected():
+    steps = [Step("A", None, [], ["x.tif"]), Step("B", None, [], ["x.tif"])]
+    with pytest.raises(ValueError, match="produced by both"):
+        build_graph(steps)
+
+
+def test_steps_run_after_the_steps_they_depend_on():
+    log = []
+    steps = [
+        Step("Classify", record(log, "Classify"), ["slope.tif", "clipped.tif"], ["suitability.tif"]),
+        Step("Slope", record(log, "Slope"), ["clipped.tif"], ["slope.tif"]),
+        Step("Clip", record(log, "Clip"), ["dem.tif"], ["clipped.tif"]),
+        Step("Render", record(log, "Render"), ["suitability.tif"], ["map.png"]),
+    ]
+    timings = execute(steps, workers=4)
+    assert log == ["Clip", "Slope", "Classify", "Render"]
+    assert [t["step"] for t in timings] == log
+    for earlier, later in zip(timings, timings[1:]):
+        assert earlier["end"] <= later["start"]
+
+
+def test_failure_lets_running_steps_finish_and_starts_nothing_new():
+    log = []
+    slow_started = threading.Event()
+    failed = threading.Event()
+
+    def fail():
+        slow_started.wait(5)
+        failed.set()
+        raise RuntimeError("slope failed")
+
+    def second_failure():
+        raise RuntimeError("later failure")
+
+    steps = [
+        # Still running when "Slope" fails; finishes only after the failure
+        Step("Flow", record(log, "Flow", before=lambda: (slow_started.set(), failed.wait(5))), ["dem.tif"], ["flow.tif"]),
+        Step("Slope", fail, ["dem.tif"], ["slope.tif"]),
+        Step("Classify", record(log, "Classify"), ["flow.tif"], ["risk.tif"]),
+        Step("Late", second_failure, ["flow.tif"], ["late.tif"]),
+    ]
+    with pytest.raises(RuntimeError, match="slope failed"):
+        execute(steps, workers=2)
+    assert log == ["Flow"]
@@ -0,0 +1,102 @@
+import json
+import pytest
+from workflow_planner import TEMPLATES, WorkflowPlanner, extract_location
+
+EXAMPLE_PLACES = {
+    "Find flood-prone zones in Chennai": "Chennai",
+    "Which areas of Mumbai are at risk of flooding?": "Mumbai",
+    "Map inundation hazard from the DEM for Patna": "Patna",
+    "Show low-lying areas where water collects during heavy rain in Kochi": "Kochi",
+    "Find suitable sites for building in Vellore": "Vellore",
+    "Where can we construct new housing in Madurai?": "Madurai",
+    "Site suitability map from DEM for Chennai": "Chennai",
+    "Identify flat, elevated land for development around Salem": "Salem",
+    "Classify land cover from Sentinel 2 for Coimbatore": "Coimbatore",
+    "Map land use and land cover around Bengaluru": "Bengaluru",
+    "Compute NDVI and classify vegetation for Trichy": "Trichy",
+    "Show forest, water and built-up areas from satellite bands in Erode": "Erode",
+}
+
+
+@pytest.fixture
+def planner(tmp_path):
+    return WorkflowPlanner(cache_path=str(tmp_path / "llm_cache.json"), use_embeddings=False)
+
+
+def parse(text):
+    return json.loads(text.split("\n")[0])
+
+
+def fake_llm(calls):
+    def generate(prompt):
+        calls.append(prompt)
+        return '{"workflow": []}\nReasoning: stub', {"total_seconds": 1.0}
+    return generate
+
+
+def test_example_places_cover_all_templates():
+    examples = {example for template in TEMPLATES.values() for example in template["examples"]}
+    assert examples == set(EXAMPLE_PLACES)
+
+
+@pytest.mark.parametrize("prompt, place", EXAMPLE_PLACES.items())
+def test_extract_location_from_examples(prompt, place):
+    assert extract_location(prompt) == place
+
+
+@pytest.mark.parametrize("prompt, place", [
+    ("Find flood prone zones in Chennai and show the results", "Chennai"),
+    ("Assess flood risk at the Port of Spain", "Port of Spain"),
+    ("Which parts of Delhi flood In Monsoon season?", "Delhi"),
+    ("In Chennai, find flood-prone zones", "Chennai"),
+    ("Map flood risk in Vellore, India.", "Vellore, India"),
+    ("Find flood-prone zones in Chennai using DEM", "Chennai"),
+    ("Flood map for Newcastle upon Tyne", "Newcastle upon Tyne"),
+])
+def test_extract_location_stops_at_the_name(prompt, place):
+    assert extract_location(prompt) == place
+
+
+@pytest.mark.parametrize("prompt", [
+    "Find flood-prone zones",
+    "Find flood-prone zones for the uploaded DEM",
+    "Find floods in Chennai for Monsoon",
+])
+def test_extract_location_uncertain(prompt):
+    assert extract_location(prompt) is None
+
+
+@pytest.mark.parametrize("intent, prompt", [(i, e) for i, t in TEMPLATES.items() for e in t["examples"]])
+def test_examples_plan_from_their_template(planner, intent, prompt):
+    workflow, text, info = planner.plan(prompt)
+    assert info["source"] == "template"
+    assert info["intent"] == intent
+    assert info["location"] == EXAMPLE_PLACES[prompt]
+    assert workflow["workflow"][0]["task"].endswith(f" for {EXAMPLE_PLACES[prompt]}")
+    assert json.loads(text.split("\n\nReasoning:")[0]) == workflow
+
+
+@pytest.mark.parametrize("prompt", [
+    "Compute watershed boundaries and stream order for Chennai",
+    "Estimate groundwater recharge potential in Madurai",
+])
+def test_mode_hint_does_not_pick_a_template(planner, prompt):
+    calls = []
+    assert planner.plan(prompt, hint="flood") is None
+    workflow, _, info = planner.plan(prompt, generate=fake_llm(calls), parse=parse, hint="flood")
+    assert info["source"] == "llm" and calls == [prompt]
+
+
+def test_mode_hint_breaks_keyword_ties(planner):
+    prompt = "Flood and construction map for Chennai"
+    assert planner.classify(prompt) == (None, "ambiguous keywords")
+    assert planner.classify(prompt, hint="site") == ("site", "keywords+mode")
+
+
+def test_llm_workflows_are_cached_by_normalized_prompt(planner, tmp_path):
+    calls = []
+    planner.plan("Compute terrain ruggedness for Ooty", generate=fake_llm(calls), parse=parse)
+    reloaded = WorkflowPlanner(cache_path=str(tmp_path / "llm_cache.json"), use_embeddings=False)
+    _, _, info = reloaded.plan("compute  terrain ruggedness for ooty!")
+    assert info["source"] == "cache"
+    assert len(calls) == 1